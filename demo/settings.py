@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'petclinic.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,10 +87,66 @@ DATABASES = {
         'NAME': 'postgres',
         'USER': 'postgres',
         'HOST': 'db',
-        'PORT': 5432
+        'PORT': 5432,
+        # keep each thread's connection open between requests
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# Set PETCLINIC_DB_POOL to share a bounded pool of connections between the
+# threads of each process instead. Connections go back to the pool at the
+# end of every request, are health checked when they have been idle and
+# are recycled after MAX_IDLE / MAX_LIFETIME seconds.
+if os.environ.get('PETCLINIC_DB_POOL'):
+    DATABASES['default'].update({
+        'ENGINE': 'petclinic.pooled_postgresql',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MIN_SIZE': 2,
+            'MAX_SIZE': 20,
+            'TIMEOUT': 10,
+            'MAX_IDLE': 300,
+            'MAX_LIFETIME': 3600,
+            'HEALTH_CHECK_AFTER': 30,
+        },
+    })
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# locmem is per process; use a shared backend (file, memcached, redis) when
+# running several workers so signal driven invalidation reaches all of them.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'petclinic',
+    }
+}
+
+# Seconds cached reference lists (specialties, pet types) are kept
+PETCLINIC_REFERENCE_CACHE_TIMEOUT = 3600
+
+
+# Threads running ORM queries for the async views in each process
+PETCLINIC_ASYNC_WORKERS = 8
+
+# Deletes are remembered this long for ?modified_since= sync; older sync
+# requests get 410 Gone and must download the full list again
+PETCLINIC_TOMBSTONE_RETENTION_DAYS = 30
+
+# Seconds synced_at is set back to cover transactions committing late
+PETCLINIC_SYNC_OVERLAP = 5
+
+# Per request timings are sent in a Server-Timing header and aggregated
+# for /metrics. Set PETCLINIC_METRICS_DIR to a directory of this server's
+# own to merge the metrics of its worker processes: each writes a file
+# there at most every PETCLINIC_METRICS_FLUSH_INTERVAL seconds. Unset, every
+# process reports only its own requests.
+PETCLINIC_SERVER_TIMING = True
+PETCLINIC_METRICS_DIR = os.environ.get('PETCLINIC_METRICS_DIR')
+PETCLINIC_METRICS_FLUSH_INTERVAL = 1.0
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -134,10 +191,17 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'petclinic.authentication.CachingJWTAuthentication',
     ),
 }
 
+# Maximum number of validated access tokens cached per process; the least
+# recently used token is dropped first
+PETCLINIC_JWT_CACHE_SIZE = 10000
+
+# Seconds a validated access token stays cached, never past its exp claim
+PETCLINIC_JWT_CACHE_TIMEOUT = 60
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -17,9 +17,12 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from petclinic.views import Metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('petclinic/', include('petclinic.urls')),
     path('api/token/',TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('metrics', Metrics.as_view(), name='metrics'),
 ]
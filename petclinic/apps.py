@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class PetclinicConfig(AppConfig):
     name = 'petclinic'
+
+    def ready(self):
+        from petclinic.signals import connect_signals
+        connect_signals()
@@ -0,0 +1,156 @@
+"""
+Async read endpoints for owners, pets and visits
+
+Django 3.1 has no async ORM, so each view awaits its queries and JSON
+rendering in a small thread pool (PETCLINIC_ASYNC_WORKERS threads). Slow
+clients only hold a coroutine on the event loop while the number of
+threads, and with them database connections, stays bounded. Cached JWTs
+are checked on the event loop without a thread hop.
+
+The responses match the GET responses of the synchronous views without
+their query string extras (sparse fieldsets, pagination, streaming and
+conditional GET).
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+
+from petclinic.authentication import CachingJWTAuthentication
+from petclinic.fast_serializers import (FastOwnerSerializer, FastPetSerializer,
+                                        FastVisitSerializer)
+from petclinic.models import Owner, Pet, Visit
+
+_executor = None
+
+
+def async_workers():
+    return getattr(settings, 'PETCLINIC_ASYNC_WORKERS', 8)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=async_workers(), thread_name_prefix='petclinic-async')
+    return _executor
+
+
+def call_with_connection(function, *args):
+    """
+    Run function in a worker thread, honouring CONN_MAX_AGE for the
+    thread's connection the way request_started/finished do for views
+    """
+    close_old_connections()
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
+
+async def run_sync(function, *args):
+    """
+    Await function in the worker pool, in a copy of the caller's context
+    so request instrumentation sees its queries
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), partial(context.run, call_with_connection, function, *args))
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+def error_response(exc, authenticator, request):
+    detail = exc.detail if isinstance(exc.detail, (list, dict)) else { 'detail': exc.detail }
+    response = json_response(detail, exc.status_code)
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+        response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+    return response
+
+
+def authenticated(view):
+    """
+    Require a valid JWT, checking the token cache before using a thread
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        authenticator = CachingJWTAuthentication()
+        try:
+            if request.method != 'GET':
+                raise exceptions.MethodNotAllowed(request.method)
+            result = authenticator.authenticate_from_cache(request)
+            if result is None:
+                result = await run_sync(authenticator.authenticate, request)
+            if result is None:
+                raise exceptions.NotAuthenticated()
+            request.user, request.auth = result
+            return await view(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return error_response(exc, authenticator, request)
+    return wrapper
+
+
+def render_list(serializer_class, queryset):
+    rows = serializer_class.values(queryset)
+    return JSONRenderer().render(serializer_class(rows, many=True).data)
+
+
+def render_detail(serializer_class, queryset):
+    row = serializer_class.values(queryset).first()
+    if row is None:
+        return None
+    return JSONRenderer().render(serializer_class(row).data)
+
+
+async def list_response(serializer_class, queryset):
+    content = await run_sync(render_list, serializer_class, queryset)
+    return HttpResponse(content, content_type='application/json')
+
+
+async def detail_response(serializer_class, queryset):
+    content = await run_sync(render_detail, serializer_class, queryset)
+    if content is None:
+        return json_response({ 'detail': exceptions.NotFound.default_detail }, status.HTTP_404_NOT_FOUND)
+    return HttpResponse(content, content_type='application/json')
+
+
+@authenticated
+async def owner_list(request):
+    owners = Owner.objects.all()
+    state = request.GET.get('state', None)
+    if state is not None:
+        owners = owners.filter(state=state)
+    return await list_response(FastOwnerSerializer, owners)
+
+
+@authenticated
+async def owner_detail(request, pk):
+    return await detail_response(FastOwnerSerializer, Owner.objects.filter(pk=pk))
+
+
+@authenticated
+async def owner_pet_list(request, owner_pk):
+    return await list_response(FastPetSerializer, Pet.objects.filter(owner=owner_pk))
+
+
+@authenticated
+async def pet_detail(request, pk):
+    return await detail_response(FastPetSerializer, Pet.objects.filter(pk=pk))
+
+
+@authenticated
+async def pet_visit_list(request, pet_pk):
+    visits = Visit.objects.filter(pet=pet_pk).order_by('visit_date', 'id')
+    return await list_response(FastVisitSerializer, visits)
+
+
+@authenticated
+async def visit_detail(request, pk):
+    return await detail_response(FastVisitSerializer, Visit.objects.filter(pk=pk))
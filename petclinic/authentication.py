@@ -0,0 +1,127 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+def token_cache_size():
+    return getattr(settings, 'PETCLINIC_JWT_CACHE_SIZE', 10000)
+
+
+def token_cache_timeout():
+    return getattr(settings, 'PETCLINIC_JWT_CACHE_TIMEOUT', 60)
+
+
+class TokenCache(object):
+    """
+    Thread safe LRU of raw token -> (validated token, user, expires at)
+
+    Entries are indexed by user id so saving a user drops every token
+    resolved to it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.tokens_by_user = {}
+
+    def get(self, raw_token, now):
+        with self.lock:
+            entry = self.entries.get(raw_token)
+            if entry is None:
+                return None
+            if entry[2] <= now:
+                self.remove(raw_token)
+                return None
+            self.entries.move_to_end(raw_token)
+            return entry
+
+    def set(self, raw_token, validated_token, user, expires_at):
+        with self.lock:
+            if raw_token in self.entries:
+                self.remove(raw_token)
+            self.entries[raw_token] = (validated_token, user, expires_at)
+            self.tokens_by_user.setdefault(user.pk, set()).add(raw_token)
+            while len(self.entries) > token_cache_size():
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, raw_token):
+        """
+        Drop one entry; call with the lock held
+        """
+        validated_token, user, expires_at = self.entries.pop(raw_token)
+        tokens = self.tokens_by_user.get(user.pk)
+        tokens.discard(raw_token)
+        if not tokens:
+            del self.tokens_by_user[user.pk]
+
+    def invalidate_user(self, user_pk):
+        with self.lock:
+            for raw_token in list(self.tokens_by_user.get(user_pk, ())):
+                self.remove(raw_token)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tokens_by_user.clear()
+
+
+token_cache = TokenCache()
+
+
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """
+    Signal receiver dropping cached tokens of a saved or deleted user
+    """
+    token_cache.invalidate_user(instance.pk)
+
+
+class CachingJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that remembers recently validated tokens
+
+    A cached token skips signature verification and the user query until
+    its exp claim or PETCLINIC_JWT_CACHE_TIMEOUT seconds pass, whichever is
+    first. The cache is per process: saving or deleting a user drops its
+    tokens in the process that made the change, other processes notice
+    within the timeout. Each request gets its own copy of the cached user.
+    """
+
+    def get_request_token(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        return self.get_raw_token(header)
+
+    def authenticate_from_cache(self, request):
+        """
+        Return (user, validated token) if the request's token is cached,
+        otherwise None; never touches the database
+        """
+        raw_token = self.get_request_token(request)
+        if raw_token is None:
+            return None
+        entry = token_cache.get(raw_token, time.time())
+        if entry is None:
+            return None
+        validated_token, user, expires_at = entry
+        return copy.copy(user), validated_token
+
+    def authenticate(self, request):
+        cached = self.authenticate_from_cache(request)
+        if cached is not None:
+            return cached
+
+        raw_token = self.get_request_token(request)
+        if raw_token is None:
+            return None
+
+        now = time.time()
+        validated_token = self.get_validated_token(raw_token)
+        user = self.get_user(validated_token)
+        expires_at = min(validated_token.get('exp', now), now + token_cache_timeout())
+        token_cache.set(raw_token, validated_token, user, expires_at)
+        return copy.copy(user), validated_token
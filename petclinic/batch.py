@@ -0,0 +1,156 @@
+"""
+Batch updates for list views
+
+PATCH on a list view takes [{ "id": 1, ...changes }, ...] and updates
+every row in one request: the rows are loaded with one query, each item
+is validated against its row like a partial PUT, and the valid ones are
+written with bulk_update in a single transaction. Statistics, counters
+and sync tombstones are adjusted set-based afterwards, since
+bulk_update sends no signals.
+"""
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from petclinic import counters, stats, sync
+
+
+def item_error(item_id, errors, status_code=status.HTTP_400_BAD_REQUEST):
+    return { 'id': item_id, 'status': status_code, 'errors': errors }
+
+
+class BatchUpdateMixin(object):
+    """
+    PATCH handler for APIView list views
+
+    The view's queryset (with its prefetches) loads the rows and its
+    serializer_class validates and renders them. batch_related maps
+    foreign key fields to their models; the referenced rows are loaded in
+    one query per model and passed in context['related_objects'], and the
+    new values of unique fields likewise in context['unique_values'], so
+    the number of queries does not grow with the number of items.
+
+    The response lists one result per item, in order: status 200 with
+    the updated representation, 404 for unknown ids or 400 with the
+    validation errors. Valid items are applied even if others fail, and
+    the response is then 207 Multi-Status.
+    """
+    batch_related = {}
+    batch_size = 500
+    max_batch_size = 1000
+
+    def get_batch_queryset(self):
+        return self.queryset.all()
+
+    def patch(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            data = { 'message': 'Expected a list of objects with an id and the fields to change' }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_batch_size:
+            data = { 'message': 'At most %d items can be updated at once' % self.max_batch_size }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        results = [None] * len(items)
+        ids = {}
+        for index, item in enumerate(items):
+            item_id = item.get('id') if isinstance(item, dict) else None
+            if not isinstance(item, dict):
+                results[index] = item_error(None, { 'non_field_errors': ['Expected an object'] })
+            elif isinstance(item_id, bool) or not isinstance(item_id, int):
+                results[index] = item_error(item_id, { 'id': ['A valid integer is required.'] })
+            elif item_id in ids:
+                results[index] = item_error(item_id, { 'id': ['Duplicate id in this batch.'] })
+            else:
+                ids[item_id] = index
+        try:
+            with transaction.atomic():
+                valid = self.update_batch(items, ids, results)
+        except IntegrityError as exc:
+            # e.g. two items giving rows the same unique value
+            data = { 'message': 'The changes conflict and none were applied: %s' % exc }
+            return Response(data, status=status.HTTP_409_CONFLICT)
+        for index, serializer in valid:
+            results[index] = { 'id': serializer.instance.pk, 'status': status.HTTP_200_OK, 'data': serializer.data }
+        data = { 'updated': len(valid), 'results': results }
+        if len(valid) < len(items):
+            return Response(data, status=status.HTTP_207_MULTI_STATUS)
+        return Response(data)
+
+    def update_batch(self, items, ids, results):
+        """
+        Validate the items whose ids are in ids ({ id: index }) against
+        their rows and apply the valid ones, returning [(index, serializer)]
+        """
+        instances = self.get_batch_queryset().select_for_update().in_bulk(list(ids))
+        context = { 'request': self.request, 'related_objects': self.get_related_objects(items),
+                    'unique_values': self.get_unique_values(items) }
+        valid = []
+        for item_id, index in ids.items():
+            instance = instances.get(item_id)
+            if instance is None:
+                results[index] = item_error(item_id, { 'id': ['Not found.'] }, status.HTTP_404_NOT_FOUND)
+                continue
+            serializer = self.serializer_class(instance, data=items[index], partial=True, context=context)
+            if serializer.is_valid():
+                valid.append((index, serializer))
+            else:
+                results[index] = item_error(item_id, serializer.errors)
+        self.bulk_apply([serializer for index, serializer in valid])
+        return valid
+
+    def get_related_objects(self, items):
+        related_objects = {}
+        for name, model in self.batch_related.items():
+            pks = set()
+            for item in items:
+                try:
+                    pks.add(int(item[name]))
+                except (KeyError, TypeError, ValueError):
+                    pass
+            related_objects[model] = model._default_manager.in_bulk(list(pks))
+        return related_objects
+
+    def get_unique_values(self, items):
+        """
+        Look up the new values of the model's unique fields, one query per
+        field, as { name: { value: pk of the row holding it or None } }
+        """
+        model = self.queryset.model
+        unique_values = {}
+        for field in model._meta.concrete_fields:
+            if not field.unique or field.primary_key:
+                continue
+            values = set(item[field.name] for item in items
+                         if isinstance(item, dict) and isinstance(item.get(field.name), str))
+            if values:
+                known = dict.fromkeys(values)
+                known.update(model._default_manager.filter(**{ field.name + '__in': values })
+                             .values_list(field.name, 'pk'))
+                unique_values[field.name] = known
+        return unique_values
+
+    def bulk_apply(self, serializers):
+        """
+        Write the validated changes with one bulk_update and account for
+        them like the save receivers would
+        """
+        if not serializers:
+            return
+        model = self.queryset.model
+        fields = set()
+        changes = []
+        for serializer in serializers:
+            instance = serializer.instance
+            old = stats.tracked_values(instance)
+            for name, value in serializer.validated_data.items():
+                setattr(instance, name, value)
+                fields.add(name)
+            if old != stats.tracked_values(instance):
+                changes.append((instance, old))
+        instances = [serializer.instance for serializer in serializers]
+        model.objects.bulk_update(instances, sorted(fields), batch_size=self.batch_size)
+        if changes:
+            stats.record_updated(model, changes)
+            counters.record_updated(model, changes)
+            if model in sync.PARENT_FIELDS:
+                sync.record_moves(model, changes)
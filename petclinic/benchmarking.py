@@ -0,0 +1,42 @@
+import math
+
+
+def percentile(sorted_values, pct):
+    """
+    Return the nearest-rank percentile of already sorted values
+    """
+    if not sorted_values:
+        return None
+    rank = max(int(math.ceil(pct / 100.0 * len(sorted_values))), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, elapsed, errors=0, timeouts=0):
+    """
+    Return throughput and latency percentiles (in milliseconds) for a run
+
+    errors counts the failed requests, including the timeouts, which have
+    no latency. rps counts successful responses only, so a failing server
+    does not look like it kept up.
+    """
+    latencies = sorted(latencies)
+    requests = len(latencies) + timeouts
+    summary = {
+        'requests': requests,
+        'errors': errors,
+        'timeouts': timeouts,
+        'error_rate': errors / requests if requests else 0.0,
+        'rps': (requests - errors) / elapsed if elapsed else 0.0,
+    }
+    for name, pct in (('p50', 50), ('p90', 90), ('p95', 95), ('p99', 99), ('max', 100)):
+        value = percentile(latencies, pct)
+        summary[name] = None if value is None else value * 1000.0
+    return summary
+
+
+def format_summary(label, summary):
+    def ms(value):
+        return '-' if value is None else '%.1f' % value
+    return '%-20s %8d req %6d err %9.1f ok/s  p50 %8s ms  p90 %8s ms  p99 %8s ms  max %8s ms' % (
+        label, summary['requests'], summary['errors'], summary['rps'], ms(summary['p50']),
+        ms(summary['p90']), ms(summary['p99']), ms(summary['max']))
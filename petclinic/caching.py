@@ -0,0 +1,61 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+def reference_cache_timeout():
+    return getattr(settings, 'PETCLINIC_REFERENCE_CACHE_TIMEOUT', 3600)
+
+
+def list_cache_key(model):
+    return 'petclinic:list:%s' % model._meta.label_lower
+
+
+def etag_matches(request, etag):
+    """
+    Return True if the request's If-None-Match header matches etag
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags
+
+
+def invalidate_list_cache(sender, **kwargs):
+    """
+    Signal receiver dropping the cached list for the sending model
+
+    The entry is dropped once the saving transaction commits, so a request
+    in between cannot cache the list as it was before the write again.
+    """
+    transaction.on_commit(lambda: cache.delete(list_cache_key(sender)))
+
+
+class CachedListMixin(object):
+    """
+    Serve a list from the Django cache with a strong ETag
+
+    Entries are dropped by invalidate_list_cache() when a row is saved or
+    deleted and otherwise expire after PETCLINIC_REFERENCE_CACHE_TIMEOUT
+    seconds, which bounds staleness after writes that skip signals.
+    """
+
+    def cached_list_response(self, request, model, build_data):
+        key = list_cache_key(model)
+        entry = cache.get(key)
+        if entry is None:
+            data = list(build_data())
+            etag = quote_etag(hashlib.sha1(JSONRenderer().render(data)).hexdigest())
+            entry = (etag, data)
+            cache.set(key, entry, reference_cache_timeout())
+        etag, data = entry
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={ 'ETag': etag })
+        return Response(data, headers={ 'ETag': etag })
@@ -0,0 +1,61 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin(object):
+    """
+    Compute ETag / Last-Modified for a detail view from date_modified
+
+    The validators come from one .values() query on the view's model that
+    never loads or serializes the object. Views rendering nested rows list
+    the relations in related_validators; their latest date_modified and
+    row counts are folded in so adding, changing or removing a nested row
+    changes the validators too.
+    """
+    related_validators = ()
+
+    def get_validators(self, request, pk):
+        """
+        Return (etag, last_modified timestamp) or None if pk does not exist
+        """
+        aggregates = {}
+        for i, relation in enumerate(self.related_validators):
+            aggregates['modified_%d' % i] = Max(relation + '__date_modified')
+            aggregates['count_%d' % i] = Count(relation, distinct=True)
+        rows = self.queryset.model._default_manager.filter(pk=pk).values('id', 'date_modified')
+        if aggregates:
+            rows = rows.annotate(**aggregates)
+        row = rows.first()
+        if row is None:
+            return None
+        last_modified = max(value for key, value in row.items()
+                            if key == 'date_modified' or (key.startswith('modified_') and value is not None))
+        # the representation also depends on the query string (?fields=) and negotiated format
+        key = '%r|%s|%s' % (sorted(row.items()), request.get_full_path(),
+                            getattr(request, 'accepted_media_type', ''))
+        return quote_etag(hashlib.sha1(key.encode('utf-8')).hexdigest()), int(last_modified.timestamp())
+
+
+def conditional_get(method):
+    """
+    Decorate a detail view's get() to answer If-None-Match and
+    If-Modified-Since with 304 before the object is fetched and serialized
+    """
+    @wraps(method)
+    def get(self, request, pk, *args, **kwargs):
+        validators = self.get_validators(request, pk)
+        if validators is None:
+            return method(self, request, pk, *args, **kwargs)
+        etag, last_modified = validators
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = method(self, request, pk, *args, **kwargs)
+        if 200 <= response.status_code < 300 or response.status_code == 304:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+    return get
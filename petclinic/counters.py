@@ -0,0 +1,204 @@
+"""
+Denormalized counters on owners and pets
+
+Owner.pet_count, Pet.visit_count and Pet.last_visit_date let summary
+lists show "3 pets, last visit 2 weeks ago" without joining the pet and
+visit tables. Signal receivers adjust them in the transaction that saves
+or deletes the pet or visit, with relative UPDATEs so concurrent changes
+add up, and record_created(), record_updated() and record_deleting()
+cover bulk writes. The timestamped manager touches the adjusted row's
+date_modified too, since its representation changed. recount()
+recomputes them from scratch.
+"""
+import threading
+from collections import Counter
+
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from petclinic.models import Owner, Pet, Visit
+from petclinic.stats import skip_create
+
+_local = threading.local()
+
+
+def deleting(model):
+    """
+    Primary keys of model rows whose delete is in progress in this thread
+
+    Their cascaded children are deleted too, so there is nothing to count.
+    """
+    if not hasattr(_local, 'deleting'):
+        _local.deleting = { Owner: set(), Pet: set() }
+    return _local.deleting[model]
+
+
+def by_pk(values, default, output_field):
+    """
+    CASE choosing values[pk] for each row, for one UPDATE of many rows
+    """
+    return Case(*[When(pk=pk, then=Value(value, output_field=output_field)) for pk, value in values.items()],
+                default=default, output_field=output_field)
+
+
+def visit_count():
+    return Coalesce(Subquery(Visit.objects.filter(pet=OuterRef('pk')).order_by().values('pet')
+                             .annotate(visits=Count('pk')).values('visits'), output_field=models.IntegerField()), 0)
+
+
+def last_visit_date():
+    return Subquery(Visit.objects.filter(pet=OuterRef('pk')).order_by('-visit_date').values('visit_date')[:1],
+                    output_field=models.DateTimeField())
+
+
+def pet_count():
+    return Coalesce(Subquery(Pet.objects.filter(owner=OuterRef('pk')).order_by().values('owner')
+                             .annotate(pets=Count('pk')).values('pets'), output_field=models.IntegerField()), 0)
+
+
+def add_pets(deltas):
+    """
+    Apply {owner_id: delta} to the owners' pet counts
+    """
+    deltas = dict((owner_id, delta) for owner_id, delta in deltas.items()
+                  if delta and owner_id not in deleting(Owner))
+    if deltas:
+        Owner.objects.filter(pk__in=deltas).update(
+            pet_count=F('pet_count') + by_pk(deltas, 0, models.IntegerField()))
+
+
+def add_visits(visits):
+    """
+    Count new visits, given as (pet_id, visit_date) pairs
+    """
+    added = Counter()
+    latest = {}
+    for pet_id, visit_date in visits:
+        added[pet_id] += 1
+        latest[pet_id] = max(visit_date, latest.get(pet_id, visit_date))
+    if not added:
+        return
+    Pet.objects.filter(pk__in=added).update(
+        visit_count=F('visit_count') + by_pk(added, 0, models.IntegerField()),
+        last_visit_date=Case(*[When(Q(pk=pk) & (Q(last_visit_date__isnull=True) | Q(last_visit_date__lt=date)),
+                                    then=Value(date, output_field=models.DateTimeField()))
+                               for pk, date in latest.items()],
+                             default=F('last_visit_date'), output_field=models.DateTimeField()))
+
+
+def remove_visits(removed):
+    """
+    Apply {pet_id: visits removed}; the last visit may be among them, so
+    it is looked up again
+    """
+    removed = dict((pet_id, count) for pet_id, count in removed.items() if pet_id not in deleting(Pet))
+    if removed:
+        Pet.objects.filter(pk__in=removed).update(
+            visit_count=F('visit_count') - by_pk(removed, 0, models.IntegerField()),
+            last_visit_date=last_visit_date())
+
+
+def record_created(model, instances):
+    """
+    Count rows inserted with bulk_create, which sends no signals
+    """
+    if model is Visit:
+        add_visits((visit.pet_id, visit.visit_date) for visit in instances)
+    elif model is Pet:
+        add_pets(Counter(pet.owner_id for pet in instances))
+
+
+def record_updated(model, changes):
+    """
+    Adjust the counters for rows changed with bulk_update; changes are
+    (instance, old) pairs as for stats.record_updated()
+    """
+    if model is Visit:
+        moved = [(visit, old) for visit, old in changes if old['pet_id'] != visit.pet_id]
+        remove_visits(Counter(old['pet_id'] for visit, old in moved))
+        add_visits((visit.pet_id, visit.visit_date) for visit, old in moved)
+        redated = set(visit.pet_id for visit, old in changes
+                      if old['pet_id'] == visit.pet_id and old['visit_date'] != visit.visit_date)
+        if redated:
+            Pet.objects.filter(pk__in=redated).update(last_visit_date=last_visit_date())
+    elif model is Pet:
+        moved = Counter()
+        for pet, old in changes:
+            if old['owner_id'] != pet.owner_id:
+                moved[old['owner_id']] -= 1
+                moved[pet.owner_id] += 1
+        add_pets(moved)
+
+
+def record_deleting(model, ids):
+    """
+    Adjust the counters for owners or pets about to be deleted by set
+    based DELETEs; an owner's counter goes with it
+    """
+    if model is Pet:
+        removed = Counter(Pet.objects.filter(pk__in=ids).values_list('owner_id', flat=True))
+        add_pets(dict((owner_id, -count) for owner_id, count in removed.items()))
+
+
+def visit_saved(sender, instance, created, raw=False, **kwargs):
+    if skip_create(created, raw):
+        return
+    old = getattr(instance, '_stats_old', None)
+    if created or old is None:
+        add_visits([(instance.pet_id, instance.visit_date)])
+    elif old['pet_id'] != instance.pet_id:
+        remove_visits({ old['pet_id']: 1 })
+        add_visits([(instance.pet_id, instance.visit_date)])
+    elif old['visit_date'] != instance.visit_date:
+        Pet.objects.filter(pk=instance.pet_id).update(last_visit_date=last_visit_date())
+
+
+def visit_deleted(sender, instance, **kwargs):
+    remove_visits({ instance.pet_id: 1 })
+
+
+def pet_saved(sender, instance, created, raw=False, **kwargs):
+    if skip_create(created, raw):
+        return
+    old = getattr(instance, '_stats_old', None)
+    if created or old is None:
+        add_pets({ instance.owner_id: 1 })
+    elif old['owner_id'] != instance.owner_id:
+        add_pets({ old['owner_id']: -1, instance.owner_id: 1 })
+
+
+def pet_deleted(sender, instance, **kwargs):
+    deleting(Pet).discard(instance.pk)
+    add_pets({ instance.owner_id: -1 })
+
+
+def owner_deleted(sender, instance, **kwargs):
+    deleting(Owner).discard(instance.pk)
+
+
+def parent_deleting(sender, instance, **kwargs):
+    """
+    pre_delete receiver, runs before any cascaded child is deleted
+    """
+    deleting(sender).add(instance.pk)
+
+
+def recount():
+    """
+    Recompute every counter from the pet and visit tables, returning the
+    numbers of owners and pets that were wrong
+    """
+    with transaction.atomic():
+        wrong_owners = (Owner.objects.annotate(actual_pets=pet_count())
+                        .exclude(pet_count=F('actual_pets')).values('pk'))
+        owners = Owner.objects.filter(pk__in=wrong_owners).update(pet_count=pet_count())
+        wrong_pets = (Pet.objects.annotate(actual_visits=visit_count(), actual_last=last_visit_date())
+                      .filter(~Q(visit_count=F('actual_visits'))
+                              | Q(actual_visits=0, last_visit_date__isnull=False)
+                              | Q(actual_visits__gt=0, last_visit_date__isnull=True)
+                              | (Q(actual_visits__gt=0) & ~Q(last_visit_date=F('actual_last'))))
+                      .values('pk'))
+        pets = Pet.objects.filter(pk__in=wrong_pets).update(visit_count=visit_count(),
+                                                            last_visit_date=last_visit_date())
+    return owners, pets
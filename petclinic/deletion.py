@@ -0,0 +1,139 @@
+"""
+Set based deletes of owners and pets
+
+Model.delete() collects every cascaded pet and visit into memory and
+deletes them with signals, costing a few queries per row. purge() deletes
+an owner's or pet's whole tree with one DELETE per table instead, and
+adjusts the statistics, counters and sync tombstones set-based before,
+so the number of queries does not grow with the number of pets and
+visits. purge_in_background() runs it in a worker thread after the
+current transaction commits, for purges too large to wait for.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, connection, transaction
+from django.http import Http404
+from rest_framework import status
+from rest_framework.response import Response
+
+from petclinic import counters, stats, sync
+from petclinic.models import Owner, Pet, Visit
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+
+
+def cascade(model, ids):
+    """
+    Return [(model, queryset)] of the rows deleted with the model rows in
+    ids, children first
+    """
+    if model is Owner:
+        return [(Visit, Visit.objects.filter(pet__owner_id__in=ids)),
+                (Pet, Pet.objects.filter(owner_id__in=ids)),
+                (Owner, Owner.objects.filter(pk__in=ids))]
+    if model is Pet:
+        return [(Visit, Visit.objects.filter(pet_id__in=ids)),
+                (Pet, Pet.objects.filter(pk__in=ids))]
+    raise TypeError('Cannot purge %s rows' % model.__name__)
+
+
+def delete_rows(queryset, using=connection):
+    """
+    Delete the queryset's rows with one DELETE, sending no signals
+    """
+    model = queryset.model
+    quote = using.ops.quote_name
+    sql, params = queryset.values('pk').query.sql_with_params()
+    with using.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE %s IN (%s)' % (
+            quote(model._meta.db_table), quote(model._meta.pk.column), sql), params)
+        return cursor.rowcount
+
+
+def purge(model, ids):
+    """
+    Delete the owners or pets in ids with their pets and visits, returning
+    the number of model rows deleted
+    """
+    with transaction.atomic():
+        ids = list(model.objects.select_for_update().filter(pk__in=ids).values_list('pk', flat=True))
+        if not ids:
+            return 0
+        if model is Owner:
+            # visits inserted for these pets now wait for the purge to
+            # commit instead of being deleted without being accounted for
+            list(Pet.objects.select_for_update().filter(owner_id__in=ids).values_list('pk'))
+        stats.record_deleting(model, ids)
+        counters.record_deleting(model, ids)
+        tables = cascade(model, ids)
+        for table, queryset in tables:
+            sync.record_deletes(table, queryset)
+        for table, queryset in tables:
+            deleted = delete_rows(queryset)
+    return deleted
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # one purge at a time, so large purges do not compete for locks
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='petclinic-purge')
+    return _executor
+
+
+def run_purge(model, ids):
+    close_old_connections()
+    try:
+        purge(model, ids)
+    except Exception:
+        logger.exception('Purging %s %s failed', model.__name__, ids)
+    finally:
+        connection.close()
+
+
+def purge_in_background(model, ids):
+    """
+    Run purge() in the worker thread once the current transaction commits
+    """
+    ids = list(ids)
+
+    def submit():
+        future = get_executor().submit(run_purge, model, ids)
+        _pending.add(future)
+        future.add_done_callback(_pending.discard)
+
+    transaction.on_commit(submit)
+
+
+def wait_for_purges():
+    """
+    Wait for the scheduled purges to finish
+    """
+    for future in list(_pending):
+        future.result()
+
+
+class PurgeMixin(object):
+    """
+    DELETE handler for detail views of owners and pets using purge()
+
+    ?background=true only checks that the row exists and answers 202
+    Accepted, leaving the purge to the worker thread.
+    """
+    background_query_param = 'background'
+
+    def delete(self, request, pk, format=None):
+        model = self.queryset.model
+        background = request.query_params.get(self.background_query_param, '').lower() in ('1', 'true', 'yes')
+        if background:
+            if not model.objects.filter(pk=pk).exists():
+                raise Http404
+            purge_in_background(model, [pk])
+            return Response(status=status.HTTP_202_ACCEPTED)
+        if not purge(model, [pk]):
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
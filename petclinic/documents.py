@@ -0,0 +1,143 @@
+"""
+Nested JSON documents built by the database
+
+document_sql() turns a compiled FastSerializer into one SELECT that
+returns the whole nested representation of a row as JSON text, using
+json_build_object/json_agg on PostgreSQL and json_object/json_group_array
+on SQLite. The document has the serializer's keys, in its order, and
+its date and datetime formats, so it parses to the same data; only the
+whitespace differs. Nested rows are ordered by primary key.
+"""
+import re
+
+from django.db import connection, models
+
+from petclinic.fast_serializers import FastSerializer
+
+
+class UnsupportedDatabase(Exception):
+    pass
+
+
+class DocumentDialect(object):
+    """
+    SQL fragments for one database
+    """
+
+    def __init__(self, connection):
+        self.quote = connection.ops.quote_name
+
+    def value(self, alias, field):
+        return '%s.%s' % (alias, self.quote(field.column))
+
+
+class PostgreSQLDialect(DocumentDialect):
+
+    def obj(self, pairs):
+        return 'json_build_object(%s)' % ', '.join("'%s', %s" % pair for pair in pairs)
+
+    def array(self, document, table, alias, where, order):
+        return "COALESCE((SELECT json_agg(%s ORDER BY %s) FROM %s %s WHERE %s), '[]'::json)" % (
+            document, order, table, alias, where)
+
+    def value(self, alias, field):
+        column = super(PostgreSQLDialect, self).value(alias, field)
+        if isinstance(field, models.DateTimeField):
+            # DRF's isoformat(): microseconds only when non zero, UTC as Z
+            utc = "(%s AT TIME ZONE 'UTC')" % column
+            return ('CASE WHEN mod(date_part(\'microseconds\', %s)::integer, 1000000) = 0 '
+                    'THEN to_char(%s, \'YYYY-MM-DD"T"HH24:MI:SS"Z"\') '
+                    'ELSE to_char(%s, \'YYYY-MM-DD"T"HH24:MI:SS.US"Z"\') END' % (utc, utc, utc))
+        return column
+
+    def select(self, document):
+        return '%s::text' % document
+
+
+class SQLiteDialect(DocumentDialect):
+
+    def obj(self, pairs):
+        return 'json_object(%s)' % ', '.join("'%s', %s" % pair for pair in pairs)
+
+    def array(self, document, table, alias, where, order):
+        # json() keeps the nested documents JSON instead of quoted strings
+        return 'json((SELECT json_group_array(json(doc)) FROM (SELECT %s AS doc FROM %s %s WHERE %s ORDER BY %s)))' % (
+            document, table, alias, where, order)
+
+    def value(self, alias, field):
+        column = super(SQLiteDialect, self).value(alias, field)
+        if isinstance(field, models.DateTimeField):
+            # stored as UTC 'YYYY-MM-DD HH:MM:SS[.ffffff]'
+            return "replace(%s, ' ', 'T') || 'Z'" % column
+        return column
+
+    def select(self, document):
+        return document
+
+
+# model fields whose database values are already their JSON representation
+DOCUMENT_FIELDS = (models.AutoField, models.IntegerField, models.CharField, models.TextField,
+                   models.DateField, models.ForeignKey)
+
+DIALECTS = {
+    'postgresql': PostgreSQLDialect,
+    'sqlite': SQLiteDialect,
+}
+
+
+def build_document(dialect, serializer_class, alias, depth):
+    """
+    Return the SQL expression of serializer_class's document for the row
+    of its model at alias
+    """
+    model = serializer_class.model
+    pairs = []
+    for name, source, convert in serializer_class.fields:
+        if not re.match(r'^\w+$', name):
+            raise ValueError('Cannot use %r as a document key' % name)
+        if convert is None:
+            child, fk_name = [(child, fk_name) for nested_name, child, fk_name in serializer_class.nested
+                              if nested_name == name][0]
+            child_alias = 't%d' % (depth + 1)
+            fk = child.model._meta.get_field(fk_name)
+            where = '%s.%s = %s.%s' % (child_alias, dialect.quote(fk.column),
+                                       alias, dialect.quote(model._meta.pk.column))
+            document = build_document(dialect, child, child_alias, depth + 1)
+            order = '%s.%s' % (child_alias, dialect.quote(child.model._meta.pk.column))
+            pairs.append((name, dialect.array(document, dialect.quote(child.model._meta.db_table),
+                                              child_alias, where, order)))
+        else:
+            field = model._meta.pk if source == 'pk' else model._meta.get_field(source)
+            if not isinstance(field, DOCUMENT_FIELDS):
+                raise TypeError('%s.%s cannot be built in the database' % (model.__name__, field.name))
+            pairs.append((name, dialect.value(alias, field)))
+    return dialect.obj(pairs)
+
+
+def document_sql(serializer_class, using=connection):
+    """
+    Return SQL selecting the document of the row whose primary key is the
+    single parameter
+    """
+    if not issubclass(serializer_class, FastSerializer):
+        raise TypeError('%s is not a FastSerializer' % serializer_class.__name__)
+    dialect_class = DIALECTS.get(using.vendor)
+    if dialect_class is None:
+        raise UnsupportedDatabase(using.vendor)
+    dialect = dialect_class(using)
+    model = serializer_class.model
+    return 'SELECT %s FROM %s t0 WHERE t0.%s = %%s' % (
+        dialect.select(build_document(dialect, serializer_class, 't0', 0)),
+        dialect.quote(model._meta.db_table), dialect.quote(model._meta.pk.column))
+
+
+def fetch_document(serializer_class, pk, using=connection):
+    """
+    Return the document as UTF-8 bytes, or None if there is no such row
+    """
+    with using.cursor() as cursor:
+        cursor.execute(document_sql(serializer_class, using), [pk])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return row[0].encode('utf-8')
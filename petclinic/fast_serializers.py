@@ -0,0 +1,133 @@
+from collections import defaultdict
+
+from rest_framework import serializers
+
+from petclinic.instrumentation import serialize_timed
+from petclinic.serializers import (OwnerSerializer, PetSerializer,
+                                   VetSerializer, VisitSerializer)
+
+
+def identity(value):
+    return value
+
+
+def field_converter(field):
+    """
+    Return a function turning a column value into field's representation
+
+    Common field types are mapped to builtins that produce the same output
+    as their to_representation(); anything else uses the field itself.
+    """
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        return identity
+    if type(field) is serializers.IntegerField:
+        return int
+    if type(field) in (serializers.CharField, serializers.EmailField):
+        return str
+    return field.to_representation
+
+
+class FastSerializer(object):
+    """
+    Read only serializer building representations from .values() rows
+
+    Subclasses are created with compile_serializer() from an existing
+    ModelSerializer, whose output they reproduce exactly without
+    instantiating models or running per field get_attribute() calls.
+    Nested list serializers are loaded with one query per level for the
+    whole batch of rows, like prefetch_related() would.
+    """
+    model = None
+    columns = ()
+    fields = ()
+    nested = ()
+
+    def __init__(self, instance=None, many=False, **kwargs):
+        self.instance = instance
+        self.many = many
+
+    @classmethod
+    def values(cls, queryset):
+        """
+        Return queryset as the .values() rows this serializer consumes
+        """
+        return queryset.prefetch_related(None).values(*cls.columns)
+
+    @classmethod
+    def columns_with(cls, column):
+        return cls.columns if column in cls.columns else cls.columns + (column,)
+
+    @classmethod
+    def render_rows(cls, rows):
+        nested_data = dict((name, child.render_children(rows, fk_name))
+                           for name, child, fk_name in cls.nested)
+        results = []
+        for row in rows:
+            item = {}
+            for name, source, convert in cls.fields:
+                if convert is None:
+                    item[name] = nested_data[name].get(row['pk'], [])
+                    continue
+                value = row[source]
+                item[name] = None if value is None else convert(value)
+            results.append(item)
+        return results
+
+    @classmethod
+    def render_children(cls, parent_rows, fk_name):
+        """
+        Render the rows related to parent_rows grouped by parent pk
+        """
+        parent_ids = [row['pk'] for row in parent_rows]
+        if not parent_ids:
+            return {}
+        rows = list(cls.model._default_manager
+                    .filter(**{ fk_name + '__in': parent_ids })
+                    .values(*cls.columns_with(fk_name)))
+        grouped = defaultdict(list)
+        for row, item in zip(rows, cls.render_rows(rows)):
+            grouped[row[fk_name]].append(item)
+        return grouped
+
+    @property
+    def data(self):
+        if self.many:
+            return serialize_timed(self.render_rows, list(self.instance))
+        return serialize_timed(self.render_rows, [self.instance])[0]
+
+
+def compile_serializer(serializer_class):
+    """
+    Build a FastSerializer subclass from a ModelSerializer class
+    """
+    model = serializer_class.Meta.model
+    columns = ['pk']
+    fields = []
+    nested = []
+    for name, field in serializer_class().fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            relation = model._meta.get_field(field.source)
+            child = compile_serializer(type(field.child))
+            nested.append((name, child, relation.field.name))
+            fields.append((name, field.source, None))
+            continue
+        if isinstance(field, serializers.BaseSerializer) or '.' in field.source or field.source == '*':
+            raise TypeError("%s.%s cannot be compiled" % (serializer_class.__name__, name))
+        if field.source not in columns:
+            columns.append(field.source)
+        fields.append((name, field.source, field_converter(field)))
+    attrs = {
+        'model': model,
+        'columns': tuple(columns),
+        'fields': tuple(fields),
+        'nested': tuple(nested),
+    }
+    return type('Fast' + serializer_class.__name__, (FastSerializer,), attrs)
+
+
+FastVisitSerializer = compile_serializer(VisitSerializer)
+FastPetSerializer = compile_serializer(PetSerializer)
+FastOwnerSerializer = compile_serializer(OwnerSerializer)
+FastVetSerializer = compile_serializer(VetSerializer)
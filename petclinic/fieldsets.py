@@ -0,0 +1,151 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework.exceptions import ParseError
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def parse_field_tree(value):
+    """
+    Parse a comma separated list of dotted field paths into a tree
+
+    'id,pets.name,pets.visits' -> {'id': {}, 'pets': {'name': {}, 'visits': {}}}
+    A missing parameter (None) stays None, meaning no restriction.
+    """
+    if value is None:
+        return None
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def requested_fieldset(request):
+    """
+    Return the (fields, expand) trees requested with ?fields= and ?expand=
+
+    Only read requests are narrowed so that writes always validate against
+    the full serializer.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None, None
+    params = request.query_params
+    # an empty ?fields= restricts nothing, an empty ?expand= expands nothing
+    return parse_field_tree(params.get('fields')) or None, parse_field_tree(params.get('expand'))
+
+
+def check_field_tree(serializer, tree, param, prefix=''):
+    """
+    Raise ParseError naming the first path of tree that serializer cannot
+    render; expand paths must name nested serializers
+    """
+    for name, subtree in tree.items():
+        field = serializer.fields.get(name)
+        nested = isinstance(field, BaseSerializer)
+        if field is None or (param == 'expand' and not nested):
+            raise ParseError('Unknown %s path: %s%s' % (param, prefix, name))
+        if not nested:
+            if subtree:
+                raise ParseError('Unknown %s path: %s%s.%s' % (param, prefix, name, next(iter(subtree))))
+            continue
+        child = field.child if isinstance(field, ListSerializer) else field
+        check_field_tree(child, subtree, param, prefix + name + '.')
+
+
+def prune_fields(serializer, fields, expand):
+    """
+    Drop fields from serializer that are not in the requested fieldset
+
+    Plain fields are kept if fields is None or names them. Nested
+    serializers are kept if named by expand, or when expand is not given,
+    by the same rule as plain fields. An empty subtree keeps every field of
+    the nested serializer.
+    """
+    serializer.sparse_fields = fields
+    for name, field in list(serializer.fields.items()):
+        nested = isinstance(field, BaseSerializer)
+        if nested and expand is not None:
+            keep = name in expand
+        else:
+            keep = fields is None or name in fields
+        if not keep:
+            serializer.fields.pop(name)
+            continue
+        if nested:
+            child = field.child if isinstance(field, ListSerializer) else field
+            sub_fields = fields.get(name) if fields is not None else None
+            sub_expand = expand.get(name) if expand is not None else None
+            prune_fields(child, sub_fields or None, sub_expand)
+
+
+def plan_queryset(queryset, serializer, extra_columns=()):
+    """
+    Restrict queryset to what serializer will render
+
+    Nested list serializers become Prefetch lookups with their own planned
+    querysets. Columns are only deferred with only() at levels where a
+    sparse field list was requested.
+    """
+    model = serializer.Meta.model
+    columns = ['pk'] + list(extra_columns)
+    prefetches = []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if isinstance(field, ListSerializer):
+            relation = model._meta.get_field(field.source)
+            related_model = relation.related_model
+            related = plan_queryset(related_model._default_manager.all(), field.child,
+                                    extra_columns=[relation.field.name])
+            prefetches.append(Prefetch(field.source, queryset=related))
+            continue
+        try:
+            model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        columns.append(field.source)
+    if getattr(serializer, 'sparse_fields', None) is not None:
+        queryset = queryset.only(*columns)
+    return queryset.prefetch_related(*prefetches)
+
+
+class SparseFieldsetMixin(object):
+    """
+    Serializer mixin rendering only the fields and expansions requested
+
+    The fieldset is taken from the fields/expand keyword arguments, or
+    from the ?fields= and ?expand= parameters of the request in the
+    serializer context.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super(SparseFieldsetMixin, self).__init__(*args, **kwargs)
+        if fields is None and expand is None:
+            fields, expand = requested_fieldset(self.context.get('request'))
+        self.is_sparse = fields is not None or expand is not None
+        if self.is_sparse:
+            for param, tree in (('fields', fields), ('expand', expand)):
+                if tree is not None:
+                    check_field_tree(self, tree, param)
+            prune_fields(self, fields, expand)
+
+
+class SparseFieldsetViewMixin(object):
+    """
+    View mixin adapting the view's query plan to the requested fieldset
+    """
+
+    def is_sparse_request(self):
+        return requested_fieldset(self.request) != (None, None)
+
+    def plan_queryset(self, queryset):
+        serializer = self.serializer_class(context={ 'request': self.request })
+        if not serializer.is_sparse:
+            return queryset
+        return plan_queryset(queryset.prefetch_related(None), serializer)
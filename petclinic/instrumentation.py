@@ -0,0 +1,168 @@
+"""
+Per request timing of database queries, serializers and rendering
+
+InstrumentationMiddleware keeps a RequestMetrics for the request in a
+context variable. Database time is recorded by an execute wrapper
+installed on every connection, serializer time by
+InstrumentedSerializerMixin and FastSerializer, and render time around
+response.render(). The timings are sent back in a Server-Timing header
+and aggregated per view in petclinic.metrics.
+
+Work done after the middleware returns, such as iterating a streaming
+response, is not measured.
+"""
+import asyncio
+import contextvars
+import time
+
+from django.conf import settings
+
+from petclinic.metrics import registry
+
+current_metrics = contextvars.ContextVar('petclinic_request_metrics', default=None)
+
+
+class RequestMetrics(object):
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.serializing = False
+        self.render_start = None
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper adding each query to the current request's metrics
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    connection_created receiver
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def serialize_timed(function, *args):
+    """
+    Call function, counting its time less any queries as serializer time
+
+    Nested calls are part of the outermost one and not counted again.
+    """
+    metrics = current_metrics.get()
+    if metrics is None or metrics.serializing:
+        return function(*args)
+    metrics.serializing = True
+    start = time.perf_counter()
+    db_time = metrics.db_time
+    try:
+        return function(*args)
+    finally:
+        metrics.serializing = False
+        metrics.serialize_time += time.perf_counter() - start - (metrics.db_time - db_time)
+
+
+class InstrumentedSerializerMixin(object):
+    """
+    Count to_representation() as serializer time
+    """
+
+    def to_representation(self, instance):
+        return serialize_timed(super(InstrumentedSerializerMixin, self).to_representation, instance)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view_class = getattr(match.func, 'view_class', None)
+    return view_class.__name__ if view_class is not None else match.func.__name__
+
+
+def server_timing_enabled():
+    return getattr(settings, 'PETCLINIC_SERVER_TIMING', True)
+
+
+class InstrumentationMiddleware(object):
+    """
+    Time each request and report it in Server-Timing and /metrics
+
+    Runs natively in both sync and async handler chains, so async views
+    are not moved to a thread for it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # lets the handler see __call__ as a coroutine function
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        """
+        Called right before the handler renders the response
+        """
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.render_start = time.perf_counter()
+            response.add_post_render_callback(lambda response: self.rendered(metrics))
+        return response
+
+    def rendered(self, metrics):
+        metrics.render_time += time.perf_counter() - metrics.render_start
+
+    def finish(self, request, response, metrics):
+        total = time.perf_counter() - metrics.start
+        view = view_name(request)
+        if server_timing_enabled():
+            response['Server-Timing'] = ', '.join([
+                'db;dur=%.2f;desc="%d queries"' % (metrics.db_time * 1000.0, metrics.queries),
+                'serialize;dur=%.2f' % (metrics.serialize_time * 1000.0),
+                'render;dur=%.2f' % (metrics.render_time * 1000.0),
+                'total;dur=%.2f' % (total * 1000.0),
+            ])
+        labels = (('view', view),)
+        registry.observe('petclinic_request_duration_seconds', labels + (('method', request.method),), total)
+        registry.observe('petclinic_request_db_seconds', labels, metrics.db_time)
+        registry.observe('petclinic_request_serialize_seconds', labels, metrics.serialize_time)
+        registry.observe('petclinic_request_render_seconds', labels, metrics.render_time)
+        registry.observe('petclinic_request_db_queries', labels, metrics.queries)
+        registry.inc('petclinic_requests_total', labels + (('method', request.method),
+                                                           ('status', str(response.status_code))))
+        registry.flush()
+        return response
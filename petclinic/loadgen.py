@@ -0,0 +1,221 @@
+"""
+Open loop HTTP load generation on asyncio
+
+Requests are started on a fixed schedule (rate per second) whether or not
+earlier requests have finished, and each latency is measured from the
+time the request was scheduled to start. A closed loop generator waits
+for a slow response before sending the next request and so never records
+the requests that would have queued behind it (coordinated omission);
+measuring from the schedule counts that queueing as the client would see
+it. The time from actually sending to the response is kept too, as
+service time.
+"""
+import asyncio
+import json
+from urllib.parse import urlsplit
+
+
+class HTTPError(Exception):
+    pass
+
+
+class ConnectionClosed(HTTPError):
+    pass
+
+
+class HTTPConnection(object):
+    """
+    Minimal keep-alive HTTP/1.1 client connection
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, headers=None, body=b''):
+        """
+        Return (status, headers, body); headers names are lower case
+
+        A kept alive connection the server has closed in the meantime is
+        reopened and the request sent again once.
+        """
+        lines = ['%s %s HTTP/1.1' % (method, path), 'Host: %s:%d' % (self.host, self.port),
+                 'Content-Length: %d' % len(body)]
+        lines.extend('%s: %s' % item for item in (headers or {}).items())
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+        while True:
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                self.writer.write(request)
+                status, response_headers, response_body = await self.read_response(method)
+                break
+            except (ConnectionClosed, ConnectionResetError, BrokenPipeError):
+                self.close()
+                if not reused:
+                    raise
+            except BaseException:
+                self.close()
+                raise
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, response_headers, response_body
+
+    async def read_response(self, method):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionClosed('connection closed by server')
+        parts = status_line.decode('latin-1').split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise HTTPError('bad status line %r' % status_line)
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        status = int(parts[1])
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            body = b''
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self.read_chunked()
+        elif 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            body = await self.reader.read()
+            headers['connection'] = 'close'
+        return status, headers, body
+
+    async def read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                # trailers end with an empty line
+                while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readline()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class ConnectionPool(object):
+    """
+    At most size connections to one server; requests wait for a free one
+    """
+
+    def __init__(self, url, size):
+        parts = urlsplit(url)
+        if parts.scheme != 'http':
+            raise ValueError('only http:// URLs are supported')
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.connections = [HTTPConnection(self.host, self.port) for i in range(size)]
+        self.idle = asyncio.LifoQueue()
+        for connection in self.connections:
+            self.idle.put_nowait(connection)
+
+    async def request(self, method, path, headers=None, body=b'', on_send=None):
+        """
+        Send the request on the next free connection; on_send is called
+        when it has one, before the request is written
+        """
+        connection = await self.idle.get()
+        try:
+            if on_send is not None:
+                on_send()
+            return await connection.request(method, self.prefix + path, headers, body)
+        finally:
+            self.idle.put_nowait(connection)
+
+    async def request_json(self, method, path, data=None, headers=None):
+        headers = dict(headers or {}, Accept='application/json')
+        body = b''
+        if data is not None:
+            headers['Content-Type'] = 'application/json'
+            body = json.dumps(data).encode('utf-8')
+        status, response_headers, response_body = await self.request(method, path, headers, body)
+        if not 200 <= status < 300:
+            raise HTTPError('%s %s returned %d: %s' % (method, path, status, response_body[:200]))
+        return json.loads(response_body.decode('utf-8')) if response_body else None
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+
+
+class LoadResult(object):
+    """
+    Latencies of one kind of request, in seconds
+
+    Timed out requests count as errors and timeouts but have no latency;
+    recording them at the timeout would cap the tail percentiles.
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.service_times = []
+        self.errors = 0
+        self.timeouts = 0
+        self.statuses = {}
+
+    def record(self, status, latency, service_time, timed_out=False):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status is None or status >= 400:
+            self.errors += 1
+        if timed_out:
+            self.timeouts += 1
+            return
+        self.latencies.append(latency)
+        self.service_times.append(service_time)
+
+
+async def open_loop(rate, duration, issue):
+    """
+    Call issue(scheduled) rate times a second for duration seconds without
+    waiting for earlier calls to finish; scheduled is the loop time the
+    call was due. Return the loop time the run started.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    interval = 1.0 / rate
+    tasks = []
+    for i in range(max(int(rate * duration), 1)):
+        scheduled = start + i * interval
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(issue(scheduled)))
+    await asyncio.gather(*tasks)
+    return start
+
+
+async def timed_request(pool, result, scheduled, method, path, headers=None, body=b'', timeout=10.0):
+    """
+    Send one request and record its latency from scheduled and its
+    service time from when a connection was free to send it
+    """
+    loop = asyncio.get_running_loop()
+    sent = []
+    timed_out = False
+    try:
+        status, response_headers, response_body = await asyncio.wait_for(
+            pool.request(method, path, headers, body, on_send=lambda: sent.append(loop.time())), timeout)
+    except asyncio.TimeoutError:
+        status = None
+        timed_out = True
+    except (OSError, asyncio.IncompleteReadError, HTTPError, ValueError):
+        status = None
+    done = loop.time()
+    result.record(status, done - scheduled, done - (sent[0] if sent else scheduled), timed_out)
+    return done
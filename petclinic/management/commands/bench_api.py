@@ -0,0 +1,355 @@
+import datetime
+import json
+import re
+import secrets
+import time
+import tracemalloc
+from io import StringIO
+from itertools import count
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from petclinic import urls as petclinic_urls
+from petclinic.benchmarking import summarize
+from petclinic.models import Owner, Pet, PetType, Specialty, User, Vet, Visit
+
+TOKEN_ROUTES = ('token_obtain_pair', 'token_refresh')
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+# differences smaller than these are noise, whatever the threshold
+MIN_LATENCY_DELTA_MS = 1.0
+MIN_MEMORY_DELTA_KB = 64
+
+
+class Route(object):
+    """
+    One benchmarked request; prepare() runs untimed before each request
+    and returns the URL arguments
+    """
+
+    def __init__(self, method, name, args=(), data=None, query='', prepare=None, label=None, auth=True):
+        self.method = method
+        self.name = name
+        self.args = args
+        self.data = data
+        self.query = query
+        self.prepare = prepare
+        self.label = label or '%s %s%s' % (method, name, '?' + query if query else '')
+        self.auth = auth
+
+    def request(self, client, headers):
+        args = self.prepare() if self.prepare else self.args
+        path = reverse(self.name, args=args) + ('?' + self.query if self.query else '')
+        data = self.data() if callable(self.data) else self.data
+        body = json.dumps(data) if data is not None else ''
+        extra = headers if self.auth else {}
+        start = time.perf_counter()
+        response = client.generic(self.method, path, body, content_type='application/json', **extra)
+        return time.perf_counter() - start, response
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway test database at each scale and benchmarks every petclinic route and '
+            'the token endpoints through the test client with real JWT authentication. Writes the '
+            'results as JSON and exits non-zero on regressions against a previous run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales',
+            help='comma separated populate_db scales to benchmark, default 1',
+            default='1'
+        )
+        parser.add_argument(
+            '--owners',
+            help='owners per unit of scale, default 100',
+            type=int,
+            default=100
+        )
+        parser.add_argument(
+            '--vets',
+            help='vets per unit of scale, default 20',
+            type=int,
+            default=20
+        )
+        parser.add_argument(
+            '--requests',
+            help='timed requests per route, default 50',
+            type=int,
+            default=50
+        )
+        parser.add_argument(
+            '--warmup',
+            help='untimed requests per route before measuring, default 5',
+            type=int,
+            default=5
+        )
+        parser.add_argument(
+            '--output',
+            help='file to write the JSON results to',
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON results of an earlier run to check for regressions',
+        )
+        parser.add_argument(
+            '--threshold',
+            help='percent increase in p95 latency or peak memory counted as a regression, default 20',
+            type=float,
+            default=20.0
+        )
+        parser.add_argument(
+            '--no-test-db',
+            help='benchmark the configured database instead of a test database; its data is replaced',
+            action='store_true'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(scale) for scale in options['scales'].split(',')]
+        except ValueError:
+            raise CommandError('--scales must be a comma separated list of integers')
+        if min(scales) < 1 or options['requests'] < 1 or options['warmup'] < 0:
+            raise CommandError('--scales and --requests must be positive')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+        self.options = options
+
+        # the test client's host, no query logging skewing the timings and
+        # query counts from Server-Timing, which includes worker threads
+        with override_settings(ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver'], DEBUG=False,
+                               PETCLINIC_SERVER_TIMING=True):
+            if options['no_test_db']:
+                results = self.run_scales(scales)
+            else:
+                old_name = connection.settings_dict['NAME']
+                connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                try:
+                    results = self.run_scales(scales)
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        if baseline is not None:
+            regressions = self.compare(baseline, results, options['threshold'])
+            for regression in regressions:
+                self.stderr.write(regression)
+            if regressions:
+                raise CommandError('%d regressions against %s' % (len(regressions), options['compare']))
+            self.stdout.write(self.style.SUCCESS('No regressions against %s' % options['compare']))
+
+    def run_scales(self, scales):
+        results = {
+            'meta': {
+                'database': connection.vendor,
+                'owners': self.options['owners'],
+                'vets': self.options['vets'],
+                'requests': self.options['requests'],
+                'warmup': self.options['warmup'],
+                'date': timezone.now().isoformat(),
+            },
+            'scales': {},
+        }
+        for scale in scales:
+            call_command('populate_db', owners=self.options['owners'], vets=self.options['vets'],
+                         scale=scale, seed='bench_api', stdout=StringIO())
+            self.stdout.write('Scale %d: %d owners, %d pets, %d visits' % (
+                scale, Owner.objects.count(), Pet.objects.count(), Visit.objects.count()))
+            results['scales'][str(scale)] = self.run_routes()
+        return results
+
+    def run_routes(self):
+        email = 'bench_api@example.com'
+        password = secrets.token_urlsafe(16)
+        user = User.objects.filter(email=email).first()
+        if user is None:
+            user = User.objects.create_user(email=email, username='bench_api', password=password,
+                                            first_name='Bench', last_name='Api', is_staff=True)
+        else:
+            user.set_password(password)
+            user.save()
+        self.credentials = { 'email': email, 'password': password }
+        client = Client()
+
+        routes = self.routes(user)
+        missing = self.route_names() - set(route.name for route in routes)
+        if missing:
+            self.stderr.write('Routes without a benchmark: %s' % ', '.join(sorted(missing)))
+        results = {}
+        self.stdout.write('%-42s %9s %9s %9s %9s %7s %9s %6s' % (
+            'route', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries', 'peak KiB', 'errors'))
+        for route in routes:
+            # a fresh token per route, so long runs never outlive it
+            headers = self.login(client)
+            results[route.label] = result = self.measure(route, client, headers)
+            self.stdout.write('%-42s %9.2f %9.2f %9.2f %9.1f %7d %9.1f %6d' % (
+                route.label, result['p50_ms'], result['p95_ms'], result['p99_ms'], result['rps'],
+                result['queries'], result['peak_memory_kb'], result['errors']))
+        return results
+
+    def login(self, client):
+        """
+        Obtain tokens through the token endpoint and return the auth header
+        """
+        response = client.post(reverse('token_obtain_pair'), self.credentials)
+        if response.status_code != 200:
+            raise CommandError('Could not obtain a token: %s' % response.content.decode('utf-8'))
+        tokens = response.json()
+        self.refresh_token = tokens['refresh']
+        return { 'HTTP_AUTHORIZATION': 'Bearer %s' % tokens['access'] }
+
+    def route_names(self):
+        return set(pattern.name for pattern in petclinic_urls.urlpatterns if pattern.name) | set(TOKEN_ROUTES)
+
+    def measure(self, route, client, headers):
+        for i in range(self.options['warmup']):
+            route.request(client, headers)
+        elapsed, response = route.request(client, headers)
+        queries = int(SERVER_TIMING_QUERIES.search(response['Server-Timing']).group(1))
+        # traced separately, tracemalloc slows everything down
+        tracemalloc.start()
+        try:
+            route.request(client, headers)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        latencies = []
+        errors = 0
+        for i in range(self.options['requests']):
+            elapsed, response = route.request(client, headers)
+            latencies.append(elapsed)
+            if response.status_code >= 400:
+                errors += 1
+        summary = summarize(latencies, sum(latencies), errors)
+        return {
+            'requests': summary['requests'],
+            'errors': summary['errors'],
+            'rps': summary['rps'],
+            'p50_ms': summary['p50'],
+            'p95_ms': summary['p95'],
+            'p99_ms': summary['p99'],
+            'queries': queries,
+            'peak_memory_kb': peak / 1024.0,
+        }
+
+    def routes(self, user):
+        owner = Owner.objects.order_by('id').first()
+        pet = Pet.objects.filter(owner=owner).order_by('id').first()
+        visit = Visit.objects.filter(pet=pet).order_by('id').first()
+        vet = Vet.objects.order_by('id').first()
+        specialty = Specialty.objects.order_by('id').first()
+        pet_type = PetType.objects.order_by('id').first()
+        if None in (owner, pet, visit, vet, specialty, pet_type):
+            raise CommandError('The seeded database has no owner with a visited pet; increase --owners')
+        serial = count()
+        today = datetime.date.today().isoformat()
+        now = timezone.now().isoformat()
+
+        def new_owner():
+            return {
+                'email': 'bench-owner-%d@example.com' % next(serial), 'first_name': 'Bench',
+                'last_name': 'Owner', 'street_address': '1 Main St', 'city': 'San Jose', 'state': 'CA',
+                'telephone': '408-555-1212',
+            }
+
+        def new_pet():
+            return { 'name': 'bench', 'birth_date': today, 'pet_type': pet_type.id }
+
+        def new_visit():
+            return { 'visit_date': now, 'description': 'Benchmark visit', 'pet': pet.id }
+
+        batch_owners = list(Owner.objects.order_by('id').values_list('id', flat=True)[:20])
+        batch_pets = list(Pet.objects.order_by('id').values_list('id', 'name')[:20])
+        batch_visits = list(Visit.objects.order_by('id').values_list('id', 'description')[:20])
+
+        def owner_to_delete():
+            return [Owner.objects.create(**new_owner()).id]
+
+        def pet_to_delete():
+            return [Pet.objects.create(owner=owner, name='bench', birth_date=datetime.date.today(),
+                                       pet_type=pet_type).id]
+
+        def visit_to_delete():
+            return [Visit.objects.create(pet=pet, visit_date=timezone.now(), description='Benchmark').id]
+
+        return [
+            Route('POST', 'token_obtain_pair', data=self.credentials, auth=False),
+            Route('POST', 'token_refresh', data=lambda: { 'refresh': self.refresh_token }, auth=False),
+            Route('GET', 'user-list'),
+            Route('GET', 'user-detail', [user.id]),
+            Route('GET', 'owner-list'),
+            Route('GET', 'owner-list', query='state=%s' % owner.state),
+            Route('GET', 'owner-list', query='page_size=50'),
+            Route('POST', 'owner-list', data=new_owner),
+            Route('PATCH', 'owner-list', data=[{ 'id': pk, 'city': 'San Jose' } for pk in batch_owners]),
+            Route('GET', 'owner-detail', [owner.id]),
+            Route('GET', 'owner-document', [owner.id]),
+            Route('PUT', 'owner-detail', [owner.id], data={ 'city': 'San Jose' }),
+            Route('DELETE', 'owner-detail', prepare=owner_to_delete),
+            Route('GET', 'vet-list'),
+            Route('GET', 'vet-detail', [vet.id]),
+            Route('PUT', 'vet-detail', [vet.id], data={ 'city': 'San Jose' }),
+            Route('GET', 'specialty-list'),
+            Route('GET', 'specialty-detail', [specialty.id]),
+            Route('GET', 'pet-type-list'),
+            Route('GET', 'pet-type-detail', [pet_type.id]),
+            Route('GET', 'owner-pet-list', [owner.id]),
+            Route('POST', 'owner-pet-list', [owner.id], data=new_pet),
+            Route('PATCH', 'pet-list', data=[{ 'id': pk, 'name': name } for pk, name in batch_pets]),
+            Route('GET', 'pet-detail', [pet.id]),
+            Route('PUT', 'pet-detail', [pet.id], data={ 'name': pet.name }),
+            Route('DELETE', 'pet-detail', prepare=pet_to_delete),
+            Route('GET', 'pet-visit-list', [pet.id]),
+            Route('POST', 'pet-visit-list', [pet.id], data=new_visit),
+            Route('GET', 'visit-list'),
+            Route('PATCH', 'visit-list', data=[{ 'id': pk, 'description': description }
+                                             for pk, description in batch_visits]),
+            Route('GET', 'visit-detail', [visit.id]),
+            Route('PUT', 'visit-detail', [visit.id], data={ 'description': visit.description }),
+            Route('DELETE', 'visit-detail', prepare=visit_to_delete),
+            Route('POST', 'visit-bulk-create', data=lambda: [new_visit() for i in range(100)]),
+            Route('GET', 'clinic-stats'),
+            Route('GET', 'db-pool-stats'),
+            Route('GET', 'async-owner-list'),
+            Route('GET', 'async-owner-detail', [owner.id]),
+            Route('GET', 'async-owner-pet-list', [owner.id]),
+            Route('GET', 'async-pet-detail', [pet.id]),
+            Route('GET', 'async-pet-visit-list', [pet.id]),
+            Route('GET', 'async-visit-detail', [visit.id]),
+            Route('GET', 'metrics', auth=False),
+        ]
+
+    def compare(self, baseline, results, threshold):
+        """
+        Return a description of each regression of results against baseline
+        """
+        factor = 1 + threshold / 100.0
+        regressions = []
+        for scale, routes in results['scales'].items():
+            for label, result in routes.items():
+                base = baseline.get('scales', {}).get(scale, {}).get(label)
+                if base is None:
+                    continue
+                where = 'scale %s %s' % (scale, label)
+                if (result['p95_ms'] > base['p95_ms'] * factor and
+                        result['p95_ms'] - base['p95_ms'] >= MIN_LATENCY_DELTA_MS):
+                    regressions.append('%s: p95 %.2f ms, was %.2f ms' % (where, result['p95_ms'], base['p95_ms']))
+                if result['queries'] > base['queries']:
+                    regressions.append('%s: %d queries, was %d' % (where, result['queries'], base['queries']))
+                if (result['peak_memory_kb'] > base['peak_memory_kb'] * factor and
+                        result['peak_memory_kb'] - base['peak_memory_kb'] >= MIN_MEMORY_DELTA_KB):
+                    regressions.append('%s: peak memory %.1f KiB, was %.1f KiB' % (
+                        where, result['peak_memory_kb'], base['peak_memory_kb']))
+                if result['errors'] > base['errors']:
+                    regressions.append('%s: %d errors, was %d' % (where, result['errors'], base['errors']))
+        return regressions
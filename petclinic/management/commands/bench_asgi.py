@@ -0,0 +1,164 @@
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from rest_framework_simplejwt.tokens import AccessToken
+
+from petclinic.benchmarking import format_summary, summarize
+from petclinic.models import Owner, Pet, User
+
+PATHS = ['owners/{owner}', 'owners/{owner}/pets', 'pets/{pet}/visits']
+
+
+class Command(BaseCommand):
+    help = ('Compares the synchronous views served by the WSGI app with the async views served '
+            'by the ASGI app under many concurrent, optionally slow, clients. Both sides render '
+            'the same fast serializers from the same queries, so only the serving model differs')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            help='requests per run, default 2000',
+            type=int,
+            default=2000
+        )
+        parser.add_argument(
+            '--concurrency',
+            help='concurrent clients, default 200',
+            type=int,
+            default=200
+        )
+        parser.add_argument(
+            '--wsgi-threads',
+            help='threads serving the WSGI app, like a threaded WSGI server, default 16',
+            type=int,
+            default=16
+        )
+        parser.add_argument(
+            '--client-delay',
+            help='seconds each client takes to send its request, default 0',
+            type=float,
+            default=0.0
+        )
+        parser.add_argument(
+            '--email',
+            help='user to authenticate as, default the first active user',
+        )
+        parser.add_argument(
+            '--host',
+            help='Host header sent, must be in ALLOWED_HOSTS, default localhost',
+            default='localhost'
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1 or options['wsgi_threads'] < 1:
+            raise CommandError('--requests, --concurrency and --wsgi-threads must be positive')
+        users = User.objects.filter(is_active=True).order_by('id')
+        if options['email']:
+            users = users.filter(email=options['email'])
+        user = users.first()
+        owner = Owner.objects.order_by('id').first()
+        pet = Pet.objects.order_by('id').first()
+        if user is None or owner is None or pet is None:
+            raise CommandError('Needs an active user, an owner and a pet; run populate_db first')
+        self.authorization = 'Bearer %s' % AccessToken.for_user(user)
+        self.paths = [path.format(owner=owner.id, pet=pet.id) for path in PATHS]
+        self.delay = options['client_delay']
+        self.requests = options['requests']
+        self.concurrency = options['concurrency']
+        self.host = options['host']
+
+        wsgi_application = get_wsgi_application()
+        asgi_application = get_asgi_application()
+        with ThreadPoolExecutor(max_workers=options['wsgi_threads']) as server_threads:
+            summary = asyncio.run(self.run(self.wsgi_request, wsgi_application, server_threads))
+        self.stdout.write(format_summary('wsgi', summary))
+        summary = asyncio.run(self.run(self.asgi_request, asgi_application))
+        self.stdout.write(format_summary('asgi', summary))
+
+    async def run(self, request, *args):
+        """
+        Issue self.requests requests from self.concurrency clients and
+        summarize them
+        """
+        latencies = []
+        errors = []
+        counter = iter(range(self.requests))
+
+        async def client():
+            for i in counter:
+                path = self.paths[i % len(self.paths)]
+                start = time.perf_counter()
+                status_code = await request(path, *args)
+                latencies.append(time.perf_counter() - start)
+                if status_code != 200:
+                    errors.append(status_code)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[client() for i in range(self.concurrency)])
+        return summarize(latencies, time.perf_counter() - start, len(errors))
+
+    async def wsgi_request(self, path, application, server_threads):
+        """
+        Queue the request for a server thread, which is held for the
+        client's delay as a threaded server would be
+        """
+        def serve():
+            if self.delay:
+                time.sleep(self.delay)
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': '/petclinic/' + path,
+                'QUERY_STRING': '',
+                'HTTP_AUTHORIZATION': self.authorization,
+                'HTTP_HOST': self.host,
+                'wsgi.input': io.BytesIO(),
+            }
+            setup_testing_defaults(environ)
+            status_line = []
+            response = application(environ, lambda status, headers, exc_info=None: status_line.append(status))
+            try:
+                for chunk in response:
+                    pass
+            finally:
+                response.close()
+            return int(status_line[0].split()[0])
+        return await asyncio.get_running_loop().run_in_executor(server_threads, serve)
+
+    async def asgi_request(self, path, application):
+        """
+        Call the ASGI app directly; a slow client only delays its own
+        request body
+        """
+        scope = {
+            'type': 'http',
+            'asgi': { 'version': '3.0' },
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': '/petclinic/async/' + path,
+            'root_path': '',
+            'query_string': b'',
+            'headers': [(b'host', self.host.encode('ascii')),
+                        (b'authorization', self.authorization.encode('ascii'))],
+            'server': ('127.0.0.1', 80),
+            'client': ('127.0.0.1', 0),
+        }
+        status_code = []
+
+        async def receive():
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            return { 'type': 'http.request', 'body': b'', 'more_body': False }
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status_code.append(message['status'])
+
+        await application(scope, receive, send)
+        return status_code[0]
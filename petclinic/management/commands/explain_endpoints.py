@@ -0,0 +1,121 @@
+import datetime
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from petclinic.models import Owner, Pet, Vet, Visit
+from petclinic.pagination import OptInCursorPagination
+
+# Index names reported in EXPLAIN output, Postgres first then SQLite
+INDEX_PATTERNS = [
+    re.compile(r'Index (?:Only )?Scan(?: Backward)? using (\S+)'),
+    re.compile(r'Bitmap Index Scan on (\S+)'),
+    re.compile(r'USING (?:COVERING )?INDEX (\S+)'),
+    re.compile(r'USING (INTEGER PRIMARY KEY)'),
+]
+FULL_SCAN_PATTERNS = [
+    re.compile(r'Seq Scan on (\S+)'),
+    re.compile(r'\bSCAN (?:TABLE )?(\w+)$', re.MULTILINE),
+]
+SORT_PATTERNS = [
+    re.compile(r'\bSort\b'),
+    re.compile(r'USE TEMP B-TREE FOR ORDER BY'),
+]
+
+
+def plan_summary(plan):
+    """
+    Return (indexes used, tables fully scanned, whether rows are sorted)
+    """
+    indexes = [name for pattern in INDEX_PATTERNS for name in pattern.findall(plan)]
+    full_scans = [name for pattern in FULL_SCAN_PATTERNS for name in pattern.findall(plan)]
+    sorted_rows = any(pattern.search(plan) for pattern in SORT_PATTERNS)
+    return indexes, full_scans, sorted_rows
+
+
+def endpoint_queries(owner_id, pet_id, state, since):
+    """
+    Return (name, queryset, expected index) for the queries behind each
+    endpoint, with the filters and ordering the views apply
+
+    The expected index is None where the primary key or foreign key index
+    Django creates is enough.
+    """
+    page = OptInCursorPagination.default_page_size
+    return [
+        ('owner-list page', Owner.objects.order_by('id')[:page], None),
+        ('owner-list ?state=', Owner.objects.filter(state=state).order_by('id')[:page],
+         'owner_state_id_idx'),
+        ('owner-detail', Owner.objects.filter(pk=owner_id), None),
+        ('owner-pet-list', Pet.objects.filter(owner=owner_id), None),
+        ('pet-visit-list', Visit.objects.filter(pet=pet_id).order_by('visit_date', 'id'),
+         'visit_pet_date_idx'),
+        ('visit-list ?since=&until=', Visit.objects.filter(visit_date__gte=since,
+                                                           visit_date__lt=since + datetime.timedelta(days=1))
+         .order_by('visit_date', 'id')[:page], 'visit_date_id_idx'),
+        ('vet-list ?state=', Vet.objects.filter(state=state).order_by('id')[:page],
+         'vet_state_id_idx'),
+        ('owners modified since', Owner.objects.filter(date_modified__gt=since)
+         .order_by('date_modified', 'id')[:page], 'owner_modified_id_idx'),
+        ('pets modified since', Pet.objects.filter(date_modified__gt=since)
+         .order_by('date_modified', 'id')[:page], 'pet_modified_id_idx'),
+        ('visits modified since', Visit.objects.filter(date_modified__gt=since)
+         .order_by('date_modified', 'id')[:page], 'visit_modified_id_idx'),
+        ('vets modified since', Vet.objects.filter(date_modified__gt=since)
+         .order_by('date_modified', 'id')[:page], 'vet_modified_id_idx'),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN on the query behind each API endpoint and reports the indexes used'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--state',
+            help='state to filter owners and vets on, default the first owner\'s state',
+        )
+        parser.add_argument(
+            '--no-seqscan',
+            action='store_true',
+            help='on Postgres, discourage sequential scans so small tables show which index would be used',
+        )
+        parser.add_argument(
+            '--strict',
+            action='store_true',
+            help='fail if a query does not use the index it needs',
+        )
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='print the full plan for every query',
+        )
+
+    def handle(self, *args, **options):
+        owner = Owner.objects.order_by('id').values('id', 'state').first() or { 'id': 1, 'state': 'CA' }
+        pet_id = Pet.objects.order_by('id').values_list('id', flat=True).first() or 1
+        state = options['state'] or owner['state']
+        since = timezone.now() - datetime.timedelta(days=1)
+        missing = []
+        with transaction.atomic():
+            if options['no_seqscan'] and connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, queryset, expected in endpoint_queries(owner['id'], pet_id, state, since):
+                plan = queryset.explain()
+                indexes, full_scans, sorted_rows = plan_summary(plan)
+                line = '%-26s index: %s' % (name, ', '.join(indexes) or '-')
+                if full_scans:
+                    line += '  full scan: %s' % ', '.join(full_scans)
+                if sorted_rows:
+                    line += '  sort'
+                if expected is not None and expected not in indexes:
+                    missing.append(name)
+                    self.stdout.write(self.style.WARNING(line + '  (expected %s)' % expected))
+                else:
+                    self.stdout.write(line)
+                if options['verbose_plans']:
+                    self.stdout.write(plan)
+        if missing and options['strict']:
+            raise CommandError('Queries not using their index: ' + ', '.join(missing))
@@ -0,0 +1,216 @@
+import asyncio
+import json
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from petclinic.benchmarking import format_summary, summarize
+from petclinic.loadgen import ConnectionPool, HTTPError, LoadResult, open_loop, timed_request
+
+DEFAULT_MIX = ('owner-detail=30,owner-pet-list=15,pet-detail=10,pet-visit-list=15,visit-detail=10,'
+               'owner-list=5,vet-list=5,create-visit=10')
+
+
+def parse_mix(value, choices):
+    """
+    Parse 'name=weight,...' into [(name, weight)]
+    """
+    mix = []
+    for item in value.split(','):
+        name, _, weight = item.strip().partition('=')
+        if name not in choices:
+            raise CommandError('Unknown request %r in --mix, choose from %s' % (name, ', '.join(sorted(choices))))
+        try:
+            weight = float(weight) if weight else 1.0
+        except ValueError:
+            raise CommandError('Bad weight for %s in --mix' % name)
+        if weight > 0:
+            mix.append((name, weight))
+    if not mix:
+        raise CommandError('--mix selects no requests')
+    return mix
+
+
+class Command(BaseCommand):
+    help = ('Sends an open loop, weighted mix of petclinic requests at a fixed rate to a running server '
+            'and reports latency percentiles corrected for coordinated omission, errors and throughput')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='server to load, default http://localhost:8000',
+            default='http://localhost:8000'
+        )
+        parser.add_argument(
+            '--email',
+            help='user to obtain tokens for from /api/token/',
+            required=True
+        )
+        parser.add_argument(
+            '--password',
+            help='password of that user',
+            required=True
+        )
+        parser.add_argument(
+            '--rate',
+            help='requests started per second, default 50',
+            type=float,
+            default=50.0
+        )
+        parser.add_argument(
+            '--duration',
+            help='seconds to send requests for, default 30',
+            type=float,
+            default=30.0
+        )
+        parser.add_argument(
+            '--connections',
+            help='most connections open at once, default 50',
+            type=int,
+            default=50
+        )
+        parser.add_argument(
+            '--mix',
+            help='weighted requests as name=weight,..., default %s' % DEFAULT_MIX,
+            default=DEFAULT_MIX
+        )
+        parser.add_argument(
+            '--timeout',
+            help='seconds before a request counts as failed, default 10',
+            type=float,
+            default=10.0
+        )
+        parser.add_argument(
+            '--seed',
+            help='seed for choosing requests and ids',
+        )
+        parser.add_argument(
+            '--output',
+            help='file to write the JSON results to',
+        )
+
+    def handle(self, *args, **options):
+        if options['rate'] <= 0 or options['duration'] <= 0 or options['connections'] < 1:
+            raise CommandError('--rate, --duration and --connections must be positive')
+        self.options = options
+        self.mix = parse_mix(options['mix'], self.request_names())
+        self.rng = random.Random(options['seed'])
+        try:
+            results, elapsed = asyncio.run(self.run())
+        except (OSError, HTTPError) as exc:
+            raise CommandError('Load test against %s failed: %s' % (options['url'], exc))
+        self.report(results, elapsed)
+
+    def request_names(self):
+        return ('owner-list', 'owner-detail', 'owner-pet-list', 'pet-detail', 'pet-visit-list', 'visit-list',
+                'visit-detail', 'vet-list', 'clinic-stats', 'async-owner-detail', 'async-pet-visit-list',
+                'create-visit')
+
+    def build_request(self, name):
+        """
+        Return (method, path, body) for one request of kind name
+        """
+        owner = self.rng.choice(self.owners)
+        pet = self.rng.choice(self.pets)
+        if name == 'create-visit':
+            body = { 'visit_date': timezone.now().isoformat(), 'description': 'Load test visit', 'pet': pet }
+            return 'POST', reverse('pet-visit-list', args=[pet]), json.dumps(body).encode('utf-8')
+        args = {
+            'owner-detail': [owner], 'owner-pet-list': [owner], 'async-owner-detail': [owner],
+            'pet-detail': [pet], 'pet-visit-list': [pet], 'async-pet-visit-list': [pet],
+            'visit-detail': [self.rng.choice(self.visits)],
+        }.get(name, [])
+        return 'GET', reverse(name, args=args), b''
+
+    async def run(self):
+        pool = ConnectionPool(self.options['url'], self.options['connections'])
+        try:
+            await self.login(pool)
+            await self.discover(pool)
+            refresher = asyncio.ensure_future(self.keep_token_fresh(pool))
+            names = [name for name, weight in self.mix]
+            weights = [weight for name, weight in self.mix]
+            results = dict((name, LoadResult()) for name in names)
+            completions = []
+
+            async def issue(scheduled):
+                name = self.rng.choices(names, weights)[0]
+                method, path, body = self.build_request(name)
+                headers = dict(self.headers, Accept='application/json')
+                if body:
+                    headers['Content-Type'] = 'application/json'
+                completions.append(await timed_request(pool, results[name], scheduled, method, path, headers,
+                                                       body, timeout=self.options['timeout']))
+
+            try:
+                start = await open_loop(self.options['rate'], self.options['duration'], issue)
+            finally:
+                refresher.cancel()
+            return results, max(completions) - start
+        finally:
+            pool.close()
+
+    async def login(self, pool):
+        tokens = await pool.request_json('POST', reverse('token_obtain_pair'), {
+            'email': self.options['email'], 'password': self.options['password'] })
+        self.refresh_token = tokens['refresh']
+        self.headers = { 'Authorization': 'Bearer %s' % tokens['access'] }
+
+    async def keep_token_fresh(self, pool, interval=60.0):
+        while True:
+            await asyncio.sleep(interval)
+            tokens = await pool.request_json('POST', reverse('token_refresh'), { 'refresh': self.refresh_token })
+            self.headers = { 'Authorization': 'Bearer %s' % tokens['access'] }
+
+    async def discover(self, pool):
+        """
+        Collect owner, pet and visit ids to request from the first page of owners
+        """
+        page = await pool.request_json('GET', reverse('owner-list') + '?page_size=200', headers=self.headers)
+        owners = page['results']
+        self.owners = [owner['id'] for owner in owners]
+        self.pets = [pet['id'] for owner in owners for pet in owner['pets']]
+        self.visits = [visit['id'] for owner in owners for pet in owner['pets'] for visit in pet['visits']]
+        if not self.visits:
+            raise CommandError('The server has no owner with a visited pet; run populate_db first')
+
+    def summarize(self, result, elapsed):
+        return summarize(result.latencies, elapsed, result.errors, result.timeouts)
+
+    def report(self, results, elapsed):
+        target = self.options['rate']
+        all_latencies = [latency for result in results.values() for latency in result.latencies]
+        all_service_times = [time for result in results.values() for time in result.service_times]
+        errors = sum(result.errors for result in results.values())
+        timeouts = sum(result.timeouts for result in results.values())
+        overall = summarize(all_latencies, elapsed, errors, timeouts)
+        service = summarize(all_service_times, elapsed, errors, timeouts)
+        self.stdout.write('Target %.1f req/s, achieved %.1f successful req/s, %d requests, %d errors (%.2f%%), '
+                          '%d timeouts' % (target, overall['rps'], overall['requests'], errors,
+                                           100.0 * overall['error_rate'], timeouts))
+        self.stdout.write('Latency from the scheduled start, corrected for coordinated omission:')
+        for name, result in sorted(results.items()):
+            self.stdout.write(format_summary(name, self.summarize(result, elapsed)))
+        self.stdout.write(format_summary('all', overall))
+        self.stdout.write('Service time from sending, not corrected:')
+        self.stdout.write(format_summary('all', service))
+        if timeouts:
+            self.stdout.write(self.style.WARNING(
+                '%d requests timed out after %gs and are left out of the percentiles, whose tail is '
+                'therefore too low' % (timeouts, self.options['timeout'])))
+        if overall['rps'] < target * 0.95:
+            self.stdout.write(self.style.WARNING('The server did not keep up with the target rate'))
+        if self.options['output']:
+            with open(self.options['output'], 'w') as f:
+                json.dump({
+                    'target_rps': target,
+                    'elapsed': elapsed,
+                    'overall': overall,
+                    'service_time': service,
+                    'requests': dict((name, dict(self.summarize(result, elapsed),
+                                                 statuses=dict((str(status), count)
+                                                               for status, count in result.statuses.items())))
+                                     for name, result in results.items()),
+                }, f, indent=2, sort_keys=True)
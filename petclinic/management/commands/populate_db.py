@@ -1,16 +1,114 @@
+import csv
+import datetime
+import io
+import os
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import pytz
+from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from petclinic.models import Owner, Pet, PetType, Vet, Specialty, Visit
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
 from faker import Faker
-from django.conf import settings
-fake = Faker()
-import random, os, pytz
+
+from petclinic.caching import invalidate_list_cache
+from petclinic.models import (Owner, OwnerPetStat, Pet, PetType, PetTypeVisitStat,
+                              Specialty, SpecialtyVetStat, Tombstone, Vet, Visit)
+from petclinic.stats import rebuild_stats
 
 MAX_PETS = 4
 MAX_VISITS = 10
 
+# Number of distinct values drawn from Faker per batch for each field; rows
+# sample from these pools instead of calling Faker for every field.
+POOL_SIZE = 200
+
+PET_TYPES = ['bird','cat','dog','fish','hamster','horse','iguana',
+             'lizard','mouse','pig','rabbit','rat','snake','tortoise','turtle']
+SPECIALTIES = ['dentistry','dermatology','emergency','imaging',
+               'radiology','surgery','vision']
+
 def get_pet_names():
-    f_names = open(os.path.join(settings.BASE_DIR, 'petclinic/management/commands/pet_names.txt'))
-    return [n.rstrip() for n in f_names.readlines()]
+    with open(os.path.join(settings.BASE_DIR, 'petclinic/management/commands/pet_names.txt')) as f_names:
+        return [n.rstrip() for n in f_names.readlines()]
+
+
+def batch_random(seed, kind, index):
+    """
+    Return (Random, Faker) seeded for one batch so output does not depend
+    on how batches are spread across workers
+    """
+    key = '%s-%s-%d' % (seed, kind, index)
+    fake = Faker()
+    fake.seed_instance(key)
+    return random.Random(key), fake
+
+
+def person_pools(fake):
+    return {
+        'first_name': [fake.first_name() for i in range(POOL_SIZE)],
+        'last_name': [fake.last_name() for i in range(POOL_SIZE)],
+        'street_address': [fake.street_address() for i in range(POOL_SIZE)],
+        'city': [fake.city() for i in range(POOL_SIZE)],
+        'state': [fake.state_abbr() for i in range(POOL_SIZE)],
+        'telephone': [fake.phone_number() for i in range(POOL_SIZE)],
+        'domain': [fake.free_email_domain() for i in range(10)],
+    }
+
+
+def person_row(rng, pools, index):
+    """
+    Return (email, first_name, last_name, street_address, city, state, telephone)
+
+    The row index is part of the email so emails stay unique at any scale.
+    """
+    first_name = rng.choice(pools['first_name'])
+    last_name = rng.choice(pools['last_name'])
+    email = '%s.%s.%d@%s' % (first_name.lower(), last_name.lower(), index, rng.choice(pools['domain']))
+    return (email, first_name, last_name, rng.choice(pools['street_address']),
+            rng.choice(pools['city']), rng.choice(pools['state']), rng.choice(pools['telephone']))
+
+
+def generate_vets(seed, index, start, count, specialty_count):
+    """
+    Generate vet rows start..start+count as (person fields..., specialty index)
+    """
+    rng, fake = batch_random(seed, 'vets', index)
+    pools = person_pools(fake)
+    return [person_row(rng, pools, i) + (rng.randrange(specialty_count),)
+            for i in range(start, start + count)]
+
+
+def generate_owners(seed, index, start, count, pet_names, pet_type_count, today):
+    """
+    Generate owners start..start+count with their pets and visits
+
+    Returns (owners, pets, visits) where pets reference owners and visits
+    reference pets by their position in this batch.
+    """
+    rng, fake = batch_random(seed, 'owners', index)
+    pools = person_pools(fake)
+    descriptions = [fake.paragraph(nb_sentences=4) for i in range(POOL_SIZE)]
+    now = datetime.datetime.combine(today, datetime.time(), tzinfo=pytz.utc)
+    owners, pets, visits = [], [], []
+    for i in range(start, start + count):
+        owners.append(person_row(rng, pools, i))
+        for p in range(rng.randrange(MAX_PETS) + 1):
+            birth_date = today - datetime.timedelta(days=rng.randint(30, 15 * 365))
+            pets.append((len(owners) - 1, rng.choice(pet_names), rng.randrange(pet_type_count), birth_date))
+            for v in range(1, rng.randrange(MAX_VISITS) + 1):
+                visit_date = now - datetime.timedelta(seconds=rng.randint(86400, 365 * 86400))
+                visits.append((len(pets) - 1, visit_date, rng.choice(descriptions)))
+    return owners, pets, visits
+
+
+def call(args):
+    function, function_args = args
+    return function(*function_args)
 
 
 class Command(BaseCommand):
@@ -28,19 +126,62 @@ class Command(BaseCommand):
             help='number of vets to create, default 50',
             type=int
         )
+        parser.add_argument(
+            '--scale',
+            help='multiply the owner and vet counts, default 1',
+            type=int,
+            default=1
+        )
+        parser.add_argument(
+            '--batch-size',
+            help='owners or vets generated and inserted per batch, default 1000',
+            type=int,
+            default=1000
+        )
+        parser.add_argument(
+            '--workers',
+            help='processes generating batches in parallel, default 1',
+            type=int,
+            default=1
+        )
+        parser.add_argument(
+            '--seed',
+            help='seed for reproducible data; dates are relative to the day of the run',
+        )
 
-    def handle(self, *args, **options):        
-        self.owner_count = options['owners'] if options['owners'] else 100
-        self.vet_count = options['vets'] if options['vets'] else 50
-        self.populate()
+    def handle(self, *args, **options):
+        owner_count = options['owners'] if options['owners'] else 100
+        vet_count = options['vets'] if options['vets'] else 50
+        if options['scale'] < 1 or options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--scale, --batch-size and --workers must be positive')
+        self.owner_count = owner_count * options['scale']
+        self.vet_count = vet_count * options['scale']
+        self.batch_size = options['batch_size']
+        self.workers = options['workers']
+        self.seed = options['seed'] if options['seed'] is not None else str(random.randrange(2 ** 32))
+        self.stdout.write('Using seed ' + self.seed)
+        if self.workers > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as self.executor:
+                self.populate()
+        else:
+            self.executor = None
+            self.populate()
         self.stdout.write(self.style.SUCCESS('Database populated'))
 
     def populate(self):
         self.clean_up_db()
+        self.now = timezone.now()
+        self.next_id = dict((model, 1) for model in (Owner, Pet, Vet, Visit))
         self.create_pet_types()
         self.create_specialties()
+        # bulk inserts send no signals, so drop the cached reference lists here
+        invalidate_list_cache(PetType)
+        invalidate_list_cache(Specialty)
         self.create_vets()
         self.create_owners()
+        self.reset_sequences()
+        # rows were copied in without signals, so count them in one pass
+        rebuild_stats()
         self.stdout.write(self.style.SUCCESS('PetType count: ' + str(PetType.objects.count())))
         self.stdout.write(self.style.SUCCESS('Specialty count: ' + str(Specialty.objects.count())))
         self.stdout.write(self.style.SUCCESS('Vet count: ' + str(Vet.objects.count())))
@@ -49,81 +190,117 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS('Visit count: ' + str(Visit.objects.count())))
 
     def clean_up_db(self):
-        PetType.objects.all().delete()
-        Specialty.objects.all().delete()
-        Vet.objects.all().delete()
-        Pet.objects.all().delete()
-        Owner.objects.all().delete()
-        Visit.objects.all().delete()
+        """
+        Empty the tables with plain DELETE statements, children first, so
+        nothing is loaded into memory to emulate cascades
+        """
+        with connection.cursor() as cursor:
+            for model in (PetTypeVisitStat, OwnerPetStat, SpecialtyVetStat, Tombstone,
+                          Visit, Pet, Owner, Vet, Specialty, PetType):
+                cursor.execute('DELETE FROM %s' % connection.ops.quote_name(model._meta.db_table))
+
+    def reset_sequences(self):
+        """
+        Primary keys are assigned here, so move the sequences past them
+        """
+        statements = connection.ops.sequence_reset_sql(no_style(), [PetType, Specialty, Vet, Owner, Pet, Visit])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
 
     def create_pet_types(self):
-        pet_type_list = ['bird','cat','dog','fish','hamster','horse','iguana',        
-                        'lizard','mouse','pig','rabbit','rat','snake','tortoise','turtle']
-        self.pet_types = []
-        for pt in pet_type_list:
-            pet_type = PetType.objects.create(name=pt)
-            self.pet_types.append(pet_type)
+        self.pet_types = PetType.objects.bulk_create([
+            PetType(id=i, name=pt, date_created=self.now, date_modified=self.now)
+            for i, pt in enumerate(PET_TYPES, 1)
+        ])
 
     def create_specialties(self):
-        specialty_list = ['dentistry','dermatology','emergency','imaging',
-                        'radiology','surgery','vision']
-        self.specialties = []
-        for sp in specialty_list:
-            specialty = Specialty.objects.create(name=sp)
-            self.specialties.append(specialty)
+        self.specialties = Specialty.objects.bulk_create([
+            Specialty(id=i, name=sp, date_created=self.now, date_modified=self.now)
+            for i, sp in enumerate(SPECIALTIES, 1)
+        ])
+
+    def batches(self, total):
+        for index, start in enumerate(range(0, total, self.batch_size)):
+            yield index, start, min(self.batch_size, total - start)
+
+    def generate(self, jobs):
+        """
+        Run generator jobs, in the process pool if more than one worker was
+        requested, yielding results in job order
+
+        Only a few jobs per worker are in flight at a time so generated rows
+        never pile up faster than they are inserted.
+        """
+        if self.executor is None:
+            for result in map(call, jobs):
+                yield result
+            return
+        while True:
+            window = list(islice(jobs, self.workers * 2))
+            if not window:
+                return
+            for result in self.executor.map(call, window):
+                yield result
 
     def create_vets(self):
-        self.vets = []
-        for i in range(0, self.vet_count):
-            specialty = self.specialties[random.randrange(len(self.specialties))]
-            vet = Vet.objects.create(
-                email=fake.email(),
-                first_name=fake.first_name(),
-                last_name=fake.last_name(),
-                street_address=fake.street_address(),
-                city=fake.city(),
-                state=fake.state_abbr(),
-                telephone=fake.phone_number(),
-                specialty=specialty
-            )
-            self.vets.append(vet)
-    
+        jobs = ((generate_vets, (self.seed, index, start, count, len(self.specialties)))
+                for index, start, count in self.batches(self.vet_count))
+        for rows in self.generate(jobs):
+            self.insert(Vet, ['email', 'first_name', 'last_name', 'street_address', 'city', 'state',
+                              'telephone', 'specialty_id'],
+                        [row[:7] + (self.specialties[row[7]].id,) for row in rows])
+
     def create_owners(self):
-        self.owners = []
-        for i in range(0, self.owner_count):
-            owner = Owner.objects.create(
-                email=fake.email(),
-                first_name=fake.first_name(),
-                last_name=fake.last_name(),
-                street_address=fake.street_address(),
-                city=fake.city(),
-                state=fake.state_abbr(),
-                telephone=fake.phone_number()                
-            )
-            self.owners.append(owner)
-            self.add_pets(owner)
-
-    def add_pets(self, owner):
-        names = get_pet_names()
-        pet_count = random.randrange(MAX_PETS) + 1
-        for i in range(0, pet_count):
-            name = names[random.randrange(len(names))]
-            pet_type = self.pet_types[random.randrange(len(self.pet_types))]
-            pet = Pet.objects.create(
-                name=name,
-                owner=owner,
-                pet_type=pet_type,
-                birth_date=fake.date_between(start_date='-15y', end_date='-30d')
-            )
-            self.add_visits(pet)
-
-    def add_visits(self, pet):
-        visit_count = random.randrange(MAX_VISITS) + 1
-        for i in range(1, visit_count):
-            visit_date = fake.date_time_between(start_date='-365d', end_date='-1d')
-            visit = Visit.objects.create(
-                pet=pet,
-                visit_date=pytz.utc.localize(visit_date),
-                description=fake.paragraph(nb_sentences=4)
-            )
+        pet_names = get_pet_names()
+        today = self.now.date()
+        jobs = ((generate_owners, (self.seed, index, start, count, pet_names, len(self.pet_types), today))
+                for index, start, count in self.batches(self.owner_count))
+        for owners, pets, visits in self.generate(jobs):
+            # no signals either, so the counters are filled in from the batch
+            pet_counts = Counter(pet[0] for pet in pets)
+            visit_counts = Counter(visit[0] for visit in visits)
+            last_visits = {}
+            for pet, visit_date, description in visits:
+                last_visits[pet] = max(visit_date, last_visits.get(pet, visit_date))
+            with transaction.atomic():
+                owner_ids = self.insert(Owner, ['email', 'first_name', 'last_name', 'street_address',
+                                                'city', 'state', 'telephone', 'pet_count'],
+                                        [owner + (pet_counts[i],) for i, owner in enumerate(owners)])
+                pet_ids = self.insert(Pet, ['owner_id', 'name', 'pet_type_id', 'birth_date', 'visit_count',
+                                            'last_visit_date'],
+                                      [(owner_ids[owner], name, self.pet_types[pet_type].id, birth_date,
+                                        visit_counts[i], last_visits.get(i))
+                                       for i, (owner, name, pet_type, birth_date) in enumerate(pets)])
+                self.insert(Visit, ['pet_id', 'visit_date', 'description'],
+                            [(pet_ids[pet], visit_date, description) for pet, visit_date, description in visits])
+            self.stdout.write('Owners created: %d' % (self.next_id[Owner] - 1))
+
+    def insert(self, model, columns, rows):
+        """
+        Insert rows with explicit ids and timestamps, returning the ids
+
+        Uses COPY on Postgres and bulk_create elsewhere.
+        """
+        first_id = self.next_id[model]
+        ids = list(range(first_id, first_id + len(rows)))
+        self.next_id[model] = first_id + len(rows)
+        if connection.vendor == 'postgresql':
+            self.copy(model, ['id'] + columns + ['date_created', 'date_modified'],
+                      [(pk,) + tuple(row) + (self.now, self.now) for pk, row in zip(ids, rows)])
+        else:
+            model.objects.bulk_create([
+                model(id=pk, date_created=self.now, date_modified=self.now, **dict(zip(columns, row)))
+                for pk, row in zip(ids, rows)
+            ], batch_size=self.batch_size)
+        return ids
 
+    def copy(self, model, columns, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        sql = 'COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (
+            connection.ops.quote_name(model._meta.db_table),
+            ', '.join(connection.ops.quote_name(column) for column in columns))
+        with connection.cursor() as cursor:
+            cursor.copy_expert(sql, buffer)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from petclinic.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Deletes the delete records kept for sync clients once they are older than PETCLINIC_TOMBSTONE_RETENTION_DAYS'
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones()
+        self.stdout.write(self.style.SUCCESS('Pruned %d tombstones' % deleted))
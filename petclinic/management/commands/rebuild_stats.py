@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from petclinic.models import OwnerPetStat, PetTypeVisitStat, SpecialtyVetStat
+from petclinic.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the clinic statistics tables from the owner, pet, visit and vet tables'
+
+    def handle(self, *args, **options):
+        rebuild_stats()
+        self.stdout.write(self.style.SUCCESS('Statistics rebuilt: %d visit, %d owner and %d vet rows' % (
+            PetTypeVisitStat.objects.count(), OwnerPetStat.objects.count(), SpecialtyVetStat.objects.count())))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from petclinic.counters import recount
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the pet counts of owners and the visit counts and last visit dates of pets'
+
+    def handle(self, *args, **options):
+        owners, pets = recount()
+        self.stdout.write(self.style.SUCCESS('Counters recounted: fixed %d owners and %d pets' % (owners, pets)))
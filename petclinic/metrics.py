@@ -0,0 +1,285 @@
+"""
+Request metrics shared between worker processes
+
+Each process aggregates histograms and counters in memory. With
+PETCLINIC_METRICS_DIR set it also writes them to its own file there, at
+most every PETCLINIC_METRICS_FLUSH_INTERVAL seconds, and the /metrics
+endpoint merges the files of every process into one Prometheus text
+exposition, so any worker can answer the scrape without a shared service.
+Without it, /metrics shows the answering process only.
+
+Every process holds a lock on its file for as long as it lives. A process
+writing its first file takes over the files of exited processes, adding
+their counts to its own, so counters never go backwards and the
+directory does not fill up across restarts.
+"""
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+HISTOGRAMS = {
+    'petclinic_request_duration_seconds': ('Time from the request reaching the view stack to the response',
+                                           LATENCY_BUCKETS),
+    'petclinic_request_db_seconds': ('Time spent executing database queries per request', LATENCY_BUCKETS),
+    'petclinic_request_serialize_seconds': ('Time spent in serializers per request, queries excluded',
+                                            LATENCY_BUCKETS),
+    'petclinic_request_render_seconds': ('Time spent rendering the response body', LATENCY_BUCKETS),
+    'petclinic_request_db_queries': ('Database queries per request', QUERY_BUCKETS),
+}
+COUNTERS = {
+    'petclinic_requests_total': 'Requests handled',
+}
+
+
+def metrics_dir():
+    return getattr(settings, 'PETCLINIC_METRICS_DIR', None)
+
+
+def flush_interval():
+    return getattr(settings, 'PETCLINIC_METRICS_FLUSH_INTERVAL', 1.0)
+
+
+class Registry(object):
+    """
+    This process's histograms and counters, keyed by (name, labels)
+
+    labels is a tuple of (label, value) pairs. A histogram is stored as
+    per bucket (not cumulative) counts with an overflow slot, then sum
+    and count.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.claim_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        if getattr(self, 'lock_file', None) is not None:
+            # in a forked child this leaves the parent's lock in place
+            self.lock_file.close()
+        self.lock_file = None
+        self.pid = os.getpid()
+        # process ids are reused, so files are also named by a random token
+        self.name = '%d-%s' % (self.pid, uuid.uuid4().hex[:8])
+        self.histograms = {}
+        self.counters = {}
+        self.last_flush = time.monotonic()
+
+    def check_fork(self):
+        # a forked worker starts empty, its parent's counts are in the parent's file
+        if self.pid != os.getpid():
+            self.reset()
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        with self.lock:
+            self.check_fork()
+            key = (name, labels)
+            values = self.histograms.get(key)
+            if values is None:
+                values = self.histograms[key] = [0] * (len(buckets) + 3)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    break
+            else:
+                i = len(buckets)
+            values[i] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def inc(self, name, labels, amount=1):
+        with self.lock:
+            self.check_fork()
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            self.check_fork()
+            return {
+                'histograms': [[name, list(labels), list(values)] for (name, labels), values in self.histograms.items()],
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+            }
+
+    def flush(self, force=False):
+        """
+        Write this process's file if the flush interval has passed
+        """
+        directory = metrics_dir()
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_flush < flush_interval():
+            return
+        self.last_flush = now
+        with self.claim_lock:
+            if self.lock_file is None or os.path.dirname(self.lock_file.name) != directory:
+                self.claim(directory)
+                return
+        self.write(directory)
+
+    def claim(self, directory):
+        """
+        Lock this process's file in directory, taking over those of exited
+        processes, and write it
+        """
+        if self.lock_file is not None:
+            self.lock_file.close()
+        os.makedirs(directory, exist_ok=True)
+        with directory_lock(directory, exclusive=True):
+            self.lock_file = open(os.path.join(directory, '%s.lock' % self.name), 'w')
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self.take_over_exited(directory)
+            self.write(directory)
+
+    def write(self, directory):
+        path = os.path.join(directory, '%s.json' % self.name)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.%s-' % self.name)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.snapshot(), f)
+            # readers only ever see complete files
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def take_over_exited(self, directory):
+        """
+        Add the counts of exited processes to this one's and remove their
+        files; the caller holds the directory lock and writes this
+        process's file before releasing it
+        """
+        for filename in sorted(os.listdir(directory)):
+            name, ext = os.path.splitext(filename)
+            if filename.startswith('.') or ext != '.json' or name == self.name:
+                continue
+            lock_path = os.path.join(directory, '%s.lock' % name)
+            try:
+                with open(lock_path, 'a') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = { 'histograms': [], 'counters': [] }
+            with self.lock:
+                for series, labels, values in data['histograms']:
+                    key = (series, tuple(tuple(label) for label in labels))
+                    merged = self.histograms.get(key)
+                    if series in HISTOGRAMS and (merged is None or len(merged) == len(values)):
+                        self.histograms[key] = [a + b for a, b in zip(merged or [0] * len(values), values)]
+                for series, labels, value in data['counters']:
+                    key = (series, tuple(tuple(label) for label in labels))
+                    self.counters[key] = self.counters.get(key, 0) + value
+            os.unlink(os.path.join(directory, filename))
+            os.unlink(lock_path)
+
+
+@contextmanager
+def directory_lock(directory, exclusive=False):
+    """
+    Keep readers from seeing a take-over half done
+    """
+    with open(os.path.join(directory, '.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+registry = Registry()
+
+
+def collect():
+    """
+    Return (histograms, counters) summed over the files of all processes
+    """
+    registry.flush(force=True)
+    directory = metrics_dir()
+    if not directory:
+        return merge([registry.snapshot()])
+    with directory_lock(directory):
+        files = []
+        for filename in sorted(os.listdir(directory)):
+            if filename.startswith('.') or not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    files.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return merge(files)
+
+
+def merge(files):
+    histograms = {}
+    counters = {}
+    for data in files:
+        for name, labels, values in data['histograms']:
+            if name not in HISTOGRAMS:
+                continue
+            key = (name, tuple(tuple(label) for label in labels))
+            merged = histograms.get(key)
+            if merged is None or len(merged) != len(values):
+                histograms[key] = list(values)
+            else:
+                histograms[key] = [a + b for a, b in zip(merged, values)]
+        for name, labels, value in data['counters']:
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+    return histograms, counters
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, escape_label(value)) for name, value in pairs)
+
+
+def format_number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def render_prometheus():
+    """
+    Return every process's metrics in the Prometheus text format
+    """
+    histograms, counters = collect()
+    lines = []
+    for name, (description, buckets) in sorted(HISTOGRAMS.items()):
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s histogram' % name)
+        for (series_name, labels), values in sorted(histograms.items()):
+            if series_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (name, format_labels(labels, [('le', bound)]), cumulative))
+            lines.append('%s_sum%s %s' % (name, format_labels(labels), format_number(values[-2])))
+            lines.append('%s_count%s %d' % (name, format_labels(labels), values[-1]))
+    for name, description in sorted(COUNTERS.items()):
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s counter' % name)
+        for (series_name, labels), value in sorted(counters.items()):
+            if series_name == name:
+                lines.append('%s%s %s' % (name, format_labels(labels), format_number(value)))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,41 @@
+# Generated by Django 3.1.13 on 2026-10-17 21:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petclinic', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='owner',
+            index=models.Index(fields=['state', 'id'], name='owner_state_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='owner',
+            index=models.Index(fields=['date_modified', 'id'], name='owner_modified_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['date_modified', 'id'], name='pet_modified_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vet',
+            index=models.Index(fields=['state', 'id'], name='vet_state_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vet',
+            index=models.Index(fields=['date_modified', 'id'], name='vet_modified_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['pet', 'visit_date', 'id'], name='visit_pet_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['date_modified', 'id'], name='visit_modified_id_idx'),
+        ),
+    ]
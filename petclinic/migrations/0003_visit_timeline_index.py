@@ -0,0 +1,17 @@
+# Generated by Django 3.1.13 on 2026-10-17 21:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petclinic', '0002_endpoint_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['visit_date', 'id'], name='visit_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.1.13 on 2026-10-17 21:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petclinic', '0003_visit_timeline_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OwnerPetStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pet_count', models.IntegerField(unique=True)),
+                ('owner_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SpecialtyVetStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vet_count', models.IntegerField(default=0)),
+                ('specialty', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='petclinic.specialty')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PetTypeVisitStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('visit_count', models.IntegerField(default=0)),
+                ('pet_type', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='petclinic.pettype')),
+            ],
+            options={
+                'unique_together': {('pet_type', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.1.13 on 2026-10-17 22:16
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_rows(apps, schema_editor):
+    Owner = apps.get_model('petclinic', 'Owner')
+    Pet = apps.get_model('petclinic', 'Pet')
+    Visit = apps.get_model('petclinic', 'Visit')
+    Owner.objects.update(pet_count=Coalesce(Subquery(
+        Pet.objects.filter(owner=OuterRef('pk')).order_by().values('owner').annotate(pets=Count('pk')).values('pets'),
+        output_field=models.IntegerField()), 0))
+    Pet.objects.update(
+        visit_count=Coalesce(Subquery(
+            Visit.objects.filter(pet=OuterRef('pk')).order_by().values('pet').annotate(visits=Count('pk'))
+            .values('visits'), output_field=models.IntegerField()), 0),
+        last_visit_date=Subquery(Visit.objects.filter(pet=OuterRef('pk')).order_by('-visit_date')
+                                 .values('visit_date')[:1], output_field=models.DateTimeField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petclinic', '0005_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='owner',
+            name='pet_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='pet',
+            name='last_visit_date',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='pet',
+            name='visit_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_rows, migrations.RunPython.noop),
+    ]
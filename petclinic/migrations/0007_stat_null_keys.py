@@ -0,0 +1,48 @@
+# Generated by Django 3.1.13 on 2026-10-17 22:49
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def merge_null_rows(apps, schema_editor):
+    """
+    Fold rows duplicated by concurrent inserts of a NULL key into one
+    """
+    PetTypeVisitStat = apps.get_model('petclinic', 'PetTypeVisitStat')
+    SpecialtyVetStat = apps.get_model('petclinic', 'SpecialtyVetStat')
+    untyped = PetTypeVisitStat.objects.filter(pet_type=None)
+    for month in untyped.values_list('month', flat=True).distinct():
+        rows = untyped.filter(month=month).order_by('pk')
+        if rows.count() > 1:
+            total = rows.aggregate(total=Sum('visit_count'))['total']
+            first = rows.first()
+            rows.exclude(pk=first.pk).delete()
+            PetTypeVisitStat.objects.filter(pk=first.pk).update(visit_count=total)
+    unspecified = SpecialtyVetStat.objects.filter(specialty=None).order_by('pk')
+    if unspecified.count() > 1:
+        total = unspecified.aggregate(total=Sum('vet_count'))['total']
+        first = unspecified.first()
+        unspecified.exclude(pk=first.pk).delete()
+        SpecialtyVetStat.objects.filter(pk=first.pk).update(vet_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petclinic', '0006_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_null_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='pettypevisitstat',
+            constraint=models.UniqueConstraint(condition=models.Q(pet_type=None), fields=('month',), name='pettypevisitstat_untyped_month'),
+        ),
+        # a unique index on a NULL specialty would never collide, so index
+        # an expression that is the same for every row without one
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX specialtyvetstat_unspecified ON petclinic_specialtyvetstat '
+            '((specialty_id IS NULL)) WHERE specialty_id IS NULL',
+            'DROP INDEX specialtyvetstat_unspecified',
+        ),
+    ]
@@ -1,10 +1,105 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import functions
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 
+class Now(functions.Now):
+    """
+    The database's current time; on SQLite, which runs in this process,
+    the application's, with microseconds like the values save() stores
+    """
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # CURRENT_TIMESTAMP has whole seconds and STRFTIME('%f') milliseconds only
+        return '%s', [connection.ops.adapt_datetimefield_value(timezone.now())]
+
+
+class TimestampedQuerySet(models.QuerySet):
+    """
+    Bulk writes that keep date_created and date_modified like save() does
+
+    update() sets date_modified to the database's clock unless it is
+    given. bulk_create() and bulk_update() also set the timestamps on the
+    objects passed in, one value for the whole batch, so instances handed
+    back to serializers stay accurate.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        New rows get the current time; rows given a date_created, like
+        imported ones, keep their timestamps
+        """
+        objs = list(objs)
+        now = timezone.now()
+        for obj in objs:
+            if obj.date_created is None:
+                obj.date_created = obj.date_modified = now
+        return super(TimestampedQuerySet, self).bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        now = timezone.now()
+        for obj in objs:
+            obj.date_modified = now
+        fields = [name for name in fields if name != 'date_modified'] + ['date_modified']
+        return super(TimestampedQuerySet, self).bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        kwargs.setdefault('date_modified', Now())
+        return super(TimestampedQuerySet, self).update(**kwargs)
+
+
+class TimestampedModel(models.Model):
+    """
+    Base for models with date_created and date_modified
+
+    Subclasses list in counter_fields the columns that are kept by
+    relative UPDATEs (petclinic.counters); plain saves of loaded
+    instances leave them out so a stale in-memory value never overwrites
+    a concurrent change.
+
+    save() and delete() run in a transaction together with their signal
+    receivers, which keep the counters, statistics and tombstones, so a
+    failing receiver rolls the write back.
+    """
+    date_created = models.DateTimeField(editable=False)
+    date_modified = models.DateTimeField(default=timezone.now)
+
+    counter_fields = ()
+
+    objects = TimestampedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        """
+        On save update timestamps
+        """
+        now = timezone.now()
+        if self.date_created is None:
+            self.date_created = now
+        self.date_modified = now
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | { 'date_modified' }
+        elif self.counter_fields and not self._state.adding and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.counter_fields]
+        # Model.save() sends post_save after its own transaction has ended
+        using = kwargs.get('using') or router.db_for_write(self.__class__, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            return super(TimestampedModel, self).save(*args, **kwargs)
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(self.__class__, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            return super(TimestampedModel, self).delete(using=using, keep_parents=keep_parents)
+
+
 # User
 class User(AbstractUser):
     username = models.CharField(max_length=150, blank=True, null=True)
@@ -29,7 +124,7 @@ class UserProfile(models.Model):
 
 
 # Owner
-class Owner(models.Model):
+class Owner(TimestampedModel):
     email = models.EmailField(unique=True)
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
@@ -37,17 +132,16 @@ class Owner(models.Model):
     city = models.CharField(max_length=50)
     state = models.CharField(max_length=50)
     telephone = models.CharField(max_length=100)
-    date_created = models.DateTimeField(editable=False)
-    date_modified = models.DateTimeField(default=timezone.now)
+    # maintained by petclinic.counters; repair with manage.py recount
+    pet_count = models.IntegerField(default=0, editable=False)
 
-    def save(self, *args, **kwargs):
-        """
-        On save update timestamps
-        """
-        if not self.id:
-            self.date_created = timezone.now()
-        self.date_modified = timezone.now()
-        return super(Owner, self).save(*args, **kwargs)
+    counter_fields = ('pet_count',)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'id'], name='owner_state_id_idx'),
+            models.Index(fields=['date_modified', 'id'], name='owner_modified_id_idx'),
+        ]
 
     def full_name(self):
         return "%s %s" % (self.first_name, self.last_name)
@@ -56,25 +150,14 @@ class Owner(models.Model):
         return "%s, %s" % (self.full_name(), self.email)
 
 # Specialty
-class Specialty(models.Model):
+class Specialty(TimestampedModel):
     name = models.CharField(max_length=30, unique=True, null=False)
-    date_created = models.DateTimeField(editable=False)
-    date_modified = models.DateTimeField(default=timezone.now)
-
-    def save(self, *args, **kwargs):
-        """
-        On save update timestamps
-        """
-        if not self.id:
-            self.date_created = timezone.now()
-        self.date_modified = timezone.now()
-        return super(Specialty, self).save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
 # Vet
-class Vet(models.Model):
+class Vet(TimestampedModel):
     email = models.EmailField(unique=True)
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
@@ -83,17 +166,12 @@ class Vet(models.Model):
     state = models.CharField(max_length=50)
     telephone = models.CharField(max_length=100)  
     specialty = models.ForeignKey(Specialty, null=True, on_delete=models.SET_NULL, related_name='vets')
-    date_created = models.DateTimeField(editable=False)
-    date_modified = models.DateTimeField(default=timezone.now)
 
-    def save(self, *args, **kwargs):
-        """
-        On save update timestamps
-        """
-        if not self.id:
-            self.date_created = timezone.now()
-        self.date_modified = timezone.now()
-        return super(Vet, self).save(*args, **kwargs)
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'id'], name='vet_state_id_idx'),
+            models.Index(fields=['date_modified', 'id'], name='vet_modified_id_idx'),
+        ]
 
     def full_name(self):
         return "%s %s" % (self.first_name, self.last_name)
@@ -103,40 +181,28 @@ class Vet(models.Model):
 
     
 # Pet Type
-class PetType(models.Model):
+class PetType(TimestampedModel):
     name = models.CharField(max_length=32, unique=True)
-    date_created = models.DateTimeField(editable=False)
-    date_modified = models.DateTimeField(default=timezone.now)
-
-    def save(self, *args, **kwargs):
-        """
-        On save update timestamps
-        """
-        if not self.id:
-            self.date_created = timezone.now()
-        self.date_modified = timezone.now()
-        return super(PetType, self).save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
 # Pet
-class Pet(models.Model):
+class Pet(TimestampedModel):
     name = models.CharField(max_length=30, blank=False)
     birth_date = models.DateField()
     owner = models.ForeignKey(Owner, on_delete=models.CASCADE, related_name='pets')
     pet_type = models.ForeignKey(PetType, null=True, on_delete=models.SET_NULL, related_name='pets')
-    date_created = models.DateTimeField(editable=False)
-    date_modified = models.DateTimeField(default=timezone.now)
+    # maintained by petclinic.counters; repair with manage.py recount
+    visit_count = models.IntegerField(default=0, editable=False)
+    last_visit_date = models.DateTimeField(null=True, blank=True, editable=False)
 
-    def save(self, *args, **kwargs):
-        """
-        On save update timestamps
-        """
-        if not self.id:
-            self.date_created = timezone.now()
-        self.date_modified = timezone.now()
-        return super(Pet, self).save(*args, **kwargs)
+    counter_fields = ('visit_count', 'last_visit_date')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_modified', 'id'], name='pet_modified_id_idx'),
+        ]
 
     # FIXME
     def age(self):
@@ -150,18 +216,58 @@ class Pet(models.Model):
         return self.name
 
 # Visit
-class Visit(models.Model):
+class Visit(TimestampedModel):
     visit_date = models.DateTimeField()
     description = models.TextField(max_length=1000)
     pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='visits')
-    date_created = models.DateTimeField(editable=False)
-    date_modified = models.DateTimeField(default=timezone.now)
 
-    def save(self, *args, **kwargs):
-        """
-        On save update timestamps
-        """
-        if not self.id:
-            self.date_created = timezone.now()
-        self.date_modified = timezone.now()
-        return super(Visit, self).save(*args, **kwargs)
+    class Meta:
+        indexes = [
+            models.Index(fields=['pet', 'visit_date', 'id'], name='visit_pet_date_idx'),
+            models.Index(fields=['visit_date', 'id'], name='visit_date_id_idx'),
+            models.Index(fields=['date_modified', 'id'], name='visit_modified_id_idx'),
+        ]
+
+
+# Statistics
+# Summary tables kept up to date by petclinic.stats; rebuild them with
+# manage.py rebuild_stats
+class PetTypeVisitStat(models.Model):
+    pet_type = models.ForeignKey(PetType, null=True, on_delete=models.CASCADE, related_name='+')
+    month = models.DateField()
+    visit_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('pet_type', 'month')
+        constraints = [
+            # NULLs never collide in unique_together, so visits of pets
+            # without a type need their own key
+            models.UniqueConstraint(fields=['month'], condition=models.Q(pet_type=None),
+                                    name='pettypevisitstat_untyped_month'),
+        ]
+
+class OwnerPetStat(models.Model):
+    pet_count = models.IntegerField(unique=True)
+    owner_count = models.IntegerField(default=0)
+
+class SpecialtyVetStat(models.Model):
+    # migration 0007 adds an index allowing a single row for vets without a
+    # specialty, which Django 3.1 cannot declare here
+    specialty = models.OneToOneField(Specialty, null=True, on_delete=models.CASCADE, related_name='+')
+    vet_count = models.IntegerField(default=0)
+
+
+# Tombstone
+# Deleted rows, so that ?modified_since= sync clients can drop them too;
+# prune them with manage.py prune_tombstones
+class Tombstone(models.Model):
+    model = models.CharField(max_length=100)
+    object_id = models.IntegerField()
+    parent_id = models.IntegerField(null=True)
+    date_deleted = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'date_deleted'], name='tombstone_model_deleted_idx'),
+            models.Index(fields=['model', 'parent_id', 'date_deleted'], name='tombstone_parent_deleted_idx'),
+        ]
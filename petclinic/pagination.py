@@ -0,0 +1,157 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class OptInCursorPagination(CursorPagination):
+    """
+    Keyset pagination ordered on the primary key.
+
+    Only applied when the client asks for it with ?page_size= or ?cursor=,
+    so existing clients keep receiving a plain list. Each page is a single
+    indexed range scan (WHERE id > position LIMIT n) no matter how deep it is.
+    """
+    ordering = 'id'
+    page_size = None
+    default_page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_page_size(self, request):
+        page_size = super(OptInCursorPagination, self).get_page_size(request)
+        if page_size is None and self.cursor_query_param in request.query_params:
+            return self.default_page_size
+        return page_size
+
+
+class CursorPaginatedListMixin(object):
+    """
+    Opt-in cursor pagination for list views built directly on APIView
+    """
+    pagination_class = OptInCursorPagination
+
+    def list_response(self, queryset, serializer_class, **kwargs):
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        if page is None:
+            serializer = serializer_class(queryset, many=True, **kwargs)
+            return Response(serializer.data)
+        serializer = serializer_class(page, many=True, **kwargs)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class KeysetPagination(object):
+    """
+    Keyset pagination on (ordering_field, pk) in both directions.
+
+    The cursor holds a row's (ordering_field, pk) and the direction to
+    read from it, so each page is one range scan on an index over both
+    columns even where many rows share a value. Works on model instances
+    and .values() rows with a pk.
+    """
+    ordering_field = None
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request, field):
+        """
+        Return (value, pk, reverse) from the cursor, or None without one
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            value, pk = position[:2]
+            return field.to_python(value), int(pk), position[2:] == ['r']
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse=False):
+        if isinstance(row, dict):
+            value, pk = row[self.ordering_field], row['pk']
+        else:
+            value, pk = getattr(row, self.ordering_field), row.pk
+        value = value.isoformat() if hasattr(value, 'isoformat') else value
+        position = [value, pk, 'r'] if reverse else [value, pk]
+        return urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        field = queryset.model._meta.get_field(self.ordering_field)
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, field)
+        reverse = position is not None and position[2]
+        if reverse:
+            queryset = queryset.order_by('-' + self.ordering_field, '-pk')
+        else:
+            queryset = queryset.order_by(self.ordering_field, 'pk')
+        if position is not None:
+            value, pk, reverse = position
+            after = 'lt' if reverse else 'gt'
+            # the inclusive bound keeps the scan on the index, the OR resolves ties
+            queryset = queryset.filter(Q(**{ '%s__%s' % (self.ordering_field, after): value }) |
+                                       Q(**{ self.ordering_field: value, 'pk__' + after: pk }),
+                                       **{ '%s__%se' % (self.ordering_field, after): value })
+        rows = list(queryset[:page_size + 1])
+        self.page = rows[:page_size]
+        more = len(rows) > page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, more
+        else:
+            self.has_next, self.has_previous = more, position is not None
+        return self.page
+
+    def get_link(self, row, reverse):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(row, reverse))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.page[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.get_link(self.page[0], True)
+
+    def get_paginated_response(self, data):
+        return Response({ 'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data })
+
+
+class VisitTimelinePagination(KeysetPagination):
+    ordering_field = 'visit_date'
+
+
+class PetVisitPagination(VisitTimelinePagination):
+    """
+    Keyset pagination of a pet's visits in the order of the plain list.
+
+    Only applied when the client asks for it with ?page_size= or ?cursor=,
+    like OptInCursorPagination.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.page_size_query_param not in request.query_params
+                and self.cursor_query_param not in request.query_params):
+            return None
+        return super(PetVisitPagination, self).paginate_queryset(queryset, request, view)
@@ -0,0 +1,37 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.settings import api_settings
+from rest_framework.utils import json
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline delimited JSON, one value per line.
+
+    Returns a generator of (line_number, value) pairs read lazily from the
+    request body so large uploads are never held in memory at once. Lines
+    that are not valid JSON yield a ParseError as their value, letting the
+    view report them without rejecting the whole upload. Blank lines are
+    skipped.
+    """
+    media_type = 'application/x-ndjson'
+    strict = api_settings.STRICT_JSON
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        parse_constant = json.strict_constant if self.strict else None
+        return self.iter_lines(stream, encoding, parse_constant)
+
+    def iter_lines(self, stream, encoding, parse_constant):
+        if stream is None:
+            return
+        for line_number, raw in enumerate(stream, 1):
+            line = raw.decode(encoding).strip()
+            if not line:
+                continue
+            try:
+                yield line_number, json.loads(line, parse_constant=parse_constant)
+            except ValueError as exc:
+                yield line_number, ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,282 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """
+    Bounded, thread safe pool of DB-API connections
+
+    At most max_size connections exist at once; acquire() waits up to
+    timeout seconds for one to be released before raising PoolTimeout.
+    Idle connections are handed out most recently used first, so the
+    oldest idle ones are the ones closed after max_idle seconds (never
+    dropping below min_size), and every connection is closed once it is
+    max_lifetime seconds old. A connection idle for longer than
+    health_check_after seconds is checked before it is handed out.
+
+    Connections are tied to the process that opened them: after a fork
+    the child starts with an empty pool and leaves the inherited
+    sockets to the parent.
+    """
+
+    def __init__(self, connect, check, reset, close, min_size=0, max_size=10, timeout=30.0,
+                 max_idle=300.0, max_lifetime=3600.0, health_check_after=30.0):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError('Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1')
+        self.connect = connect
+        self.check = check
+        self.reset = reset
+        self.close_connection = close
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.condition = threading.Condition()
+        self.closed = False
+        self.start()
+
+    def start(self):
+        self.pid = os.getpid()
+        # idle entries are [connection, created, last_used], most recent last
+        self.idle = deque()
+        self.created = {}
+        self.size = 0
+        self.waiting = 0
+        self.counters = dict.fromkeys(('acquired', 'waits', 'timeouts', 'opened', 'closed',
+                                       'failed_checks'), 0)
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def check_pid(self):
+        if self.pid != os.getpid():
+            self.start()
+
+    def fill(self):
+        """
+        Open connections until min_size exist
+        """
+        while True:
+            with self.condition:
+                self.check_pid()
+                if self.closed or self.size >= self.min_size:
+                    return
+                self.size += 1
+            entry = self.open()
+            with self.condition:
+                self.idle.append(entry)
+                self.condition.notify()
+
+    def open(self):
+        """
+        Open a connection for a slot already counted in size
+        """
+        try:
+            connection = self.connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        now = time.monotonic()
+        with self.condition:
+            self.created[id(connection)] = now
+            self.counters['opened'] += 1
+        return [connection, now, now]
+
+    def forget(self, connection):
+        """
+        Stop counting a connection; call with the condition held
+        """
+        self.created.pop(id(connection), None)
+        self.size -= 1
+        self.counters['closed'] += 1
+        self.condition.notify()
+
+    def close_quietly(self, connection):
+        try:
+            self.close_connection(connection)
+        except Exception:
+            logger.debug('Error closing pooled connection', exc_info=True)
+
+    def discard(self, connection):
+        with self.condition:
+            self.forget(connection)
+        self.close_quietly(connection)
+
+    def expired_idle(self, now):
+        """
+        Remove and return idle connections past max_idle or max_lifetime;
+        call with the condition held and close them after releasing it
+        """
+        expired = []
+        kept = deque()
+        for entry in self.idle:
+            connection, created, last_used = entry
+            if now - created > self.max_lifetime or (now - last_used > self.max_idle and
+                                                      self.size > self.min_size):
+                self.forget(connection)
+                expired.append(connection)
+            else:
+                kept.append(entry)
+        self.idle = kept
+        return expired
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            expired = []
+            try:
+                with self.condition:
+                    self.check_pid()
+                    if self.closed:
+                        raise PoolTimeout('Connection pool is closed')
+                    while True:
+                        expired += self.expired_idle(time.monotonic())
+                        if self.idle or self.size < self.max_size:
+                            break
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.counters['timeouts'] += 1
+                            raise PoolTimeout('No connection available within %.1f seconds (max_size %d)'
+                                              % (self.timeout, self.max_size))
+                        waited = True
+                        self.waiting += 1
+                        try:
+                            self.condition.wait(remaining)
+                        finally:
+                            self.waiting -= 1
+                    entry = self.idle.pop() if self.idle else None
+                    if entry is None:
+                        self.size += 1
+            finally:
+                for connection in expired:
+                    self.close_quietly(connection)
+            if entry is None:
+                entry = self.open()
+            elif time.monotonic() - entry[2] > self.health_check_after and not self.healthy(entry[0]):
+                self.discard(entry[0])
+                continue
+            self.record_wait(time.monotonic() - start if waited else 0.0, waited)
+            return entry[0]
+
+    def healthy(self, connection):
+        try:
+            self.check(connection)
+            return True
+        except Exception:
+            logger.info('Discarding pooled connection that failed its health check', exc_info=True)
+            with self.condition:
+                self.counters['failed_checks'] += 1
+            return False
+
+    def record_wait(self, wait_time, waited):
+        with self.condition:
+            self.counters['acquired'] += 1
+            if waited:
+                self.counters['waits'] += 1
+                self.wait_time += wait_time
+                self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def release(self, connection):
+        with self.condition:
+            if self.pid != os.getpid() or id(connection) not in self.created:
+                # opened before a fork or by another pool, not ours to reuse
+                return
+            created = self.created[id(connection)]
+        now = time.monotonic()
+        if self.closed or now - created > self.max_lifetime:
+            self.discard(connection)
+            return
+        try:
+            self.reset(connection)
+        except Exception:
+            logger.info('Discarding pooled connection that could not be reset', exc_info=True)
+            self.discard(connection)
+            return
+        with self.condition:
+            self.idle.append([connection, created, now])
+            expired = self.expired_idle(now)
+            self.condition.notify()
+        for connection in expired:
+            self.close_quietly(connection)
+
+    def close(self):
+        """
+        Close idle connections and discard in use ones when released
+        """
+        with self.condition:
+            self.closed = True
+            idle = [entry[0] for entry in self.idle]
+            for connection in idle:
+                self.forget(connection)
+            self.idle = deque()
+            self.condition.notify_all()
+        for connection in idle:
+            self.close_quietly(connection)
+
+    def stats(self):
+        with self.condition:
+            stats = dict(self.counters)
+            stats.update({
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': self.size - len(self.idle),
+                'waiting': self.waiting,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'wait_time': self.wait_time,
+                'max_wait_time': self.max_wait_time,
+            })
+            return stats
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, key, factory):
+    """
+    Return the pool for a database alias and connection parameters,
+    creating it with factory() on first use
+    """
+    with _pools_lock:
+        pool = _pools.get((alias, key))
+        if pool is None or pool.closed:
+            pool = _pools[(alias, key)] = factory()
+    return pool
+
+
+def close_pools(alias):
+    """
+    Close and forget every pool for a database alias
+    """
+    with _pools_lock:
+        keys = [key for key in _pools if key[0] == alias]
+        pools = [_pools.pop(key) for key in keys]
+    for pool in pools:
+        pool.close()
+
+
+def pool_stats():
+    """
+    Return {alias: stats} for every open pool in this process
+    """
+    stats = {}
+    with _pools_lock:
+        pools = list(_pools.items())
+    for (alias, key), pool in pools:
+        stats.setdefault(alias, []).append(pool.stats())
+    return stats
@@ -0,0 +1,87 @@
+"""
+PostgreSQL backend drawing connections from a per-process pool
+
+Use it with CONN_MAX_AGE = 0 so Django hands the connection back at the
+end of every request; pool sizes and timeouts are read from the POOL
+entry of the database settings:
+
+    'POOL': {
+        'MIN_SIZE': 2,
+        'MAX_SIZE': 20,
+        'TIMEOUT': 10,
+        'MAX_IDLE': 300,
+        'MAX_LIFETIME': 3600,
+        'HEALTH_CHECK_AFTER': 30,
+    }
+"""
+from functools import partial
+
+from django.db.backends.postgresql import base, creation
+
+from petclinic.pool import ConnectionPool, PoolTimeout, close_pools, get_pool
+
+POOL_OPTIONS = {
+    'MIN_SIZE': 'min_size',
+    'MAX_SIZE': 'max_size',
+    'TIMEOUT': 'timeout',
+    'MAX_IDLE': 'max_idle',
+    'MAX_LIFETIME': 'max_lifetime',
+    'HEALTH_CHECK_AFTER': 'health_check_after',
+}
+
+
+def check_connection(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    if not connection.autocommit:
+        connection.rollback()
+
+
+def reset_connection(connection):
+    """
+    Roll back and reset session state before the connection is reused
+    """
+    if connection.closed:
+        raise base.Database.InterfaceError('connection already closed')
+    connection.reset()
+
+
+def close_connection(connection):
+    connection.close()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # pooled connections to the test database would block DROP DATABASE
+        close_pools(self.connection.alias)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def create_pool(self, conn_params):
+        options = dict((argument, self.settings_dict['POOL'][key])
+                       for key, argument in POOL_OPTIONS.items() if key in self.settings_dict.get('POOL', {}))
+        return ConnectionPool(partial(super().get_new_connection, conn_params), check_connection,
+                              reset_connection, close_connection, **options)
+
+    def get_pool(self, conn_params):
+        key = repr(sorted(conn_params.items()))
+        return get_pool(self.alias, key, partial(self.create_pool, conn_params))
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        try:
+            pool.fill()
+            connection = pool.acquire()
+        except PoolTimeout as exc:
+            raise base.Database.OperationalError(str(exc)) from exc
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.get_pool(self.get_connection_params()).release(self.connection)
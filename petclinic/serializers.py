@@ -1,55 +1,152 @@
+from django.db import connection, transaction
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 
+from petclinic import counters, stats
+from petclinic.fieldsets import SparseFieldsetMixin
+from petclinic.instrumentation import InstrumentedSerializerMixin
 from petclinic.models import (Owner, Pet, PetType, Specialty, User,
                               UserProfile, Vet, Visit)
 
 
-class PetTypeSerializer(serializers.ModelSerializer):
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key field resolving objects the view has already loaded
+
+    Views handling a list of items put { Model: { pk: instance } } in
+    context['related_objects'] so each item is validated without a query.
+    """
+
+    def to_internal_value(self, data):
+        related_objects = self.context.get('related_objects', {}).get(self.get_queryset().model)
+        if related_objects is None:
+            return super(PrefetchedPrimaryKeyRelatedField, self).to_internal_value(data)
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            return related_objects[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class PrefetchedUniqueValidator(UniqueValidator):
+    """
+    UniqueValidator answering from values the view has already looked up
+
+    Views handling a list of items put { field name: { value: pk or None } }
+    in context['unique_values'] so each item is validated without a query.
+    """
+
+    def __call__(self, value, serializer_field):
+        known = serializer_field.context.get('unique_values', {}).get(serializer_field.source)
+        if known is None or value not in known:
+            return super(PrefetchedUniqueValidator, self).__call__(value, serializer_field)
+        instance = getattr(serializer_field.parent, 'instance', None)
+        if known[value] is not None and (instance is None or known[value] != instance.pk):
+            raise serializers.ValidationError(self.message, code='unique')
+
+
+class PrefetchedUniqueFieldsMixin(object):
+    """
+    Check unique model fields with PrefetchedUniqueValidator
+    """
+
+    def build_standard_field(self, field_name, model_field):
+        field_class, field_kwargs = super(PrefetchedUniqueFieldsMixin, self).build_standard_field(
+            field_name, model_field)
+        if 'validators' in field_kwargs:
+            field_kwargs['validators'] = [
+                PrefetchedUniqueValidator(queryset=validator.queryset, message=validator.message)
+                if type(validator) is UniqueValidator else validator
+                for validator in field_kwargs['validators']]
+        return field_class, field_kwargs
+
+
+class BulkCreateListSerializer(serializers.ListSerializer):
+    """
+    Create every item with a single bulk_create inside one transaction
+
+    Statistics and counters are recorded here because bulk_create does not
+    call save() or send signals; the model's manager sets the timestamps.
+    Backends that cannot return primary keys from a bulk insert save the
+    rows one by one instead, still within the same transaction.
+    """
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        instances = [model(**item) for item in validated_data]
+        with transaction.atomic():
+            if connection.features.can_return_rows_from_bulk_insert:
+                model.objects.bulk_create(instances)
+            else:
+                with stats.creates_recorded_by_caller():
+                    for instance in instances:
+                        instance.save()
+            stats.record_created(model, instances)
+            counters.record_created(model, instances)
+        # new rows cannot have related rows yet, so render nested lists without querying
+        empty = dict((field.source, model._meta.get_field(field.source).related_model.objects.none())
+                     for field in self.child.fields.values()
+                     if isinstance(field, serializers.ListSerializer))
+        for instance in instances:
+            instance._prefetched_objects_cache = dict(empty)
+        return instances
+
+
+class PetTypeSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = PetType
         fields = ['id', 'name']
         read_only_fields = ('date_created', 'date_modified')
 
-class SpecialtySerializer(serializers.ModelSerializer):
+class SpecialtySerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Specialty
         fields = ['id', 'name']
         read_only_fields = ('date_created', 'date_modified')
 
-class VisitSerializer(serializers.ModelSerializer):
+class VisitSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
+    pet = PrefetchedPrimaryKeyRelatedField(queryset=Pet.objects.all())
     class Meta:
         model = Visit
         fields = ['id', 'visit_date', 'description', 'pet']
         read_only_fields = ('date_created', 'date_modified')
+        list_serializer_class = BulkCreateListSerializer
 
-class PetSerializer(serializers.ModelSerializer):
+class PetSerializer(InstrumentedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     visits = VisitSerializer(many=True, read_only=True)
-    pet_type = serializers.PrimaryKeyRelatedField(queryset=PetType.objects.all())
+    pet_type = PrefetchedPrimaryKeyRelatedField(queryset=PetType.objects.all())
+    owner = PrefetchedPrimaryKeyRelatedField(queryset=Owner.objects.all())
     class Meta:
         model = Pet
-        fields = ['id', 'name', 'pet_type', 'visits', 'birth_date', 'owner']
+        fields = ['id', 'name', 'pet_type', 'visits', 'birth_date', 'owner', 'visit_count', 'last_visit_date']
         read_only_fields = ('date_created', 'date_modified')
+        list_serializer_class = BulkCreateListSerializer
 
-class OwnerSerializer(serializers.ModelSerializer):
+class OwnerSerializer(InstrumentedSerializerMixin, SparseFieldsetMixin, PrefetchedUniqueFieldsMixin,
+                      serializers.ModelSerializer):
     pets = PetSerializer(many=True, read_only=True)
     class Meta:
         model = Owner
-        fields = ['id', 'email', 'first_name', 'last_name', 'street_address', 'city', 'state', 'telephone', 'pets']
+        fields = ['id', 'email', 'first_name', 'last_name', 'street_address', 'city', 'state', 'telephone', 'pets',
+                  'pet_count']
         read_only_fields = ('date_created', 'date_modified')
 
-class VetSerializer(serializers.ModelSerializer):
+class VetSerializer(InstrumentedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     specialty = serializers.PrimaryKeyRelatedField(queryset=Specialty.objects.all())
     class Meta:
         model = Vet
         fields = ['id', 'email', 'first_name', 'last_name', 'street_address', 'city', 'state', 'telephone', 'specialty']
         read_only_fields = ('date_created', 'date_modified')
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = UserProfile
         fields = ['title', 'dob', 'address', 'country', 'city', 'zip', 'photo']
 
-class UserSerializer(serializers.HyperlinkedModelSerializer):
+class UserSerializer(InstrumentedSerializerMixin, serializers.HyperlinkedModelSerializer):
     profile = UserProfileSerializer(required=True)
 
     class Meta:
@@ -0,0 +1,41 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+
+from petclinic import counters, stats, sync
+from petclinic.authentication import invalidate_user_tokens
+from petclinic.caching import invalidate_list_cache
+from petclinic.instrumentation import install_query_recorder
+from petclinic.models import Owner, Pet, PetType, Specialty, User, Vet, Visit
+
+
+def connect_signals():
+    for model in (Specialty, PetType):
+        post_save.connect(invalidate_list_cache, sender=model, dispatch_uid='list-cache-save-%s' % model.__name__)
+        post_delete.connect(invalidate_list_cache, sender=model, dispatch_uid='list-cache-delete-%s' % model.__name__)
+    post_save.connect(invalidate_user_tokens, sender=User, dispatch_uid='token-cache-save-user')
+    post_delete.connect(invalidate_user_tokens, sender=User, dispatch_uid='token-cache-delete-user')
+    for model in (Visit, Pet, Vet):
+        pre_save.connect(stats.remember_old_values, sender=model, dispatch_uid='stats-pre-save-%s' % model.__name__)
+    for model, saved, deleted in ((Visit, stats.visit_saved, stats.visit_deleted),
+                                  (Pet, stats.pet_saved, stats.pet_deleted),
+                                  (Owner, stats.owner_saved, stats.owner_deleted),
+                                  (Vet, stats.vet_saved, stats.vet_deleted)):
+        post_save.connect(saved, sender=model, dispatch_uid='stats-save-%s' % model.__name__)
+        signal = pre_delete if model is Visit else post_delete
+        signal.connect(deleted, sender=model, dispatch_uid='stats-delete-%s' % model.__name__)
+    pre_delete.connect(stats.owner_deleting, sender=Owner, dispatch_uid='stats-deleting-Owner')
+    pre_delete.connect(stats.pet_type_deleted, sender=PetType, dispatch_uid='stats-delete-PetType')
+    pre_delete.connect(stats.specialty_deleted, sender=Specialty, dispatch_uid='stats-delete-Specialty')
+    for model, saved, deleted in ((Visit, counters.visit_saved, counters.visit_deleted),
+                                  (Pet, counters.pet_saved, counters.pet_deleted),
+                                  (Owner, None, counters.owner_deleted)):
+        if saved is not None:
+            post_save.connect(saved, sender=model, dispatch_uid='counters-save-%s' % model.__name__)
+        post_delete.connect(deleted, sender=model, dispatch_uid='counters-delete-%s' % model.__name__)
+    for model in (Owner, Pet):
+        pre_delete.connect(counters.parent_deleting, sender=model, dispatch_uid='counters-deleting-%s' % model.__name__)
+    for model in (Owner, Pet, Visit, Vet):
+        post_delete.connect(sync.record_tombstone, sender=model, dispatch_uid='sync-tombstone-%s' % model.__name__)
+    for model in (Pet, Visit):
+        post_save.connect(sync.record_move, sender=model, dispatch_uid='sync-move-%s' % model.__name__)
+    connection_created.connect(install_query_recorder, dispatch_uid='instrumentation-query-recorder')
@@ -0,0 +1,346 @@
+"""
+Incrementally maintained clinic statistics
+
+Three summary tables answer the dashboard questions in a handful of rows:
+visits per pet type per month, owners per number of pets and vets per
+specialty. Signal receivers adjust them as visits, pets, owners and vets
+are saved or deleted, and record_created(), record_updated() and
+record_deleting() cover bulk inserts, updates and deletes, which send no
+signals. rebuild_stats() recomputes everything from scratch.
+"""
+import datetime
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncMonth
+
+from petclinic.models import (Owner, OwnerPetStat, Pet, PetTypeVisitStat,
+                              SpecialtyVetStat, Vet, Visit)
+
+_local = threading.local()
+
+
+def deleting_owners():
+    """
+    Owners whose delete is in progress in this thread
+
+    Cascaded rows are deleted in no particular order, so their receivers
+    check this instead of what is still in the database.
+    """
+    if not hasattr(_local, 'deleting_owners'):
+        _local.deleting_owners = set()
+    return _local.deleting_owners
+
+
+@contextmanager
+def creates_recorded_by_caller():
+    """
+    Make the save receivers ignore new rows; the caller counts them all
+    at once with record_created()
+    """
+    previous = getattr(_local, 'skip_creates', False)
+    _local.skip_creates = True
+    try:
+        yield
+    finally:
+        _local.skip_creates = previous
+
+
+def skip_create(created, raw):
+    return raw or (created and getattr(_local, 'skip_creates', False))
+
+
+def month_of(value):
+    """
+    Return the first day of value's month in UTC
+    """
+    if isinstance(value, datetime.datetime):
+        value = value.astimezone(datetime.timezone.utc).date()
+    return value.replace(day=1)
+
+
+def bump(model, field, delta, **key):
+    """
+    Add delta to field of the row matching key, creating the row if needed
+    """
+    if not delta:
+        return
+    if model.objects.filter(**key).update(**{ field: F(field) + delta }):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**dict(key, **{ field: delta }))
+    except IntegrityError:
+        model.objects.filter(**key).update(**{ field: F(field) + delta })
+
+
+def apply_visit_counts(counts):
+    """
+    Apply {(pet_type_id, month): delta} to the visit statistics
+    """
+    for (pet_type_id, month), delta in counts.items():
+        bump(PetTypeVisitStat, 'visit_count', delta, pet_type_id=pet_type_id, month=month)
+
+
+def move_owner(pet_count_before, pet_count_after):
+    """
+    Move one owner between pet count buckets
+    """
+    if pet_count_before == pet_count_after:
+        return
+    if pet_count_before is not None:
+        bump(OwnerPetStat, 'owner_count', -1, pet_count=pet_count_before)
+    if pet_count_after is not None:
+        bump(OwnerPetStat, 'owner_count', 1, pet_count=pet_count_after)
+
+
+def pet_counts(owner_ids):
+    """
+    Return {owner_id: pets}, locking the owners first so concurrent
+    changes to one owner's pets move it between buckets one at a time
+    """
+    list(Owner.objects.select_for_update().filter(pk__in=owner_ids).order_by('pk').values_list('pk'))
+    counts = dict((owner_id, 0) for owner_id in owner_ids)
+    counts.update(Pet.objects.filter(owner_id__in=owner_ids).values_list('owner_id')
+                  .annotate(pets=Count('id')).order_by())
+    return counts
+
+
+def pet_type_of(pet_id):
+    return Pet.objects.filter(pk=pet_id).values_list('pet_type_id', flat=True).first()
+
+
+def visit_months(pet_id):
+    """
+    Return {month: visits} for one pet
+    """
+    rows = (Visit.objects.filter(pet_id=pet_id)
+            .annotate(month=TruncMonth('visit_date', tzinfo=datetime.timezone.utc))
+            .values_list('month').annotate(visits=Count('id')).order_by())
+    return dict((month_of(month), visits) for month, visits in rows)
+
+
+def record_created(model, instances):
+    """
+    Count rows inserted with bulk_create, which sends no signals
+    """
+    if model is Visit:
+        pet_types = dict(Pet.objects.filter(pk__in=set(visit.pet_id for visit in instances))
+                         .values_list('id', 'pet_type_id'))
+        apply_visit_counts(Counter((pet_types.get(visit.pet_id), month_of(visit.visit_date))
+                                   for visit in instances))
+    elif model is Pet:
+        added = Counter(pet.owner_id for pet in instances)
+        for owner_id, pets in pet_counts(list(added)).items():
+            move_owner(pets - added[owner_id], pets)
+    elif model is Owner:
+        bump(OwnerPetStat, 'owner_count', len(instances), pet_count=0)
+    elif model is Vet:
+        for specialty_id, vets in Counter(vet.specialty_id for vet in instances).items():
+            bump(SpecialtyVetStat, 'vet_count', vets, specialty_id=specialty_id)
+
+
+def record_updated(model, changes):
+    """
+    Count rows changed with bulk_update, which sends no signals; changes
+    are (instance, old) pairs, old holding the TRACKED_FIELDS values
+    stored before the update
+    """
+    if model is Visit:
+        pet_types = dict(Pet.objects.filter(pk__in=set(pet_id for visit, old in changes
+                                                       for pet_id in (visit.pet_id, old['pet_id'])))
+                         .values_list('id', 'pet_type_id'))
+        counts = Counter()
+        for visit, old in changes:
+            counts[(pet_types.get(old['pet_id']), month_of(old['visit_date']))] -= 1
+            counts[(pet_types.get(visit.pet_id), month_of(visit.visit_date))] += 1
+        apply_visit_counts(counts)
+    elif model is Pet:
+        moved = Counter()
+        for pet, old in changes:
+            if old['owner_id'] != pet.owner_id:
+                moved[old['owner_id']] -= 1
+                moved[pet.owner_id] += 1
+        for owner_id, pets in pet_counts(list(moved)).items():
+            move_owner(pets - moved[owner_id], pets)
+        retyped = dict((pet.pk, (old['pet_type_id'], pet.pet_type_id)) for pet, old in changes
+                       if old['pet_type_id'] != pet.pet_type_id)
+        if retyped:
+            rows = (Visit.objects.filter(pet_id__in=retyped)
+                    .annotate(month=TruncMonth('visit_date', tzinfo=datetime.timezone.utc))
+                    .values_list('pet_id', 'month').annotate(visits=Count('id')).order_by())
+            counts = Counter()
+            for pet_id, month, visits in rows:
+                old_type, new_type = retyped[pet_id]
+                counts[(old_type, month_of(month))] -= visits
+                counts[(new_type, month_of(month))] += visits
+            apply_visit_counts(counts)
+
+
+def record_deleting(model, ids):
+    """
+    Uncount owners or pets about to be deleted, with their pets and
+    visits, by set based DELETEs, which send no signals
+    """
+    if model is Owner:
+        pets = Pet.objects.filter(owner_id__in=ids)
+        for pet_count, owners in Counter(pet_counts(ids).values()).items():
+            bump(OwnerPetStat, 'owner_count', -owners, pet_count=pet_count)
+    else:
+        pets = Pet.objects.filter(pk__in=ids)
+        removed = Counter(pets.values_list('owner_id', flat=True))
+        for owner_id, count in pet_counts(list(removed)).items():
+            move_owner(count, count - removed[owner_id])
+    visits = (Visit.objects.filter(pet__in=pets)
+              .annotate(month=TruncMonth('visit_date', tzinfo=datetime.timezone.utc))
+              .values_list('pet__pet_type_id', 'month').annotate(visits=Count('id')).order_by())
+    apply_visit_counts(dict(((pet_type_id, month_of(month)), -count) for pet_type_id, month, count in visits))
+
+
+# The stored values the statistics, counters and sync receivers depend on
+TRACKED_FIELDS = { Visit: ('pet_id', 'visit_date'), Pet: ('owner_id', 'pet_type_id'), Vet: ('specialty_id',) }
+
+
+def tracked_values(instance):
+    return dict((name, getattr(instance, name)) for name in TRACKED_FIELDS.get(type(instance), ()))
+
+
+def remember_old_values(sender, instance, raw=False, **kwargs):
+    """
+    pre_save receiver keeping the stored values the statistics depend on
+    """
+    if raw or instance._state.adding or instance.pk is None:
+        instance._stats_old = None
+        return
+    instance._stats_old = sender.objects.filter(pk=instance.pk).values(*TRACKED_FIELDS[sender]).first()
+
+
+def visit_saved(sender, instance, created, raw=False, **kwargs):
+    if skip_create(created, raw):
+        return
+    old = getattr(instance, '_stats_old', None)
+    counts = Counter()
+    if not created and old is not None:
+        if old['pet_id'] == instance.pet_id and month_of(old['visit_date']) == month_of(instance.visit_date):
+            return
+        counts[(pet_type_of(old['pet_id']), month_of(old['visit_date']))] -= 1
+    counts[(pet_type_of(instance.pet_id), month_of(instance.visit_date))] += 1
+    apply_visit_counts(counts)
+
+
+def visit_deleted(sender, instance, **kwargs):
+    """
+    pre_delete receiver, the pet may be gone by post_delete
+    """
+    apply_visit_counts({ (pet_type_of(instance.pet_id), month_of(instance.visit_date)): -1 })
+
+
+def pet_saved(sender, instance, created, raw=False, **kwargs):
+    if skip_create(created, raw):
+        return
+    old = getattr(instance, '_stats_old', None)
+    if created or old is None:
+        record_created(Pet, [instance])
+        return
+    if old['owner_id'] != instance.owner_id:
+        counts = pet_counts([old['owner_id'], instance.owner_id])
+        move_owner(counts[old['owner_id']] + 1, counts[old['owner_id']])
+        move_owner(counts[instance.owner_id] - 1, counts[instance.owner_id])
+    if old['pet_type_id'] != instance.pet_type_id:
+        counts = Counter()
+        for month, visits in visit_months(instance.pk).items():
+            counts[(old['pet_type_id'], month)] -= visits
+            counts[(instance.pet_type_id, month)] += visits
+        apply_visit_counts(counts)
+
+
+def pet_deleted(sender, instance, **kwargs):
+    if instance.owner_id in deleting_owners() or not Owner.objects.filter(pk=instance.owner_id).exists():
+        # the owner's bucket was already dropped by owner_deleting
+        return
+    pets = pet_counts([instance.owner_id])[instance.owner_id]
+    move_owner(pets + 1, pets)
+
+
+def owner_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not skip_create(created, raw):
+        record_created(Owner, [instance])
+
+
+def owner_deleting(sender, instance, **kwargs):
+    """
+    pre_delete receiver, runs before any cascaded pet is deleted
+    """
+    deleting_owners().add(instance.pk)
+    move_owner(pet_counts([instance.pk])[instance.pk], None)
+
+
+def owner_deleted(sender, instance, **kwargs):
+    deleting_owners().discard(instance.pk)
+
+
+def vet_saved(sender, instance, created, raw=False, **kwargs):
+    if skip_create(created, raw):
+        return
+    old = getattr(instance, '_stats_old', None)
+    if created or old is None:
+        record_created(Vet, [instance])
+    elif old['specialty_id'] != instance.specialty_id:
+        bump(SpecialtyVetStat, 'vet_count', -1, specialty_id=old['specialty_id'])
+        bump(SpecialtyVetStat, 'vet_count', 1, specialty_id=instance.specialty_id)
+
+
+def vet_deleted(sender, instance, **kwargs):
+    bump(SpecialtyVetStat, 'vet_count', -1, specialty_id=instance.specialty_id)
+
+
+def pet_type_deleted(sender, instance, **kwargs):
+    """
+    Pets of a deleted type are set to no type without signals, so move
+    their visit counts before the type's rows are cascaded away
+    """
+    for month, visits in PetTypeVisitStat.objects.filter(pet_type=instance).values_list('month', 'visit_count'):
+        bump(PetTypeVisitStat, 'visit_count', visits, pet_type=None, month=month)
+
+
+def specialty_deleted(sender, instance, **kwargs):
+    vets = SpecialtyVetStat.objects.filter(specialty=instance).values_list('vet_count', flat=True).first()
+    if vets:
+        bump(SpecialtyVetStat, 'vet_count', vets, specialty=None)
+
+
+def rebuild_stats():
+    """
+    Recompute every summary table from the base tables
+    """
+    quote = connection.ops.quote_name
+    owner_buckets_sql = (
+        'SELECT pets, COUNT(*) FROM (SELECT o.%(id)s, COUNT(p.%(id)s) AS pets FROM %(owner)s o '
+        'LEFT JOIN %(pet)s p ON p.%(owner_id)s = o.%(id)s GROUP BY o.%(id)s) counts GROUP BY pets' % {
+            'id': quote('id'),
+            'owner': quote(Owner._meta.db_table),
+            'pet': quote(Pet._meta.db_table),
+            'owner_id': quote(Pet._meta.get_field('owner').column),
+        })
+    with transaction.atomic():
+        PetTypeVisitStat.objects.all().delete()
+        OwnerPetStat.objects.all().delete()
+        SpecialtyVetStat.objects.all().delete()
+        visits = (Visit.objects.annotate(month=TruncMonth('visit_date', tzinfo=datetime.timezone.utc))
+                  .values_list('pet__pet_type_id', 'month').annotate(visits=Count('id')).order_by())
+        PetTypeVisitStat.objects.bulk_create([
+            PetTypeVisitStat(pet_type_id=pet_type_id, month=month_of(month), visit_count=count)
+            for pet_type_id, month, count in visits
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute(owner_buckets_sql)
+            OwnerPetStat.objects.bulk_create([
+                OwnerPetStat(pet_count=pets, owner_count=owners) for pets, owners in cursor.fetchall()
+            ])
+        SpecialtyVetStat.objects.bulk_create([
+            SpecialtyVetStat(specialty_id=specialty_id, vet_count=count)
+            for specialty_id, count in Vet.objects.values_list('specialty_id').annotate(Count('id')).order_by()
+        ])
@@ -0,0 +1,70 @@
+from itertools import islice
+
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+
+def iter_chunks(queryset, chunk_size):
+    """
+    Yield lists of at most chunk_size instances from queryset.
+
+    Rows are read with QuerySet.iterator(), which uses a server side cursor
+    on Postgres, so only one chunk is held in memory at a time. iterator()
+    ignores prefetch_related(), so the queryset's prefetch lookups are
+    applied to each chunk instead.
+    """
+    lookups = queryset._prefetch_related_lookups
+    rows = queryset.prefetch_related(None).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        if lookups:
+            prefetch_related_objects(chunk, *lookups)
+        yield chunk
+
+
+def stream_json_array(queryset, serializer_class, chunk_size, **kwargs):
+    """
+    Yield the JSON array for queryset a chunk of serialized rows at a time
+    """
+    renderer = JSONRenderer()
+    separator = b''
+    yield b'['
+    for chunk in iter_chunks(queryset, chunk_size):
+        data = serializer_class(chunk, many=True, **kwargs).data
+        # strip the enclosing brackets so chunks join into a single array
+        yield separator + renderer.render(data)[1:-1]
+        separator = b','
+    yield b']'
+
+
+class StreamingListMixin(object):
+    """
+    Stream list responses as JSON array fragments when ?stream=true is given
+
+    Works with APIView list views using list_response() and with
+    generics.ListAPIView subclasses. Streamed responses are not paginated.
+    """
+    stream_query_param = 'stream'
+    stream_chunk_size = 500
+
+    def wants_stream(self, request):
+        return request.query_params.get(self.stream_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def stream_response(self, queryset, serializer_class, **kwargs):
+        content = stream_json_array(queryset, serializer_class, self.stream_chunk_size, **kwargs)
+        return StreamingHttpResponse(content, content_type='application/json')
+
+    def list_response(self, queryset, serializer_class, **kwargs):
+        if self.wants_stream(self.request):
+            return self.stream_response(queryset, serializer_class, **kwargs)
+        return super(StreamingListMixin, self).list_response(queryset, serializer_class, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        if self.wants_stream(request):
+            queryset = self.filter_queryset(self.get_queryset())
+            return self.stream_response(queryset, self.get_serializer_class(),
+                                        context=self.get_serializer_context())
+        return super(StreamingListMixin, self).list(request, *args, **kwargs)
@@ -0,0 +1,204 @@
+"""
+Delta sync for list views
+
+A list view asked for ?modified_since=<timestamp> returns only the rows
+changed since then, plus the ids deleted since then, instead of the whole
+list. Deletes are kept as Tombstone rows written by post_delete receivers,
+so they are recorded however the row was deleted, cascades included;
+set based deletes record theirs with record_deletes().
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import F, Q, Value
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.response import Response
+
+from petclinic.models import Owner, Pet, Tombstone, Visit
+
+# Models whose tombstones also carry the id of the row they were listed under
+PARENT_FIELDS = { Pet: 'owner_id', Visit: 'pet_id' }
+PARENT_MODELS = { Pet: Owner, Visit: Pet }
+
+
+def tombstone_retention():
+    return datetime.timedelta(days=getattr(settings, 'PETCLINIC_TOMBSTONE_RETENTION_DAYS', 30))
+
+
+def sync_overlap():
+    return datetime.timedelta(seconds=getattr(settings, 'PETCLINIC_SYNC_OVERLAP', 5))
+
+
+def parse_timestamp(value, name):
+    """
+    Parse an ISO 8601 date or datetime; dates mean midnight and naive
+    values are in the current time zone
+    """
+    try:
+        timestamp = parse_datetime(value)
+        if timestamp is None:
+            date = parse_date(value)
+            if date is not None:
+                timestamp = datetime.datetime.combine(date, datetime.time())
+    except ValueError:
+        timestamp = None
+    if timestamp is None:
+        raise ParseError('%s must be an ISO 8601 date or datetime' % name)
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
+
+
+def record_tombstone(sender, instance, **kwargs):
+    """
+    post_delete receiver
+    """
+    parent_field = PARENT_FIELDS.get(sender)
+    Tombstone.objects.create(model=sender._meta.label_lower, object_id=instance.pk,
+                             parent_id=getattr(instance, parent_field) if parent_field else None)
+
+
+def record_move(sender, instance, created, raw=False, **kwargs):
+    """
+    post_save receiver for pets and visits moved to another parent
+
+    The row is gone from its old parent's list, so it gets a tombstone
+    there and the old parent, whose representation nests it, is touched.
+    The stored parent comes from stats.remember_old_values.
+    """
+    old = getattr(instance, '_stats_old', None)
+    if created or raw or old is None:
+        return
+    parent_field = PARENT_FIELDS[sender]
+    old_parent_id = old[parent_field]
+    if old_parent_id == getattr(instance, parent_field):
+        return
+    Tombstone.objects.create(model=sender._meta.label_lower, object_id=instance.pk, parent_id=old_parent_id)
+    PARENT_MODELS[sender].objects.filter(pk=old_parent_id).update(date_modified=timezone.now())
+
+
+def record_moves(model, changes):
+    """
+    record_move() for rows changed with bulk_update; changes are
+    (instance, old) pairs as for stats.record_updated()
+    """
+    parent_field = PARENT_FIELDS[model]
+    moved = [(instance.pk, old[parent_field]) for instance, old in changes
+             if old[parent_field] != getattr(instance, parent_field)]
+    if moved:
+        Tombstone.objects.bulk_create([Tombstone(model=model._meta.label_lower, object_id=pk, parent_id=parent_id)
+                                       for pk, parent_id in moved])
+        PARENT_MODELS[model].objects.filter(pk__in=set(parent_id for pk, parent_id in moved)).update(
+            date_modified=timezone.now())
+
+
+def record_deletes(model, queryset, using=connection):
+    """
+    record_tombstone() for the queryset's rows, about to be deleted
+    without signals, with one INSERT ... SELECT
+    """
+    columns = { 'model': Value(model._meta.label_lower, output_field=models.CharField()),
+                'object_id': F('pk'),
+                'date_deleted': Value(timezone.now(), output_field=models.DateTimeField()) }
+    parent_field = PARENT_FIELDS.get(model)
+    if parent_field:
+        columns['parent_id'] = F(parent_field)
+    names = list(columns)
+    select = queryset.annotate(**dict(('tombstone_%s' % name, value) for name, value in columns.items()))
+    sql, params = select.values(*['tombstone_%s' % name for name in names]).query.sql_with_params()
+    quote = using.ops.quote_name
+    with using.cursor() as cursor:
+        cursor.execute('INSERT INTO %s (%s) %s' % (
+            quote(Tombstone._meta.db_table),
+            ', '.join(quote(Tombstone._meta.get_field(name).column) for name in names), sql), params)
+
+
+def deleted_since(model, since, parent_id=None):
+    """
+    Return the ids of model rows deleted at or after since
+    """
+    tombstones = Tombstone.objects.filter(model=model._meta.label_lower, date_deleted__gte=since)
+    if parent_id is not None:
+        tombstones = tombstones.filter(parent_id=parent_id)
+    return sorted(set(tombstones.values_list('object_id', flat=True)))
+
+
+def prune_tombstones(now=None):
+    """
+    Delete tombstones older than PETCLINIC_TOMBSTONE_RETENTION_DAYS
+    """
+    horizon = (now or timezone.now()) - tombstone_retention()
+    return Tombstone.objects.filter(date_deleted__lt=horizon).delete()[0]
+
+
+class SyncExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'modified_since is older than the retained deletes, download the full list again'
+    default_code = 'sync_expired'
+
+
+class DeltaSyncMixin(object):
+    """
+    ?modified_since= mode for list views
+
+    Works with APIView list views using list_response() and with
+    generics.ListAPIView subclasses. The response is
+    { changed: [...], deleted: [ids], synced_at: timestamp }: rows whose
+    date_modified, or that of a nested row named in sync_related, is at
+    or after modified_since, and the ids deleted since then. Clients
+    apply changed, then deleted, and send synced_at as the next
+    modified_since. synced_at lies PETCLINIC_SYNC_OVERLAP seconds in the
+    past so rows committed late by concurrent transactions are picked up
+    on the next sync; rows are idempotent, so the overlap only costs a
+    few repeated rows.
+
+    Nested lists set sync_parent_kwarg to the URL kwarg holding the parent
+    id so only their own tombstones are returned.
+    """
+    modified_since_query_param = 'modified_since'
+    sync_related = ()
+    sync_parent_kwarg = None
+
+    def get_modified_since(self, request):
+        value = request.query_params.get(self.modified_since_query_param)
+        if value is None:
+            return None
+        since = parse_timestamp(value, self.modified_since_query_param)
+        if since < timezone.now() - tombstone_retention():
+            raise SyncExpired()
+        return since
+
+    def changed_since(self, queryset, since):
+        changed = Q(date_modified__gte=since)
+        model = queryset.model
+        for relation in self.sync_related:
+            related = model._default_manager.filter(**{ relation + '__date_modified__gte': since })
+            changed |= Q(pk__in=related.values('pk'))
+        return queryset.filter(changed)
+
+    def delta_response(self, queryset, serializer_class, since, **kwargs):
+        synced_at = timezone.now() - sync_overlap()
+        parent_id = self.kwargs.get(self.sync_parent_kwarg) if self.sync_parent_kwarg else None
+        changed = serializer_class(self.changed_since(queryset, since), many=True, **kwargs).data
+        return Response({
+            'changed': changed,
+            'deleted': deleted_since(queryset.model, since, parent_id),
+            'synced_at': synced_at,
+        })
+
+    def list_response(self, queryset, serializer_class, **kwargs):
+        since = self.get_modified_since(self.request)
+        if since is None:
+            return super(DeltaSyncMixin, self).list_response(queryset, serializer_class, **kwargs)
+        return self.delta_response(queryset, serializer_class, since, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        since = self.get_modified_since(request)
+        if since is None:
+            return super(DeltaSyncMixin, self).list(request, *args, **kwargs)
+        return self.delta_response(self.filter_queryset(self.get_queryset()), self.get_serializer_class(),
+                                   since, context=self.get_serializer_context())
@@ -0,0 +1,134 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, TransactionTestCase
+
+from petclinic.benchmarking import percentile, summarize
+from petclinic.models import Owner, Pet, PetType, Specialty, Vet, Visit
+from petclinic.test_utils import create_user
+
+
+class PopulateDbCommandTest(TestCase):
+
+    def populate(self, **options):
+        call_command('populate_db', stdout=StringIO(), **options)
+        return {
+            'owners': list(Owner.objects.order_by('id').values_list('id', 'email', 'state')),
+            'pets': list(Pet.objects.order_by('id').values_list('id', 'owner_id', 'name', 'pet_type_id')),
+            'visits': list(Visit.objects.order_by('id').values_list('id', 'pet_id', 'description')),
+            'vets': list(Vet.objects.order_by('id').values_list('id', 'email', 'specialty_id')),
+        }
+
+    def test_creates_requested_rows(self):
+        data = self.populate(owners=7, vets=3, scale=2, batch_size=4, seed='counts')
+        self.assertEqual(len(data['owners']), 14)
+        self.assertEqual(len(data['vets']), 6)
+        self.assertEqual(PetType.objects.count(), 15)
+        self.assertEqual(Specialty.objects.count(), 7)
+        self.assertTrue(Pet.objects.filter(owner__isnull=False).exists())
+        self.assertFalse(Visit.objects.filter(date_created__isnull=True).exists())
+
+    def test_same_seed_same_data(self):
+        first = self.populate(owners=10, vets=4, batch_size=3, seed='repeat')
+        second = self.populate(owners=10, vets=4, batch_size=3, seed='repeat', workers=2)
+        self.assertEqual(first, second)
+
+    def test_different_seed_different_data(self):
+        first = self.populate(owners=10, vets=4, seed='one')
+        second = self.populate(owners=10, vets=4, seed='two')
+        self.assertNotEqual(first['owners'], second['owners'])
+
+    def test_sequences_continue_after_populate(self):
+        self.populate(owners=3, vets=1, seed='sequence')
+        owner = Owner.objects.create(email='after-populate@example.com', first_name='First',
+                                     last_name='Last', street_address='1 Main St', city='San Jose',
+                                     state='CA', telephone='408-555-1212')
+        self.assertEqual(owner.id, 4)
+
+
+class ExplainEndpointsCommandTest(TestCase):
+
+    def explain(self, **options):
+        out = StringIO()
+        call_command('explain_endpoints', stdout=out, **options)
+        return out.getvalue()
+
+    def test_filtered_queries_use_their_indexes(self):
+        call_command('populate_db', owners=5, vets=5, seed='explain', stdout=StringIO())
+        output = self.explain(strict=True)
+        for index in ('owner_state_id_idx', 'vet_state_id_idx', 'visit_pet_date_idx', 'visit_date_id_idx',
+                      'owner_modified_id_idx', 'visit_modified_id_idx'):
+            self.assertIn(index, output)
+
+    def test_pet_visit_list_needs_no_sort(self):
+        output = self.explain()
+        line = [l for l in output.splitlines() if l.startswith('pet-visit-list')][0]
+        self.assertNotIn('sort', line)
+
+    def test_runs_on_empty_database(self):
+        self.assertIn('owner-detail', self.explain(verbose_plans=True))
+
+
+class BenchAsgiCommandTest(TransactionTestCase):
+
+    def test_reports_both_apps(self):
+        create_user()
+        call_command('populate_db', owners=2, vets=1, seed='bench', stdout=StringIO())
+        out = StringIO()
+        call_command('bench_asgi', requests=6, concurrency=3, wsgi_threads=2, host='testserver', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines], ['wsgi', 'asgi'])
+        for line in lines:
+            self.assertIn(' 6 req      0 err', line)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([5], 50), 5)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summary_counts_successes_only(self):
+        summary = summarize([0.01] * 8, 2.0, errors=6, timeouts=2)
+        self.assertEqual((summary['requests'], summary['timeouts']), (10, 2))
+        self.assertEqual(summary['rps'], 2.0)
+        self.assertEqual(summary['error_rate'], 0.6)
+        self.assertEqual(summary['max'], 10.0)
+
+
+class BenchApiCommandTest(TransactionTestCase):
+
+    def bench(self, **options):
+        out = StringIO()
+        err = StringIO()
+        call_command('bench_api', owners=3, vets=1, requests=2, warmup=0, no_test_db=True,
+                     stdout=out, stderr=err, **options)
+        self.assertNotIn('Routes without a benchmark', err.getvalue())
+        return out.getvalue()
+
+    def test_results_and_regressions(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        self.bench(output=path)
+        with open(path) as f:
+            results = json.load(f)
+        routes = results['scales']['1']
+        for label in ('POST token_obtain_pair', 'POST token_refresh', 'GET owner-list', 'DELETE owner-detail',
+                      'POST visit-bulk-create', 'GET async-owner-list', 'GET db-pool-stats',
+                      'GET owner-document', 'PATCH owner-list', 'PATCH pet-list', 'PATCH visit-list'):
+            self.assertIn(label, routes)
+        self.assertEqual([label for label, result in routes.items() if result['errors']], [])
+        self.assertGreater(routes['GET owner-list']['queries'], 0)
+        self.assertGreater(routes['GET async-owner-list']['queries'], 0)
+        self.assertEqual(routes['GET owner-list']['requests'], 2)
+
+        routes['GET owner-list']['queries'] -= 1
+        with open(path, 'w') as f:
+            json.dump(results, f)
+        with self.assertRaisesMessage(CommandError, '1 regressions'):
+            self.bench(compare=path, threshold=1000000)
@@ -0,0 +1,193 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from petclinic import counters
+from petclinic.models import Owner, Pet, Visit
+from petclinic.test_utils import *
+
+
+class CountersTest(TestCase):
+    """
+    Maintained counters must always agree with a full recount
+    """
+
+    def setUp(self):
+        self.owner = create_owner()
+        self.other_owner = create_owner(email='other@example.com')
+        self.pet = create_pet(owner=self.owner)
+        self.march = datetime.datetime(2020, 3, 31, 23, 30, tzinfo=timezone.utc)
+        self.april = datetime.datetime(2020, 4, 1, 0, 30, tzinfo=timezone.utc)
+        self.visit = create_visit(pet=self.pet, visit_date=self.march)
+        self.last_visit = create_visit(pet=self.pet, visit_date=self.april)
+
+    def assertCountersConsistent(self):
+        self.assertEqual(counters.recount(), (0, 0))
+
+    def assertPet(self, pet, visit_count, last_visit_date):
+        pet.refresh_from_db()
+        self.assertEqual((pet.visit_count, pet.last_visit_date), (visit_count, last_visit_date))
+
+    def test_creates(self):
+        self.assertCountersConsistent()
+        self.assertEqual(Owner.objects.get(pk=self.owner.pk).pet_count, 1)
+        self.assertEqual(Owner.objects.get(pk=self.other_owner.pk).pet_count, 0)
+        self.assertPet(self.pet, 2, self.april)
+
+    def test_earlier_visit_keeps_last_visit_date(self):
+        create_visit(pet=self.pet, visit_date=self.march - datetime.timedelta(days=30))
+        self.assertPet(self.pet, 3, self.april)
+
+    def test_visit_moved_to_other_pet(self):
+        other_pet = create_pet(owner=self.other_owner, name='rex')
+        self.last_visit.pet = other_pet
+        self.last_visit.save()
+        self.assertCountersConsistent()
+        self.assertPet(self.pet, 1, self.march)
+        self.assertPet(other_pet, 1, self.april)
+
+    def test_last_visit_moved_earlier(self):
+        self.last_visit.visit_date = self.march - datetime.timedelta(days=1)
+        self.last_visit.save()
+        self.assertCountersConsistent()
+        self.assertPet(self.pet, 2, self.march)
+
+    def test_visit_description_change_is_free(self):
+        self.visit.description = 'Updated'
+        with self.assertNumQueries(2):
+            self.visit.save()
+
+    def test_visits_deleted(self):
+        self.last_visit.delete()
+        self.assertPet(self.pet, 1, self.march)
+        self.visit.delete()
+        self.assertPet(self.pet, 0, None)
+        self.assertCountersConsistent()
+
+    def test_pet_moved_to_other_owner(self):
+        self.pet.owner = self.other_owner
+        self.pet.save()
+        self.assertCountersConsistent()
+        self.assertEqual(Owner.objects.get(pk=self.other_owner.pk).pet_count, 1)
+
+    def test_stale_instance_does_not_overwrite_counters(self):
+        stale = Pet.objects.get(pk=self.pet.pk)
+        create_visit(pet=self.pet, visit_date=self.april)
+        stale.name = 'renamed'
+        stale.save()
+        self.assertPet(self.pet, 3, self.april)
+        self.assertEqual(self.pet.name, 'renamed')
+
+    def test_pet_deleted_with_visits(self):
+        self.pet.delete()
+        self.assertCountersConsistent()
+        self.assertEqual(Owner.objects.get(pk=self.owner.pk).pet_count, 0)
+
+    def test_owner_deleted_with_pets(self):
+        create_pet(owner=self.owner, name='second')
+        # nothing is counted for rows that are being deleted
+        self.owner.delete()
+        self.assertCountersConsistent()
+        self.assertFalse(counters.deleting(Owner) or counters.deleting(Pet))
+
+    def test_record_created_counts_bulk_inserts(self):
+        now = timezone.now()
+        pets = Pet.objects.bulk_create([
+            Pet(owner=self.other_owner, name='bulk%d' % i, birth_date=now.date(),
+                date_created=now, date_modified=now) for i in range(3)
+        ])
+        counters.record_created(Pet, pets)
+        if pets[0].pk is None:
+            pets = list(Pet.objects.filter(owner=self.other_owner))
+        visits = Visit.objects.bulk_create([
+            Visit(pet=pet, visit_date=self.april, description='bulk', date_created=now, date_modified=now)
+            for pet in pets + [self.pet, self.pet]
+        ])
+        with self.assertNumQueries(1):
+            counters.record_created(Visit, visits)
+        self.assertCountersConsistent()
+        self.assertPet(self.pet, 4, self.april)
+
+    def test_recount_repairs_counters(self):
+        Owner.objects.update(pet_count=7)
+        Pet.objects.update(visit_count=0, last_visit_date=None)
+        self.assertEqual(counters.recount(), (2, 1))
+        self.assertCountersConsistent()
+        self.assertPet(self.pet, 2, self.april)
+
+
+class AtomicCountersTest(TransactionTestCase):
+    """
+    A failing receiver must roll back the write it was counting
+    """
+
+    def setUp(self):
+        self.pet = create_pet(owner=create_owner())
+        self.visit = create_visit(pet=self.pet)
+
+    def test_failed_count_rolls_back_save(self):
+        with mock.patch.object(counters, 'add_visits', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                create_visit(pet=self.pet)
+        self.assertEqual(Visit.objects.count(), 1)
+        self.assertEqual(counters.recount(), (0, 0))
+
+    def test_failed_count_rolls_back_delete(self):
+        with mock.patch.object(counters, 'remove_visits', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.visit.delete()
+        self.assertTrue(Visit.objects.filter(pk=self.visit.pk).exists())
+        self.assertEqual(counters.recount(), (0, 0))
+
+
+class RecountCommandTest(TestCase):
+
+    def test_populated_counters_are_consistent(self):
+        call_command('populate_db', owners=5, vets=4, seed='counters', stdout=StringIO())
+        self.assertEqual(counters.recount(), (0, 0))
+        Pet.objects.update(visit_count=0)
+        out = StringIO()
+        call_command('recount', stdout=out)
+        self.assertIn('fixed 0 owners and %d pets' % Pet.objects.filter(visits__isnull=False).distinct().count(),
+                      out.getvalue())
+        self.assertEqual(counters.recount(), (0, 0))
+
+
+class CounterFieldsViewTest(APITestCase):
+
+    def setUp(self):
+        user = create_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer %s' % AccessToken.for_user(user))
+        self.owner = create_owner()
+        self.pet = create_pet(owner=self.owner)
+        create_visit(pet=self.pet, visit_date=datetime.datetime(2020, 3, 2, tzinfo=timezone.utc))
+
+    def test_summary_fields(self):
+        response = self.client.get(reverse('owner-list'), { 'fields': 'id,pet_count' })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data), [{ 'id': self.owner.id, 'pet_count': 1 }])
+        response = self.client.get(reverse('owner-pet-list', args=[self.owner.id]),
+                                   { 'fields': 'id,visit_count,last_visit_date' })
+        self.assertEqual(list(response.data), [
+            { 'id': self.pet.id, 'visit_count': 1, 'last_visit_date': '2020-03-02T00:00:00Z' }])
+
+    def test_counters_are_read_only(self):
+        response = self.client.put(reverse('pet-detail', args=[self.pet.id]), { 'visit_count': 50 }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['visit_count'], 1)
+
+    def test_api_deletes_touch_parent(self):
+        before = Owner.objects.get(pk=self.owner.pk).date_modified
+        response = self.client.delete(reverse('pet-detail', args=[self.pet.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        owner = Owner.objects.get(pk=self.owner.pk)
+        self.assertEqual(owner.pet_count, 0)
+        self.assertGreater(owner.date_modified, before)
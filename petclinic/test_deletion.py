@@ -0,0 +1,133 @@
+import datetime
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from petclinic import counters, deletion, stats
+from petclinic.models import Owner, Pet, Tombstone, Visit
+from petclinic.test_stats import snapshot
+from petclinic.test_utils import *
+
+
+class PurgeTest(TestCase):
+    """
+    Set based deletes must leave the same data as Model.delete()
+    """
+
+    def setUp(self):
+        self.dog = create_pet_type('dog')
+        self.owner = create_owner()
+        self.other_owner = create_owner(email='other@example.com')
+        self.pet = create_pet(owner=self.owner, pet_type=self.dog)
+        self.other_pet = create_pet(owner=self.other_owner, name='rex', pet_type=self.dog)
+        self.march = datetime.datetime(2020, 3, 31, 23, 30, tzinfo=timezone.utc)
+        for pet in (self.pet, self.other_pet):
+            create_visit(pet=pet, visit_date=self.march)
+
+    def add_pets(self, owner, count):
+        for i in range(count):
+            pet = create_pet(owner=owner, name='pet%d' % i, pet_type=self.dog)
+            create_visit(pet=pet, visit_date=self.march)
+            create_visit(pet=pet, visit_date=self.march + datetime.timedelta(days=1))
+
+    def assertConsistent(self):
+        incremental = snapshot()
+        stats.rebuild_stats()
+        self.assertEqual(incremental, snapshot())
+        self.assertEqual(counters.recount(), (0, 0))
+
+    def tombstones(self, model):
+        return sorted(Tombstone.objects.filter(model=model._meta.label_lower).values_list('object_id', 'parent_id'))
+
+    def test_owner_purged_with_pets_and_visits(self):
+        self.add_pets(self.owner, 2)
+        pets = sorted(Pet.objects.filter(owner=self.owner).values_list('pk', flat=True))
+        visits = sorted(Visit.objects.filter(pet__owner=self.owner).values_list('pk', 'pet_id'))
+        self.assertEqual(deletion.purge(Owner, [self.owner.pk]), 1)
+        self.assertFalse(Owner.objects.filter(pk=self.owner.pk).exists())
+        self.assertFalse(Pet.objects.filter(pk__in=pets).exists())
+        self.assertEqual(Visit.objects.count(), 1)
+        self.assertConsistent()
+        self.assertEqual(self.tombstones(Owner), [(self.owner.pk, None)])
+        self.assertEqual(self.tombstones(Pet), [(pk, self.owner.pk) for pk in pets])
+        self.assertEqual(self.tombstones(Visit), visits)
+
+    def test_pet_purged_with_visits(self):
+        before = Owner.objects.get(pk=self.owner.pk).date_modified
+        self.assertEqual(deletion.purge(Pet, [self.pet.pk]), 1)
+        self.assertEqual(list(Visit.objects.values_list('pet_id', flat=True)), [self.other_pet.pk])
+        self.assertConsistent()
+        owner = Owner.objects.get(pk=self.owner.pk)
+        self.assertEqual(owner.pet_count, 0)
+        self.assertGreater(owner.date_modified, before)
+        self.assertEqual(self.tombstones(Pet), [(self.pet.pk, self.owner.pk)])
+
+    def test_missing_rows_are_ignored(self):
+        self.assertEqual(deletion.purge(Owner, [0]), 0)
+        self.assertEqual(deletion.purge(Pet, [self.pet.pk, 0]), 1)
+        self.assertFalse(Tombstone.objects.filter(object_id=0).exists())
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_pets(self.owner, 1)
+        with CaptureQueriesContext(connection) as small:
+            deletion.purge(Owner, [self.owner.pk])
+        self.add_pets(self.other_owner, 10)
+        with CaptureQueriesContext(connection) as large:
+            deletion.purge(Owner, [self.other_owner.pk])
+        self.assertEqual(len(large), len(small))
+        self.assertConsistent()
+
+    def test_other_models_rejected(self):
+        with self.assertRaises(TypeError):
+            deletion.purge(Visit, [1])
+
+
+class PurgeViewTest(APITestCase):
+
+    def setUp(self):
+        user = create_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer %s' % AccessToken.for_user(user))
+        self.owner = create_owner()
+        self.pet = create_pet(owner=self.owner)
+        create_visit(pet=self.pet)
+
+    def test_delete_owner(self):
+        response = self.client.delete(reverse('owner-detail', args=[self.owner.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Owner.objects.exists() or Pet.objects.exists() or Visit.objects.exists())
+        response = self.client.delete(reverse('owner-detail', args=[self.owner.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_delete_pet_shows_in_delta_sync(self):
+        since = timezone.now()
+        response = self.client.delete(reverse('pet-detail', args=[self.pet.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get(reverse('owner-pet-list', args=[self.owner.id]),
+                                   { 'modified_since': since.isoformat() })
+        self.assertEqual(response.data['deleted'], [self.pet.id])
+
+    def test_background_delete_of_missing_row(self):
+        response = self.client.delete(reverse('pet-detail', args=[0]) + '?background=true')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BackgroundPurgeTest(APITransactionTestCase):
+
+    def setUp(self):
+        user = create_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer %s' % AccessToken.for_user(user))
+        self.owner = create_owner()
+        create_visit(pet=create_pet(owner=self.owner))
+
+    def test_background_delete(self):
+        response = self.client.delete(reverse('owner-detail', args=[self.owner.id]) + '?background=true')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        deletion.wait_for_purges()
+        self.assertFalse(Owner.objects.exists() or Pet.objects.exists() or Visit.objects.exists())
+        self.assertEqual(counters.recount(), (0, 0))
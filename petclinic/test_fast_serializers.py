@@ -0,0 +1,75 @@
+import datetime
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from petclinic.fast_serializers import (FastOwnerSerializer, FastPetSerializer,
+                                        FastVetSerializer, FastVisitSerializer)
+from petclinic.models import Owner, Pet, Vet, Visit
+from petclinic.serializers import (OwnerSerializer, PetSerializer,
+                                   VetSerializer, VisitSerializer)
+from petclinic.test_utils import *
+
+
+class FastSerializerEquivalenceTest(TestCase):
+    """
+    Compiled serializers must render byte-identical JSON to the originals
+    """
+
+    def setUp(self):
+        self.renderer = JSONRenderer()
+        dog = create_pet_type('dog')
+        self.owner = create_owner(email='fast@example.com', first_name='Zoë', last_name='Ñandú')
+        self.empty_owner = create_owner(email='fast-empty@example.com')
+        self.pet = create_pet(owner=self.owner, name='fido', pet_type=dog)
+        self.untyped_pet = create_pet(owner=self.owner, name='nobody', pet_type=None,
+                                      birth_date=datetime.date(2001, 2, 3))
+        create_visit(pet=self.pet, description='check "up"\n',
+                     visit_date=datetime.datetime(2020, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc))
+        create_visit(pet=self.pet, visit_date=datetime.datetime(2020, 6, 1, tzinfo=timezone.utc))
+        create_vet(email='fast-vet@example.com')
+        Vet.objects.create(email='fast-vet-none@example.com', first_name='No', last_name='Specialty',
+                           street_address='1 Main St', city='San Jose', state='CA',
+                           telephone='408-555-1212', specialty=None)
+
+    def assertSameJSON(self, serializer_class, fast_serializer_class, queryset):
+        expected = self.renderer.render(serializer_class(queryset, many=True).data)
+        actual = self.renderer.render(fast_serializer_class(fast_serializer_class.values(queryset),
+                                                            many=True).data)
+        self.assertEqual(actual, expected)
+
+    def test_owners(self):
+        self.assertSameJSON(OwnerSerializer, FastOwnerSerializer, Owner.objects.all())
+
+    def test_filtered_owners(self):
+        self.assertSameJSON(OwnerSerializer, FastOwnerSerializer, Owner.objects.filter(state='ZZ'))
+
+    def test_pets(self):
+        self.assertSameJSON(PetSerializer, FastPetSerializer, Pet.objects.all())
+
+    def test_visits(self):
+        self.assertSameJSON(VisitSerializer, FastVisitSerializer, Visit.objects.all())
+
+    def test_vets(self):
+        self.assertSameJSON(VetSerializer, FastVetSerializer, Vet.objects.all())
+
+    def test_visit_in_other_timezone(self):
+        with timezone.override('America/Los_Angeles'):
+            self.assertSameJSON(VisitSerializer, FastVisitSerializer, Visit.objects.all())
+
+    def test_single_row(self):
+        # the counters were updated in the database after self.owner was created
+        self.owner.refresh_from_db()
+        expected = self.renderer.render(OwnerSerializer(self.owner).data)
+        row = FastOwnerSerializer.values(Owner.objects.filter(pk=self.owner.pk)).get()
+        self.assertEqual(self.renderer.render(FastOwnerSerializer(row).data), expected)
+
+    def test_fields_follow_serializer_order(self):
+        self.assertEqual([name for name, source, convert in FastPetSerializer.fields],
+                         list(PetSerializer().fields))
+
+    def test_nested_query_count(self):
+        rows = FastOwnerSerializer.values(Owner.objects.all())
+        with self.assertNumQueries(3):
+            FastOwnerSerializer(rows, many=True).data
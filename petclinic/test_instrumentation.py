@@ -0,0 +1,111 @@
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from petclinic.metrics import registry
+from petclinic.test_utils import *
+
+
+def server_timing(response):
+    """
+    Return { metric: (duration, description) } from the Server-Timing header
+    """
+    timings = {}
+    for entry in response['Server-Timing'].split(', '):
+        match = re.match(r'(\w+);dur=([\d.]+)(?:;desc="([^"]*)")?$', entry)
+        timings[match.group(1)] = (float(match.group(2)), match.group(3))
+    return timings
+
+
+def record_in_child_process():
+    registry.observe('petclinic_request_duration_seconds', (('view', 'OwnerList'), ('method', 'GET')), 0.2)
+    registry.inc('petclinic_requests_total', (('view', 'OwnerList'), ('method', 'GET'), ('status', '200')))
+    registry.flush(force=True)
+
+
+class InstrumentationTests(APITestCase):
+
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+        settings_override = override_settings(PETCLINIC_METRICS_DIR=self.metrics_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.metrics_dir)
+        registry.reset()
+        user = create_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer %s' % AccessToken.for_user(user))
+        self.owner = create_owner()
+        pet = create_pet(owner=self.owner)
+        create_visit(pet=pet)
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('owner-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timings = server_timing(response)
+        self.assertEqual(sorted(timings), ['db', 'render', 'serialize', 'total'])
+        self.assertEqual(timings['db'][1], '%d queries' % len(queries))
+        self.assertGreater(timings['render'][0] + timings['serialize'][0], 0)
+        self.assertGreaterEqual(timings['total'][0], timings['db'][0])
+
+    @override_settings(PETCLINIC_SERVER_TIMING=False)
+    def test_server_timing_disabled(self):
+        response = self.client.get(reverse('owner-list'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_metrics_per_view(self):
+        self.client.get(reverse('owner-list'))
+        self.client.get(reverse('owner-list'))
+        self.client.get(reverse('pet-detail', args=[10000]))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode('utf-8')
+        self.assertIn('# TYPE petclinic_request_duration_seconds histogram', text)
+        self.assertIn('petclinic_request_duration_seconds_count{view="OwnerList",method="GET"} 2', text)
+        self.assertIn('petclinic_request_duration_seconds_bucket{view="OwnerList",method="GET",le="+Inf"} 2', text)
+        self.assertIn('petclinic_requests_total{view="PetDetail",method="GET",status="404"} 1', text)
+        self.assertIn('petclinic_request_db_queries_count{view="OwnerList"} 2', text)
+
+    def test_metrics_merged_across_processes(self):
+        self.client.get(reverse('owner-list'))
+        child = multiprocessing.get_context('fork').Process(target=record_in_child_process)
+        child.start()
+        child.join()
+        self.assertEqual(child.exitcode, 0)
+        text = self.client.get(reverse('metrics')).content.decode('utf-8')
+        # the child starts empty instead of repeating the parent's request
+        self.assertIn('petclinic_request_duration_seconds_count{view="OwnerList",method="GET"} 2', text)
+        self.assertIn('petclinic_requests_total{view="OwnerList",method="GET",status="200"} 2', text)
+
+    def test_exited_process_files_taken_over(self):
+        child = multiprocessing.get_context('fork').Process(target=record_in_child_process)
+        child.start()
+        child.join()
+        # a file left without a lock, like those named by pid only
+        with open(os.path.join(self.metrics_dir, '%d.json' % os.getpid()), 'w') as f:
+            json.dump({ 'histograms': [], 'counters': [
+                ['petclinic_requests_total', [['view', 'OwnerList'], ['method', 'GET'], ['status', '200']], 1]] }, f)
+        self.client.get(reverse('owner-list'))
+        text = self.client.get(reverse('metrics')).content.decode('utf-8')
+        self.assertIn('petclinic_requests_total{view="OwnerList",method="GET",status="200"} 3', text)
+        self.assertEqual(sorted(name for name in os.listdir(self.metrics_dir) if not name.startswith('.')),
+                         ['%s.json' % registry.name, '%s.lock' % registry.name])
+
+    @override_settings(PETCLINIC_METRICS_DIR=None)
+    def test_metrics_without_directory(self):
+        self.client.get(reverse('owner-list'))
+        text = self.client.get(reverse('metrics')).content.decode('utf-8')
+        self.assertIn('petclinic_requests_total{view="OwnerList",method="GET",status="200"} 1', text)
+        self.assertEqual(os.listdir(self.metrics_dir), [])
@@ -0,0 +1,85 @@
+import asyncio
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import LiveServerTestCase, SimpleTestCase
+
+from petclinic.loadgen import ConnectionPool, LoadResult, open_loop, timed_request
+from petclinic.test_utils import create_user
+
+
+class OpenLoopTest(SimpleTestCase):
+    """
+    Runs against a local asyncio server answering after a fixed delay
+    """
+
+    async def serve(self, reader, writer):
+        try:
+            while True:
+                await reader.readuntil(b'\r\n\r\n')
+                await asyncio.sleep(0.05)
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    def run_load(self, connections):
+        async def run():
+            server = await asyncio.start_server(self.serve, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            pool = ConnectionPool('http://127.0.0.1:%d' % port, connections)
+            result = LoadResult()
+            try:
+                await open_loop(50, 0.4, lambda scheduled: timed_request(pool, result, scheduled, 'GET', '/'))
+            finally:
+                pool.close()
+                # let the handlers see the connections close
+                await asyncio.sleep(0.05)
+                server.close()
+            return result
+        return asyncio.run(run())
+
+    def test_queueing_is_counted(self):
+        # 20 requests at 50/s on one connection serving one per 50 ms queue up
+        result = self.run_load(connections=1)
+        self.assertEqual(result.statuses, { 200: 20 })
+        self.assertLess(max(result.service_times), 0.2)
+        self.assertGreater(max(result.latencies), 0.4)
+
+    def test_enough_connections_do_not_queue(self):
+        result = self.run_load(connections=10)
+        self.assertEqual(result.errors, 0)
+        self.assertLess(max(result.latencies), 0.2)
+
+    def test_timeouts_left_out_of_latencies(self):
+        async def never_answer(reader, writer):
+            await reader.read()
+
+        async def run():
+            server = await asyncio.start_server(never_answer, '127.0.0.1', 0)
+            pool = ConnectionPool('http://127.0.0.1:%d' % server.sockets[0].getsockname()[1], 2)
+            result = LoadResult()
+            try:
+                await open_loop(20, 0.1, lambda scheduled: timed_request(pool, result, scheduled, 'GET', '/',
+                                                                         timeout=0.05))
+            finally:
+                pool.close()
+                server.close()
+            return result
+        result = asyncio.run(run())
+        self.assertEqual((result.timeouts, result.errors), (2, 2))
+        self.assertEqual(result.latencies, [])
+
+
+class LoadtestCommandTest(LiveServerTestCase):
+
+    def test_load_live_server(self):
+        create_user(email='load@example.com', password='load_passwd_123')
+        call_command('populate_db', owners=3, vets=1, seed='loadtest', stdout=StringIO())
+        out = StringIO()
+        call_command('loadtest', url=self.live_server_url, email='load@example.com', password='load_passwd_123',
+                     rate=40, duration=0.5, connections=4, seed='loadtest', stdout=out)
+        output = out.getvalue()
+        self.assertIn('20 requests, 0 errors (0.00%), 0 timeouts', output)
+        self.assertIn('corrected for coordinated omission', output)
+        self.assertIn('create-visit', output)
@@ -145,3 +145,58 @@ class VisitModelTest(TestCase):
         """
         v = create_visit(pet=self.pet)
         self.assertIn(v, self.pet.visits.all())
+
+
+class TimestampedModelTest(TestCase):
+
+    def setUp(self):
+        self.before = timezone.now()
+        self.owner = create_owner()
+
+    def test_save_sets_timestamps(self):
+        self.assertGreaterEqual(self.owner.date_created, self.before)
+        self.assertEqual(self.owner.date_created, self.owner.date_modified)
+        created = self.owner.date_created
+        self.owner.first_name = 'Changed'
+        self.owner.save(update_fields=['first_name'])
+        owner = Owner.objects.get(pk=self.owner.pk)
+        self.assertEqual(owner.date_created, created)
+        self.assertGreater(owner.date_modified, created)
+
+    def test_bulk_create_sets_timestamps(self):
+        specialties = Specialty.objects.bulk_create([Specialty(name='bulk%d' % i) for i in range(3)])
+        self.assertTrue(all(s.date_created is not None and s.date_created == s.date_modified for s in specialties))
+        self.assertFalse(Specialty.objects.filter(date_created__isnull=True).exists())
+        imported = datetime.datetime(2020, 1, 1, tzinfo=timezone.utc)
+        pet_type = PetType.objects.bulk_create([
+            PetType(name='imported', date_created=imported, date_modified=imported)])[0]
+        self.assertEqual(PetType.objects.get(name='imported').date_modified, imported)
+        self.assertEqual(pet_type.date_created, imported)
+
+    def test_bulk_update_sets_date_modified(self):
+        other = create_owner(email='other@example.com')
+        self.owner.city = other.city = 'Santa Clara'
+        Owner.objects.bulk_update([self.owner, other], ['city'])
+        for owner in (self.owner, other):
+            stored = Owner.objects.get(pk=owner.pk)
+            self.assertEqual(stored.city, 'Santa Clara')
+            self.assertEqual(stored.date_modified, owner.date_modified)
+            self.assertGreater(stored.date_modified, stored.date_created)
+
+    def test_update_sets_date_modified_in_database(self):
+        then = timezone.now() - datetime.timedelta(seconds=1)
+        Owner.objects.filter(pk=self.owner.pk).update(date_modified=then)
+        Owner.objects.filter(pk=self.owner.pk).update(city='Santa Clara')
+        owner = Owner.objects.get(pk=self.owner.pk)
+        self.assertGreater(owner.date_modified, then)
+        self.assertLessEqual(owner.date_modified, timezone.now())
+        # related managers use the same queryset
+        pet = create_pet(owner=self.owner)
+        Pet.objects.filter(pk=pet.pk).update(date_modified=then)
+        self.owner.pets.update(name='renamed')
+        self.assertGreater(Pet.objects.get(pk=pet.pk).date_modified, then)
+
+    def test_update_keeps_explicit_date_modified(self):
+        then = datetime.datetime(2020, 1, 1, tzinfo=timezone.utc)
+        Owner.objects.filter(pk=self.owner.pk).update(date_modified=then)
+        self.assertEqual(Owner.objects.get(pk=self.owner.pk).date_modified, then)
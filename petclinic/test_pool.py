@@ -0,0 +1,138 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from petclinic.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+        self.resets = 0
+
+    def check(self):
+        if not self.healthy:
+            raise RuntimeError('connection lost')
+
+    def reset(self):
+        if not self.healthy:
+            raise RuntimeError('connection lost')
+        self.resets += 1
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(SimpleTestCase):
+
+    def make_pool(self, **options):
+        self.connections = []
+
+        def connect():
+            connection = FakeConnection()
+            self.connections.append(connection)
+            return connection
+
+        return ConnectionPool(connect, FakeConnection.check, FakeConnection.reset,
+                              FakeConnection.close, **options)
+
+    def test_reuses_released_connection(self):
+        pool = self.make_pool()
+        first = pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual(first.resets, 1)
+        self.assertEqual(pool.stats()['opened'], 1)
+
+    def test_fill_opens_min_size(self):
+        pool = self.make_pool(min_size=3)
+        pool.fill()
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['idle'], stats['in_use']), (3, 3, 0))
+
+    def test_times_out_at_max_size(self):
+        pool = self.make_pool(max_size=2, timeout=0.05)
+        pool.acquire()
+        pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['in_use'], stats['timeouts']), (2, 2, 1))
+
+    def test_waiter_receives_released_connection(self):
+        pool = self.make_pool(max_size=1, timeout=5)
+        held = pool.acquire()
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+        waiter.start()
+        while pool.stats()['waiting'] == 0:
+            time.sleep(0.001)
+        pool.release(held)
+        waiter.join()
+        self.assertEqual(acquired, [held])
+        stats = pool.stats()
+        self.assertEqual((stats['waits'], stats['waiting'], stats['opened']), (1, 0, 1))
+        self.assertGreater(stats['wait_time'], 0)
+
+    def test_recycles_idle_connections_above_min_size(self):
+        pool = self.make_pool(min_size=1, max_idle=0)
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(first)
+        pool.release(second)
+        self.assertEqual(pool.stats()['size'], 1)
+        self.assertEqual(sum(connection.closed for connection in self.connections), 1)
+
+    def test_closes_connections_past_max_lifetime(self):
+        pool = self.make_pool(max_lifetime=0)
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_discards_connection_failing_health_check(self):
+        pool = self.make_pool(health_check_after=0)
+        broken = pool.acquire()
+        pool.release(broken)
+        broken.healthy = False
+        connection = pool.acquire()
+        self.assertIsNot(connection, broken)
+        self.assertTrue(broken.closed)
+        self.assertEqual(pool.stats()['failed_checks'], 1)
+
+    def test_discards_connection_failing_reset(self):
+        pool = self.make_pool()
+        broken = pool.acquire()
+        broken.healthy = False
+        pool.release(broken)
+        self.assertTrue(broken.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_connect_failure_frees_slot(self):
+        pool = ConnectionPool(lambda: 1 / 0, FakeConnection.check, FakeConnection.reset,
+                              FakeConnection.close, max_size=1, timeout=0.05)
+        with self.assertRaises(ZeroDivisionError):
+            pool.acquire()
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_forked_child_starts_empty(self):
+        pool = self.make_pool()
+        inherited = pool.acquire()
+        pool.release(inherited)
+        pool.pid = -1
+        connection = pool.acquire()
+        self.assertIsNot(connection, inherited)
+        self.assertFalse(inherited.closed)
+
+    def test_close_closes_idle_connections(self):
+        pool = self.make_pool()
+        idle, in_use = pool.acquire(), pool.acquire()
+        pool.release(idle)
+        pool.close()
+        self.assertTrue(idle.closed)
+        pool.release(in_use)
+        self.assertTrue(in_use.closed)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
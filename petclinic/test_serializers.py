@@ -1,8 +1,17 @@
+import datetime
+from contextlib import contextmanager
+from unittest import mock
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.renderers import JSONRenderer
 
+from petclinic import counters, stats
 from petclinic.models import Owner, Pet, PetType, Specialty, Vet, Visit
 from petclinic.serializers import *
+from petclinic.test_stats import snapshot
 from petclinic.test_utils import *
 
 
@@ -18,7 +27,7 @@ class OwnerSerializerTest(TestCase):
         data = self.serializer.data
         self.assertEqual(data.keys(), 
                 set(['id', 'email','first_name', 'last_name', 'street_address', 'city',
-                        'state', 'telephone', 'pets'
+                        'state', 'telephone', 'pets', 'pet_count'
                 ]))
 
     def test_contains_expected_field_content(self):
@@ -31,7 +40,7 @@ class OwnerSerializerTest(TestCase):
         pet_data = data['pets']
         self.assertEqual(len(pet_data), 1)
         self.assertEqual(pet_data[0].keys(), 
-                set(['id','name', 'owner', 'birth_date','pet_type','visits']))
+                set(['id','name', 'owner', 'birth_date','pet_type','visits', 'visit_count', 'last_visit_date']))
 
     def test_contains_expected_field_content(self):
         data = self.serializer.data
@@ -99,7 +108,8 @@ class PetSerializerTest(TestCase):
 
     def test_contains_expected_fields(self):
         data = self.serializer.data
-        self.assertEqual(data.keys(), set(['id','birth_date','owner','name','visits','pet_type']))
+        self.assertEqual(data.keys(), set(['id','birth_date','owner','name','visits','pet_type',
+                                           'visit_count','last_visit_date']))
 
     def test_contains_expected_field_content(self):
         data = self.serializer.data
@@ -123,3 +133,94 @@ class VisitSerializerTest(TestCase):
         data = self.serializer.data
         self.assertEqual(data['id'], self.visit.id)
         self.assertEqual(data['pet'], self.pet.id)
+
+@contextmanager
+def returning_bulk_inserts():
+    """
+    Let SQLite return the primary keys of a bulk insert with RETURNING, as
+    PostgreSQL does, so the bulk_create path runs here too
+    """
+    def return_insert_columns(fields):
+        return 'RETURNING %s' % ', '.join(connection.ops.quote_name(field.column) for field in fields), ()
+
+    with mock.patch.object(connection.features, 'can_return_rows_from_bulk_insert', True), \
+            mock.patch.object(connection.features, 'can_return_columns_from_insert', True), \
+            mock.patch.object(connection.ops, 'return_insert_columns', return_insert_columns), \
+            mock.patch.object(connection.ops, 'fetch_returned_insert_rows', lambda cursor: cursor.fetchall(),
+                              create=True):
+        yield
+
+
+class BulkCreateListSerializerTest(TestCase):
+
+    def setUp(self):
+        self.owner = create_owner()
+        self.pets = [create_pet(owner=self.owner, name='bulk%d' % i) for i in range(2)]
+        self.april = datetime.datetime(2020, 4, 1, 12, tzinfo=timezone.utc)
+
+    def create_visits(self, count):
+        data = [{ 'pet': self.pets[i % 2].id, 'visit_date': (self.april + datetime.timedelta(days=i)).isoformat(),
+                  'description': 'bulk visit' } for i in range(count)]
+        serializer = VisitSerializer(data=data, many=True)
+        serializer.is_valid(raise_exception=True)
+        with returning_bulk_inserts(), CaptureQueriesContext(connection) as queries:
+            visits = serializer.save()
+        return visits, queries
+
+    def test_bulk_create_sets_primary_keys(self):
+        visits, queries = self.create_visits(3)
+        self.assertEqual([visit.pk for visit in visits],
+                         list(Visit.objects.order_by('pk').values_list('pk', flat=True)))
+        self.assertEqual([visit.description for visit in Visit.objects.filter(pk__in=[v.pk for v in visits])],
+                         ['bulk visit'] * 3)
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "petclinic_visit"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_bulk_create_records_stats_and_counters(self):
+        self.create_visits(3)
+        incremental = snapshot()
+        stats.rebuild_stats()
+        self.assertEqual(incremental, snapshot())
+        self.assertEqual(counters.recount(), (0, 0))
+        pet = Pet.objects.get(pk=self.pets[0].pk)
+        self.assertEqual(pet.visit_count, 2)
+        self.assertEqual(pet.last_visit_date, self.april + datetime.timedelta(days=2))
+
+    def test_query_count_is_constant(self):
+        # the first batch also creates the month's statistics row
+        self.create_visits(1)
+        self.assertEqual(len(self.create_visits(2)[1]), len(self.create_visits(20)[1]))
+
+class SparseFieldsetSerializerTest(TestCase):
+
+    def setUp(self):
+        self.owner = create_owner(email='sparse-serializer@example.com')
+        self.pet = create_pet(owner=self.owner)
+        self.visit = create_visit(pet=self.pet)
+
+    def test_fields_restricts_top_level(self):
+        data = OwnerSerializer(self.owner, fields={'id': {}, 'email': {}}).data
+        self.assertEqual(data.keys(), set(['id', 'email']))
+
+    def test_fields_restricts_nested(self):
+        data = OwnerSerializer(self.owner, fields={'id': {}, 'pets': {'name': {}}}).data
+        self.assertEqual(data.keys(), set(['id', 'pets']))
+        self.assertEqual(data['pets'][0].keys(), set(['name']))
+
+    def test_expand_limits_nesting(self):
+        data = OwnerSerializer(self.owner, expand={'pets': {}}).data
+        self.assertIn('email', data)
+        self.assertNotIn('visits', data['pets'][0])
+
+    def test_expand_nested_visits(self):
+        data = OwnerSerializer(self.owner, expand={'pets': {'visits': {}}}).data
+        self.assertEqual(data['pets'][0]['visits'][0]['id'], self.visit.id)
+
+    def test_empty_expand_drops_nested(self):
+        data = OwnerSerializer(self.owner, expand={}).data
+        self.assertNotIn('pets', data)
+
+    def test_full_serializer_unchanged(self):
+        self.assertEqual(OwnerSerializer(self.owner).data.keys(),
+                set(['id', 'email','first_name', 'last_name', 'street_address', 'city',
+                        'state', 'telephone', 'pets', 'pet_count']))
@@ -0,0 +1,159 @@
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from petclinic.models import Owner, Pet, Tombstone, Vet, Visit
+from petclinic.test_utils import *
+
+
+class DeltaSyncTests(APITestCase):
+
+    def setUp(self):
+        user = create_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer %s' % AccessToken.for_user(user))
+        self.owner = create_owner()
+        self.other_owner = create_owner(email='other@example.com')
+        self.pet = create_pet(owner=self.owner)
+        self.other_pet = create_pet(owner=self.owner, name='rex')
+        self.visit = create_visit(pet=self.pet)
+        self.other_visit = create_visit(pet=self.pet, description='Second visit')
+        self.vet = create_vet()
+        self.other_vet = create_vet(email='other-vet@example.com', specialty=self.vet.specialty)
+        # everything above was changed an hour ago and synced since
+        self.last_sync = timezone.now() - datetime.timedelta(minutes=30)
+        an_hour_ago = timezone.now() - datetime.timedelta(hours=1)
+        for model in (Owner, Pet, Visit, Vet):
+            model.objects.update(date_modified=an_hour_ago)
+
+    def sync(self, url, since=None):
+        since = self.last_sync if since is None else since
+        return self.client.get(url, { 'modified_since': since.isoformat() })
+
+    def changed_ids(self, response):
+        return sorted(item['id'] for item in response.data['changed'])
+
+    def test_nothing_changed(self):
+        for url in (reverse('owner-list'), reverse('vet-list'), reverse('visit-list'),
+                    reverse('owner-pet-list', args=[self.owner.id]), reverse('pet-visit-list', args=[self.pet.id])):
+            response = self.sync(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+            self.assertEqual(response.data['changed'], [], url)
+            self.assertEqual(response.data['deleted'], [], url)
+
+    def test_owner_changed_through_nested_visit(self):
+        self.other_owner.save()
+        self.visit.description = 'Updated'
+        self.visit.save()
+        response = self.sync(reverse('owner-list'))
+        self.assertEqual(self.changed_ids(response), [self.owner.id, self.other_owner.id])
+        owner = [item for item in response.data['changed'] if item['id'] == self.owner.id][0]
+        self.assertEqual(len(owner['pets']), 2)
+
+    def test_owner_deleted(self):
+        owner_id = self.other_owner.id
+        self.other_owner.delete()
+        response = self.sync(reverse('owner-list'))
+        self.assertEqual(response.data['changed'], [])
+        self.assertEqual(response.data['deleted'], [owner_id])
+
+    def test_deleted_before_last_sync_not_returned(self):
+        self.other_owner.delete()
+        response = self.sync(reverse('owner-list'), since=timezone.now() + datetime.timedelta(seconds=1))
+        self.assertEqual(response.data['deleted'], [])
+
+    def test_pet_deleted_through_api(self):
+        self.client.delete(reverse('pet-detail', args=[self.other_pet.id]))
+        response = self.sync(reverse('owner-pet-list', args=[self.owner.id]))
+        self.assertEqual(response.data['changed'], [])
+        self.assertEqual(response.data['deleted'], [self.other_pet.id])
+        self.assertEqual(self.changed_ids(self.sync(reverse('owner-list'))), [self.owner.id])
+        # tombstones of one owner's pets are not sent to another owner's list
+        response = self.sync(reverse('owner-pet-list', args=[self.other_owner.id]))
+        self.assertEqual(response.data['deleted'], [])
+
+    def test_cascaded_deletes_recorded(self):
+        owner_id = self.owner.id
+        self.owner.delete()
+        self.assertEqual(self.sync(reverse('owner-pet-list', args=[owner_id])).data['deleted'],
+                         sorted([self.pet.id, self.other_pet.id]))
+        self.assertEqual(self.sync(reverse('visit-list')).data['deleted'],
+                         sorted([self.visit.id, self.other_visit.id]))
+
+    def test_pet_moved_to_other_owner(self):
+        self.other_pet.owner = self.other_owner
+        self.other_pet.save()
+        response = self.sync(reverse('owner-pet-list', args=[self.owner.id]))
+        self.assertEqual(response.data['deleted'], [self.other_pet.id])
+        response = self.sync(reverse('owner-pet-list', args=[self.other_owner.id]))
+        self.assertEqual(self.changed_ids(response), [self.other_pet.id])
+        self.assertEqual(self.changed_ids(self.sync(reverse('owner-list'))), [self.owner.id, self.other_owner.id])
+
+    def test_visit_lists(self):
+        self.visit.description = 'Updated'
+        self.visit.save()
+        self.client.delete(reverse('visit-detail', args=[self.other_visit.id]))
+        for url in (reverse('visit-list'), reverse('pet-visit-list', args=[self.pet.id])):
+            response = self.sync(url)
+            self.assertEqual(self.changed_ids(response), [self.visit.id], url)
+            self.assertEqual(response.data['changed'][0]['description'], 'Updated')
+            self.assertEqual(response.data['deleted'], [self.other_visit.id], url)
+
+    def test_vet_list(self):
+        vet_id = self.other_vet.id
+        self.vet.save()
+        self.other_vet.delete()
+        response = self.sync(reverse('vet-list'))
+        self.assertEqual(self.changed_ids(response), [self.vet.id])
+        self.assertEqual(response.data['deleted'], [vet_id])
+
+    def test_next_sync_from_synced_at(self):
+        response = self.sync(reverse('owner-list'))
+        self.other_owner.save()
+        response = self.client.get(reverse('owner-list'), { 'modified_since': response.data['synced_at'].isoformat() })
+        self.assertEqual(self.changed_ids(response), [self.other_owner.id])
+
+    def test_query_count_independent_of_unchanged_rows(self):
+        self.owner.save()
+        # authenticate once so the cached token does not skew the first count
+        self.sync(reverse('owner-list'))
+        with self.assertNumQueries(4):
+            self.sync(reverse('owner-list'))
+        for i in range(5):
+            create_owner(email='more%d@example.com' % i)
+        Owner.objects.exclude(pk=self.owner.pk).update(date_modified=timezone.now() - datetime.timedelta(hours=1))
+        with self.assertNumQueries(4):
+            self.sync(reverse('owner-list'))
+
+    def test_bad_timestamp(self):
+        response = self.client.get(reverse('owner-list'), { 'modified_since': 'yesterday' })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_older_than_retained_tombstones(self):
+        response = self.sync(reverse('owner-list'), since=timezone.now() - datetime.timedelta(days=31))
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertEqual(response.data['detail'].code, 'sync_expired')
+
+    def test_plain_list_unchanged(self):
+        response = self.client.get(reverse('owner-list'))
+        self.assertEqual(len(response.data), 2)
+
+
+class PruneTombstonesCommandTest(TestCase):
+
+    def test_prune_tombstones(self):
+        owner = create_owner()
+        owner_id = owner.id
+        owner.delete()
+        Tombstone.objects.create(model='petclinic.owner', object_id=1000,
+                                 date_deleted=timezone.now() - datetime.timedelta(days=31))
+        out = StringIO()
+        call_command('prune_tombstones', stdout=out)
+        self.assertEqual(list(Tombstone.objects.values_list('object_id', flat=True)), [owner_id])
+        self.assertIn('Pruned 1 tombstones', out.getvalue())
@@ -1,23 +1,38 @@
 from django.urls import path
 from rest_framework.urlpatterns import format_suffix_patterns
 
-from petclinic import views
+from petclinic import async_views, views
 
 urlpatterns = [
     path('users/', views.UserList.as_view(), name='user-list'),
     path('users/<int:pk>', views.UserDetail.as_view(), name='user-detail'),
     path('owners/', views.OwnerList.as_view(), name='owner-list'),
     path('owners/<int:pk>', views.OwnerDetail.as_view(), name='owner-detail'),
+    path('owners/<int:pk>/document', views.OwnerDocument.as_view(), name='owner-document'),
     path('vets/', views.VetList.as_view(), name='vet-list'),
     path('vets/<int:pk>', views.VetDetail.as_view(), name='vet-detail'),
     path('specialties/', views.SpecialtyList.as_view(), name='specialty-list'),
     path('specialties/<int:pk>', views.SpecialtyDetail.as_view(), name='specialty-detail'),
     path('pet_types/', views.PetTypeList.as_view(), name='pet-type-list'),
     path('pet_types/<int:pk>', views.PetTypeDetail.as_view(), name='pet-type-detail'),
+    path('pets/', views.PetList.as_view(), name='pet-list'),
     path('pets/<int:pk>', views.PetDetail.as_view(), name='pet-detail'),
+    path('visits/', views.VisitTimeline.as_view(), name='visit-list'),
     path('visits/<int:pk>', views.VisitDetail.as_view(), name='visit-detail'),
+    path('visits/bulk', views.VisitBulkCreate.as_view(), name='visit-bulk-create'),
     path('owners/<int:owner_pk>/pets', views.OwnerPetList.as_view(), name='owner-pet-list'),
     path('pets/<int:pet_pk>/visits', views.PetVisitList.as_view(), name='pet-visit-list'),
+    path('stats/', views.ClinicStats.as_view(), name='clinic-stats'),
+    path('db/pools', views.DatabasePoolStats.as_view(), name='db-pool-stats'),
 ]
 
 urlpatterns = format_suffix_patterns(urlpatterns)
+
+urlpatterns += [
+    path('async/owners/', async_views.owner_list, name='async-owner-list'),
+    path('async/owners/<int:pk>', async_views.owner_detail, name='async-owner-detail'),
+    path('async/owners/<int:owner_pk>/pets', async_views.owner_pet_list, name='async-owner-pet-list'),
+    path('async/pets/<int:pk>', async_views.pet_detail, name='async-pet-detail'),
+    path('async/pets/<int:pet_pk>/visits', async_views.pet_visit_list, name='async-pet-visit-list'),
+    path('async/visits/<int:pk>', async_views.visit_detail, name='async-visit-detail'),
+]
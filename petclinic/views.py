@@ -1,27 +1,61 @@
-from django.http import Http404
+from itertools import islice
+
+from django.http import Http404, HttpResponse
 from rest_framework import generics, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from petclinic.models import Owner, Pet, PetType, Specialty, User, Vet, Visit
+from petclinic.authentication import CachingJWTAuthentication
+from petclinic.batch import BatchUpdateMixin
+from petclinic.caching import CachedListMixin
+from petclinic.conditional import ConditionalGetMixin, conditional_get
+from petclinic.deletion import PurgeMixin
+from petclinic.documents import UnsupportedDatabase, fetch_document
+from petclinic.fast_serializers import (FastOwnerSerializer, FastPetSerializer,
+                                        FastVetSerializer, FastVisitSerializer)
+from petclinic.fieldsets import SparseFieldsetViewMixin
+from petclinic.metrics import render_prometheus
+from petclinic.models import (Owner, OwnerPetStat, Pet, PetType, PetTypeVisitStat,
+                              Specialty, SpecialtyVetStat, User, Vet, Visit)
+from petclinic.pagination import (CursorPaginatedListMixin, OptInCursorPagination,
+                                  PetVisitPagination, VisitTimelinePagination)
+from petclinic.parsers import NDJSONParser
+from petclinic.pool import pool_stats
 from petclinic.serializers import (OwnerSerializer, PetSerializer,
                                    PetTypeSerializer, SpecialtySerializer,
                                    UserSerializer, VetSerializer,
                                    VisitSerializer)
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from petclinic.streaming import StreamingListMixin
+from petclinic.sync import DeltaSyncMixin, parse_timestamp
+
+
+def pk_list(values):
+    """
+    Return the distinct integer primary keys in values, skipping invalid ones
+    """
+    pks = set()
+    for value in values:
+        try:
+            pks.add(int(value))
+        except (TypeError, ValueError):
+            pass
+    return list(pks)
 
 
-class UserList(APIView):
+class UserList(StreamingListMixin, CursorPaginatedListMixin, APIView):
     """
     List all users with profile
     """
+    queryset = User.objects.select_related('profile')
 
     def get(self, request, format=None):
-        users = User.objects.all()
+        users = self.queryset.all()
         serializer_context = { 'request': request }
-        serializer = UserSerializer(users, many=True, context=serializer_context)
-        return Response(serializer.data)
+        return self.list_response(users, UserSerializer, context=serializer_context)
 
     def post(self, request, format=None):
         serializer_context = { 'request': request }
@@ -35,9 +69,11 @@ class UserDetail(APIView):
     """
     Retrieve and update users
     """
+    queryset = User.objects.select_related('profile')
+
     def get_object(self, pk):
         try:
-            return User.objects.get(pk=pk)
+            return self.queryset.get(pk=pk)
         except User.DoesNotExist:
             raise Http404
 
@@ -62,20 +98,25 @@ class UserDetail(APIView):
         return Response(status.HTTP_204_NO_CONTENT)
 
 
-class OwnerList(APIView):
+class OwnerList(BatchUpdateMixin, DeltaSyncMixin, SparseFieldsetViewMixin, StreamingListMixin,
+                CursorPaginatedListMixin, APIView):
     """
-    List all owners, or create a new owner
+    List all owners, create a new owner or update many owners
     """
+    queryset = Owner.objects.prefetch_related('pets__visits')
+    serializer_class = OwnerSerializer
+    sync_related = ('pets', 'pets__visits')
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachingJWTAuthentication]
 
     def get(self, request, format=None):
-        owners = Owner.objects.all()
+        owners = self.plan_queryset(self.queryset.all())
         state = request.query_params.get('state', None)
         if state is not None:
             owners = owners.filter(state=state)
-        serializer = OwnerSerializer(owners, many=True)
-        return Response(serializer.data)
+        if self.is_sparse_request():
+            return self.list_response(owners, OwnerSerializer, context={ 'request': request })
+        return self.list_response(FastOwnerSerializer.values(owners), FastOwnerSerializer)
 
     def post(self, request, format=None):
         serializer = OwnerSerializer(data=request.data)
@@ -84,23 +125,31 @@ class OwnerList(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class OwnerDetail(APIView):
+class OwnerDetail(PurgeMixin, ConditionalGetMixin, SparseFieldsetViewMixin, APIView):
     """
     Retrive, update or delete a specific owner instance
     """
+    queryset = Owner.objects.prefetch_related('pets__visits')
+    serializer_class = OwnerSerializer
+    related_validators = ('pets', 'pets__visits')
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachingJWTAuthentication]
 
     def get_object(self, pk):
         try:
-            return Owner.objects.get(pk=pk)
+            return self.plan_queryset(self.queryset).get(pk=pk)
         except Owner.DoesNotExist:
             raise Http404
 
+    @conditional_get
     def get(self, request, pk, format=None):
-        owner = self.get_object(pk)
-        serializer = OwnerSerializer(owner)
-        return Response(serializer.data)
+        if self.is_sparse_request():
+            serializer = OwnerSerializer(self.get_object(pk), context={ 'request': request })
+            return Response(serializer.data)
+        owner = FastOwnerSerializer.values(Owner.objects.filter(pk=pk)).first()
+        if owner is None:
+            raise Http404
+        return Response(FastOwnerSerializer(owner).data)
 
     def put(self, request, pk, format=None):
         owner = self.get_object(pk)
@@ -110,25 +159,42 @@ class OwnerDetail(APIView):
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    def delete(self, request, pk, format=None):
-        owner = self.get_object(pk)
-        owner.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
 
-class VetList(APIView):
+class OwnerDocument(APIView):
+    """
+    Retrieve an owner with its pets and visits as one JSON document built
+    by the database in a single query
+    """
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachingJWTAuthentication]
+
+    def get(self, request, pk, format=None):
+        try:
+            document = fetch_document(FastOwnerSerializer, pk)
+        except UnsupportedDatabase:
+            owner = FastOwnerSerializer.values(Owner.objects.filter(pk=pk)).first()
+            document = None if owner is None else JSONRenderer().render(FastOwnerSerializer(owner).data)
+        if document is None:
+            raise Http404
+        return HttpResponse(document, content_type='application/json')
+
+class VetList(DeltaSyncMixin, SparseFieldsetViewMixin, StreamingListMixin, CursorPaginatedListMixin, APIView):
     """
     List all vets or create a new vet
     """
+    queryset = Vet.objects.all()
+    serializer_class = VetSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]   
+    authentication_classes = [CachingJWTAuthentication]   
 
     def get(self, request, format=None):
-        vets = Vet.objects.all()
+        vets = self.plan_queryset(self.queryset.all())
         state = request.query_params.get('state', None)
         if state is not None:
             vets = vets.filter(state=state)
-        serializer = VetSerializer(vets, many=True)
-        return Response(serializer.data)
+        if self.is_sparse_request():
+            return self.list_response(vets, VetSerializer, context={ 'request': request })
+        return self.list_response(FastVetSerializer.values(vets), FastVetSerializer)
 
     def post(self, request, format=None):
         serializer = VetSerializer(data=request.data)
@@ -137,22 +203,25 @@ class VetList(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class VetDetail(APIView):
+class VetDetail(ConditionalGetMixin, SparseFieldsetViewMixin, APIView):
     """
     Retrieve, update or delete specific instances of a vet
     """
+    queryset = Vet.objects.all()
+    serializer_class = VetSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]  
+    authentication_classes = [CachingJWTAuthentication]  
 
     def get_object(self, pk):
         try:
-            return Vet.objects.get(pk=pk)
+            return self.plan_queryset(self.queryset).get(pk=pk)
         except Vet.DoesNotExist:
             raise Http404
 
+    @conditional_get
     def get(self, request, pk, format=None):
         vet = self.get_object(pk)
-        serializer = VetSerializer(vet)
+        serializer = VetSerializer(vet, context={ 'request': request })
         return Response(serializer.data)
 
     def put(self, request, pk, format=None):
@@ -168,17 +237,16 @@ class VetDetail(APIView):
         vet.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)    
 
-class SpecialtyList(APIView):
+class SpecialtyList(CachedListMixin, APIView):
     """
     List all specialties
     """
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachingJWTAuthentication]
 
     def get(self, request, format=None):
-        specialties = Specialty.objects.all()
-        serializer = SpecialtySerializer(specialties, many=True)
-        return Response(serializer.data)
+        return self.cached_list_response(request, Specialty,
+                                         lambda: SpecialtySerializer(Specialty.objects.all(), many=True).data)
 
     def post(self, request, format=None):
         serializer = SpecialtySerializer(data=request.data)
@@ -192,7 +260,7 @@ class SpecialtyDetail(APIView):
     Retrieve, update a speciality (delete blocked)
     """
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachingJWTAuthentication]
 
     def get_object(self, pk):
         try:
@@ -217,17 +285,16 @@ class SpecialtyDetail(APIView):
         data = { 'message': 'Unsupported operation'}
         return Response(data, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
-class PetTypeList(APIView):
+class PetTypeList(CachedListMixin, APIView):
     """
     List all or create a new pet types
     """
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachingJWTAuthentication]
 
     def get(self, request, format=None):
-        pet_types = PetType.objects.all()
-        serializer = PetTypeSerializer(pet_types, many=True)
-        return Response(serializer.data)
+        return self.cached_list_response(request, PetType,
+                                         lambda: PetTypeSerializer(PetType.objects.all(), many=True).data)
 
     def post(self, request, format=None):
         serializer = PetTypeSerializer(data=request.data)
@@ -241,7 +308,7 @@ class PetTypeDetail(APIView):
     Retrieve, update a pet type (delete blocked)
     """
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachingJWTAuthentication]
 
     def get_object(self, pk):
         try:
@@ -266,84 +333,228 @@ class PetTypeDetail(APIView):
         data = { 'message': 'Unsupported operation'}
         return Response(data, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
-class OwnerPetList(generics.ListCreateAPIView):
-    queryset = Pet.objects.all()
+class OwnerPetList(DeltaSyncMixin, SparseFieldsetViewMixin, StreamingListMixin, generics.ListCreateAPIView):
+    queryset = Pet.objects.prefetch_related('visits')
     serializer_class = PetSerializer
+    pagination_class = OptInCursorPagination
+    sync_related = ('visits',)
+    sync_parent_kwarg = 'owner_pk'
 
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]    
+    authentication_classes = [CachingJWTAuthentication]    
 
     def get_queryset(self):
         owner_pk = self.kwargs['owner_pk']
-        return self.queryset.filter(owner=owner_pk)
+        queryset = self.queryset.filter(owner=owner_pk)
+        if self.uses_fast_serializer():
+            return FastPetSerializer.values(queryset)
+        return self.plan_queryset(queryset)
+
+    def uses_fast_serializer(self):
+        return self.request.method == 'GET' and not self.is_sparse_request()
+
+    def get_serializer_class(self):
+        if self.uses_fast_serializer():
+            return FastPetSerializer
+        return self.serializer_class
 
     def pre_save(self, obj):
         obj.owner = self.kwargs['owner_pk']
 
     def create(self, request, *args, **kwargs):
-        owner_id = self.kwargs['owner_pk']
-        for pet_data in request.data:
-            pet_data['owner'] = owner_id
-        serializer = self.get_serializer(data=request.data, many=isinstance(request.data, list))
+        try:
+            owner = Owner.objects.get(pk=self.kwargs['owner_pk'])
+        except Owner.DoesNotExist:
+            raise Http404
+        many = isinstance(request.data, list)
+        pets_data = [pet_data for pet_data in (request.data if many else [request.data])
+                     if isinstance(pet_data, dict)]
+        for pet_data in pets_data:
+            pet_data['owner'] = owner.id
+        context = self.get_serializer_context()
+        context['related_objects'] = {
+            Owner: { owner.id: owner },
+            PetType: PetType.objects.in_bulk(pk_list(pet_data.get('pet_type') for pet_data in pets_data)),
+        }
+        serializer = self.serializer_class(data=request.data, many=many, context=context)
         serializer.is_valid(raise_exception=True)
-        pets_created = []
-        for pet_data in request.data:
-            pet_data['owner'] = Owner.objects.get(pk=owner_id)
-            pet_data['pet_type'] = PetType.objects.get(pk=pet_data['pet_type'])
-            pet = Pet(**pet_data)
-            pet.save()
-            pets_created.append(pet.id)
-        results = Pet.objects.filter(id__in=pets_created)
-        output_serializer = PetSerializer(results, many=True)
-        data = output_serializer.data[:]
-        return Response(data, status=status.HTTP_201_CREATED)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-class PetVisitList(generics.ListCreateAPIView):
+class PetVisitList(DeltaSyncMixin, StreamingListMixin, generics.ListCreateAPIView):
     queryset = Visit.objects.all()
     serializer_class = VisitSerializer
+    pagination_class = PetVisitPagination
+    sync_parent_kwarg = 'pet_pk'
 
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]    
+    authentication_classes = [CachingJWTAuthentication]    
 
     def get_queryset(self):
         pet_pk = self.kwargs['pet_pk']
-        return self.queryset.filter(pet=pet_pk)
+        queryset = self.queryset.filter(pet=pet_pk).order_by('visit_date', 'id')
+        if self.request.method == 'GET':
+            return FastVisitSerializer.values(queryset)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return FastVisitSerializer
+        return self.serializer_class
 
     def pre_save(self, obj):
         obj.pet = self.kwargs['pet_pk']
 
     def create(self, request, *args, **kwargs):
-        pet_id = self.kwargs['pet_pk']
-        for visit_data in request.data:
-            visit_data['pet'] = pet_id
-        serializer = self.get_serializer(data=request.data, many=isinstance(request.data, list))
+        try:
+            pet = Pet.objects.get(pk=self.kwargs['pet_pk'])
+        except Pet.DoesNotExist:
+            raise Http404
+        many = isinstance(request.data, list)
+        visits_data = [visit_data for visit_data in (request.data if many else [request.data])
+                       if isinstance(visit_data, dict)]
+        for visit_data in visits_data:
+            visit_data['pet'] = pet.id
+        context = self.get_serializer_context()
+        context['related_objects'] = { Pet: { pet.id: pet } }
+        serializer = self.serializer_class(data=request.data, many=many, context=context)
         serializer.is_valid(raise_exception=True)
-        visits_created = []
-        for visit_data in request.data:
-            visit_data['pet'] = Pet.objects.get(pk=pet_id)
-            visit = Visit.objects.create(**visit_data)
-            visits_created.append(visit.id)
-        results = Visit.objects.filter(id__in=visits_created)
-        output_serializer = VisitSerializer(results, many=True)
-        data = output_serializer.data[:]
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+class VisitTimeline(BatchUpdateMixin, DeltaSyncMixin, APIView):
+    """
+    List visits across the clinic in visit_date order, or update many
+    visits
+
+    ?since= (inclusive) and ?until= (exclusive) take ISO 8601 dates or
+    datetimes; dates mean midnight in the current time zone. Pages are
+    keyset paginated on (visit_date, id). ?modified_since= returns an
+    unpaginated delta instead.
+    """
+    queryset = Visit.objects.all()
+    serializer_class = VisitSerializer
+    batch_related = { 'pet': Pet }
+    pagination_class = VisitTimelinePagination
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachingJWTAuthentication]
+
+    def get_bound(self, request, name):
+        value = request.query_params.get(name)
+        if value is None:
+            return None
+        return parse_timestamp(value, name)
+
+    def get(self, request, format=None):
+        visits = self.queryset.all()
+        since = self.get_bound(request, 'since')
+        if since is not None:
+            visits = visits.filter(visit_date__gte=since)
+        until = self.get_bound(request, 'until')
+        if until is not None:
+            visits = visits.filter(visit_date__lt=until)
+        since = self.get_modified_since(request)
+        if since is not None:
+            return self.delta_response(FastVisitSerializer.values(visits), FastVisitSerializer, since)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(FastVisitSerializer.values(visits), request, view=self)
+        return paginator.get_paginated_response(FastVisitSerializer(page, many=True).data)
+
+class VisitBulkCreate(APIView):
+    """
+    Create visits for many pets from newline delimited JSON (or a JSON list)
+
+    Lines are validated and inserted batch_size at a time, each batch in
+    its own transaction. Invalid lines are reported by line number and do
+    not prevent the valid lines of their batch from being created.
+    """
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachingJWTAuthentication]
+    parser_classes = [NDJSONParser, JSONParser]
+
+    batch_size = 1000
+    max_batch_size = 10000
+
+    def get_batch_size(self, request):
+        try:
+            batch_size = int(request.query_params.get('batch_size', self.batch_size))
+        except ValueError:
+            return self.batch_size
+        return max(1, min(batch_size, self.max_batch_size))
+
+    def post(self, request, format=None):
+        lines = request.data
+        if isinstance(lines, list):
+            lines = enumerate(lines, 1)
+        elif not hasattr(lines, '__next__'):
+            data = { 'message': 'Expected newline delimited JSON or a list of visits' }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        batch_size = self.get_batch_size(request)
+        created = 0
+        errors = []
+        while True:
+            batch = list(islice(lines, batch_size))
+            if not batch:
+                break
+            created += self.create_batch(batch, errors)
+        data = { 'created': created, 'errors': errors }
+        if errors:
+            return Response(data, status=status.HTTP_207_MULTI_STATUS)
         return Response(data, status=status.HTTP_201_CREATED)
 
-class PetDetail(APIView):
+    def create_batch(self, batch, errors):
+        items = []
+        line_numbers = []
+        for line_number, visit_data in batch:
+            if isinstance(visit_data, ParseError):
+                errors.append({ 'line': line_number, 'errors': { 'non_field_errors': [visit_data.detail] } })
+            else:
+                items.append(visit_data)
+                line_numbers.append(line_number)
+        pet_ids = pk_list(item.get('pet') for item in items if isinstance(item, dict))
+        context = { 'request': self.request, 'related_objects': { Pet: Pet.objects.in_bulk(pet_ids) } }
+        serializer = VisitSerializer(data=items, many=True, context=context)
+        if not serializer.is_valid():
+            valid = []
+            for line_number, item, item_errors in zip(line_numbers, items, serializer.errors):
+                if item_errors:
+                    errors.append({ 'line': line_number, 'errors': item_errors })
+                else:
+                    valid.append(item)
+            serializer = VisitSerializer(data=valid, many=True, context=context)
+            serializer.is_valid(raise_exception=True)
+        return len(serializer.save())
+
+class PetList(BatchUpdateMixin, APIView):
+    """
+    Update many pets; pets are listed per owner
+    """
+    queryset = Pet.objects.prefetch_related('visits')
+    serializer_class = PetSerializer
+    batch_related = { 'owner': Owner, 'pet_type': PetType }
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachingJWTAuthentication]
+
+class PetDetail(PurgeMixin, ConditionalGetMixin, SparseFieldsetViewMixin, APIView):
     """
     Retrieval, update or delete a pet
     """
+    queryset = Pet.objects.prefetch_related('visits')
+    serializer_class = PetSerializer
+    related_validators = ('visits',)
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachingJWTAuthentication]
 
     def get_object(self, pk):
         try:
-            return Pet.objects.get(pk=pk)
+            return self.plan_queryset(self.queryset).get(pk=pk)
         except Pet.DoesNotExist:
             raise Http404
 
+    @conditional_get
     def get(self, request, pk, format=None):
         pet = self.get_object(pk)
-        serializer = PetSerializer(pet)
+        serializer = PetSerializer(pet, context={ 'request': request })
         return Response(serializer.data)
 
     def put(self, request, pk, format=None):
@@ -354,24 +565,22 @@ class PetDetail(APIView):
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    def delete(self, request, pk, format=None):
-        pet = self.get_object(pk)
-        pet.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
 
-class VisitDetail(APIView):
+class VisitDetail(ConditionalGetMixin, APIView):
     """
     Retrieve, update or delete visit by pk
     """
+    queryset = Visit.objects.all()
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachingJWTAuthentication]
         
     def get_object(self, pk):
         try:
-            return Visit.objects.get(pk=pk)
+            return self.queryset.get(pk=pk)
         except Visit.DoesNotExist:
             raise Http404
 
+    @conditional_get
     def get(self, request, pk, format=None):
         visit = self.get_object(pk)
         serializer = VisitSerializer(visit)
@@ -389,3 +598,51 @@ class VisitDetail(APIView):
         visit = self.get_object(pk)
         visit.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+
+class ClinicStats(APIView):
+    """
+    Dashboard statistics read from the summary tables
+    """
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachingJWTAuthentication]
+
+    def get(self, request, format=None):
+        visits = (PetTypeVisitStat.objects.filter(visit_count__gt=0)
+                  .order_by('month', 'pet_type__name').values_list('pet_type__name', 'month', 'visit_count'))
+        owners = OwnerPetStat.objects.filter(owner_count__gt=0).order_by('pet_count')
+        vets = (SpecialtyVetStat.objects.filter(vet_count__gt=0)
+                .order_by('specialty__name').values_list('specialty__name', 'vet_count'))
+        return Response({
+            'visits_per_pet_type_per_month': [
+                { 'pet_type': pet_type, 'month': month.strftime('%Y-%m'), 'visits': count }
+                for pet_type, month, count in visits
+            ],
+            'pets_per_owner': [
+                { 'pets': stat.pet_count, 'owners': stat.owner_count } for stat in owners
+            ],
+            'vets_per_specialty': [
+                { 'specialty': specialty, 'vets': count } for specialty, count in vets
+            ],
+        })
+
+class DatabasePoolStats(APIView):
+    """
+    Report connection pool statistics for this process
+    """
+    permission_classes = [IsAdminUser]
+    authentication_classes = [CachingJWTAuthentication]
+
+    def get(self, request, format=None):
+        return Response({ 'pools': pool_stats() })
+
+class Metrics(APIView):
+    """
+    Request metrics of every worker process in the Prometheus text format
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request, format=None):
+        return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')